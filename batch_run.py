@@ -0,0 +1,282 @@
+# batch_run.py
+import os
+import re
+import sys
+import json
+import time
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# 导入核心模块
+from core.scraper import Scraper
+from core.captcha import CaptchaSolver
+from core.http import build_http_adapter
+from core.metrics import get_metrics, write_metrics_report
+from core.ratelimit import RateLimiter
+from core.session_cache import SessionCache
+from core.response_cache import ResponseCache
+from core.week_range import WeekRangeDetector
+from core.ical_generator import create_calendar_file, is_calendar_up_to_date, write_empty_calendar, STATE_DEFAULT_FILENAME
+from core.state_store import open_state_store, state_file_suffix
+from core.pipeline import (
+    load_provider, resolve_academic_semester, fetch_semester_responses,
+    parse_semester_responses, semester_fingerprint,
+)
+
+
+def load_accounts(path):
+    """
+    读取批量账号文件（YAML）。支持两种写法：
+    accounts:
+      - account: "3120000001"
+        password: "..."
+        output_filename: "可选，自定义输出文件名"
+    或直接写成上述 accounts 列表本身。
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or []
+    if isinstance(data, dict):
+        data = data.get("accounts") or []
+    accounts = []
+    for index, item in enumerate(data, 1):
+        if not isinstance(item, dict) or not item.get("account") or not item.get("password"):
+            print(f"[警告] 账号文件第 {index} 项缺少 account 或 password，已跳过。")
+            continue
+        accounts.append(item)
+    return accounts
+
+
+def _safe_file_stem(account):
+    return re.sub(r"[^A-Za-z0-9_-]", "_", str(account)) or "account"
+
+
+def _per_account_path(output_dir, stem, configured):
+    if not configured:
+        return None
+    return os.path.join(output_dir, f"{stem}_{os.path.basename(configured)}")
+
+
+def export_account(entry, config, provider_config, academic_year_semester, shared, output_dir):
+    """为单个账号完成登录、抓取与日历生成，返回该账号的结果摘要。"""
+    account = str(entry["account"])
+    stem = _safe_file_stem(account)
+    output_filename = os.path.join(output_dir, entry.get("output_filename") or f"{stem}.ics")
+    state_file = config.get("state_file") or STATE_DEFAULT_FILENAME
+    state_path = os.path.join(output_dir, f"{stem}_state{state_file_suffix(state_file)}")
+    # 变更记录与增量 ICS 按账号派生文件名，例如 <学号>_changes.jsonl
+    change_feed_path = _per_account_path(output_dir, stem, config.get("change_feed_file"))
+    delta_filename = _per_account_path(output_dir, stem, config.get("delta_ics_file"))
+    block_cache_path = _per_account_path(output_dir, stem, config.get("ics_block_cache_file"))
+    result = {
+        "account": account,
+        "status": "error",
+        "events": 0,
+        "failed_weeks": [],
+        "cached_weeks": [],
+        "output_filename": output_filename,
+        "state_path": state_path,
+        "duration_seconds": 0.0,
+        "message": "",
+    }
+    started_at = time.monotonic()
+    try:
+        # 每个账号使用独立的会话（Cookie 隔离），但共享 OCR 模型、连接池与限速器
+        scraper = Scraper(
+            provider_config,
+            rate_limiter=shared["rate_limiter"],
+            http_adapter=shared["http_adapter"],
+            session_cache=shared["session_cache"],
+            captcha_solver=shared["captcha_solver"],
+        )
+        print(f"[{account}] 开始登录...")
+        if not scraper.login(account, str(entry["password"])):
+            result["status"] = "login_failed"
+            result["message"] = "登录失败"
+            return result
+
+        total_weeks = config["total_semester_weeks"]
+        max_workers = max(1, int(config.get("fetch_concurrency", 1) or 1))
+        with get_metrics().span("run_stage", stage="fetch"):
+            weekly_responses, cached_weeks = fetch_semester_responses(
+                scraper, academic_year_semester, range(1, total_weeks + 1), max_workers=max_workers,
+                response_cache=shared["response_cache"], account=account, force_refresh=shared["force_refresh"],
+                week_range=shared["week_range"],
+            )
+        result["cached_weeks"] = cached_weeks
+
+        # 输入与上次生成时完全一致时跳过解析与生成
+        fingerprint = semester_fingerprint(
+            weekly_responses, provider_config["class_time_map"], config["timezone"],
+            recurrence=bool(config.get("ics_recurrence", False)),
+        )
+        state_store = open_state_store(state_path, compact=bool(config.get("state_compact", False)))
+        if is_calendar_up_to_date(output_filename, state_store, fingerprint):
+            result["status"] = "unchanged"
+            if delta_filename:
+                write_empty_calendar(delta_filename, config["timezone"])
+            result["message"] = "输入与上次生成时一致，已跳过"
+            result["failed_weeks"] = [week for week, text in weekly_responses.items() if text is None]
+            return result
+
+        with get_metrics().span("run_stage", stage="parse"):
+            events, failed_weeks = parse_semester_responses(
+                weekly_responses, quiet=bool(config.get("quiet_parsing", False))
+            )
+        result["events"] = len(events)
+        result["failed_weeks"] = failed_weeks
+        if not events:
+            result["status"] = "no_events"
+            result["message"] = "未能获取到任何有效的课程信息"
+            return result
+
+        with get_metrics().span("run_stage", stage="ics"):
+            create_calendar_file(
+                events,
+                provider_config["class_time_map"],
+                config["timezone"],
+                output_filename,
+                state_path=state_store,
+                input_fingerprint=fingerprint,
+                streaming=config.get("ics_writer") == "stream",
+                recurrence=bool(config.get("ics_recurrence", False)),
+                change_feed_path=change_feed_path,
+                delta_filename=delta_filename,
+                block_cache=block_cache_path,
+            )
+        result["status"] = "partial" if failed_weeks else "ok"
+    except Exception as e:
+        result["status"] = "error"
+        result["message"] = str(e)
+    finally:
+        result["duration_seconds"] = round(time.monotonic() - started_at, 3)
+        print(f"[{account}] 处理结束，状态: {result['status']}")
+    return result
+
+
+def build_shared_resources(config, provider_config, pool_size):
+    """构建所有账号共享的资源；pool_size 为预期的最大并发请求数（并发账号数 × 每个账号的并发周次数）。"""
+    return {
+        "rate_limiter": RateLimiter.from_config(config.get("rate_limit"), provider_config),
+        # 验证码识别线程池与各预处理版本的接受率统计在账号间共享；
+        # OCR 模型由 Scraper 在第一次需要识别验证码时加载，进程内只加载一次
+        "captcha_solver": CaptchaSolver.from_config(config.get("captcha")),
+        # 所有会话共用一个连接池，池大小与总并发数匹配
+        "http_adapter": build_http_adapter(config.get("http"), pool_size=pool_size),
+        "session_cache": SessionCache.from_config(config.get("session_cache")),
+        "response_cache": ResponseCache.from_config(config.get("response_cache")),
+        "force_refresh": bool((config.get("response_cache") or {}).get("force_refresh"))
+                         or os.environ.get("FORCE_REFRESH") == "1",
+        # 各账号的教学周范围按账号分别缓存在同一个文件中
+        "week_range": WeekRangeDetector.from_config(config.get("week_range")),
+    }
+
+
+def export_accounts(accounts, config, provider_config, academic_year_semester, output_dir, max_accounts):
+    """
+    最多 max_accounts 个账号并发导出，返回 (汇总报告, HttpMetrics)。
+    汇总报告即 batch_summary.json 的内容，各账号的结果按账号文件中的顺序排列。
+    """
+    max_workers = max(1, int(config.get("fetch_concurrency", 1) or 1))
+    shared = build_shared_resources(config, provider_config, pool_size=max_accounts * max_workers)
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"--- 开始批量导出 {len(accounts)} 个账号（最大并发账号数 {max_accounts}）---")
+    started_at = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_accounts) as executor:
+        futures = [
+            executor.submit(export_account, entry, config, provider_config, academic_year_semester, shared, output_dir)
+            for entry in accounts
+        ]
+        results = [future.result() for future in futures]
+    shared["http_adapter"].close()
+
+    return {
+        "academic_year_semester": academic_year_semester,
+        "total_accounts": len(results),
+        "succeeded": sum(1 for r in results if r["status"] in ("ok", "partial", "unchanged")),
+        "failed": sum(1 for r in results if r["status"] not in ("ok", "partial", "unchanged")),
+        "duration_seconds": round(time.monotonic() - started_at, 3),
+        "http": shared["http_adapter"].metrics.summary(),
+        "metrics": get_metrics().summary(),
+        "accounts": results,
+    }, shared["http_adapter"].metrics
+
+
+def main():
+    # 加载.env文件中的环境变量（如果存在）
+    load_dotenv()
+
+    # 加载配置文件
+    try:
+        with open("config.yml", "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+    except FileNotFoundError:
+        print("错误：未找到 config.yml 配置文件。")
+        sys.exit(1)
+    except yaml.YAMLError as e:
+        print(f"错误：config.yml 配置文件格式有误: {e}")
+        sys.exit(1)
+
+    batch_config = config.get("batch") or {}
+    accounts_file = sys.argv[1] if len(sys.argv) > 1 else batch_config.get("accounts_file", "accounts.yml")
+    output_dir = batch_config.get("output_dir", "batch_output")
+    max_accounts = max(1, int(batch_config.get("max_concurrent_accounts", 4) or 1))
+    summary_filename = batch_config.get("summary_filename", "batch_summary.json")
+
+    # --- 1. 加载学校适配器 ---
+    provider_name = config["provider"]
+    try:
+        provider_config = load_provider(provider_name)
+        print(f"已加载适配器: {provider_config['name']}")
+    except (ImportError, AttributeError) as e:
+        print(f"错误：无法加载名为 '{provider_name}' 的适配器。请检查 providers 目录和配置。详细信息: {e}")
+        sys.exit(1)
+
+    # --- 2. 读取账号列表 ---
+    try:
+        accounts = load_accounts(accounts_file)
+    except FileNotFoundError:
+        print(f"错误：未找到账号文件 {os.path.abspath(accounts_file)}。")
+        sys.exit(1)
+    except yaml.YAMLError as e:
+        print(f"错误：账号文件格式有误: {e}")
+        sys.exit(1)
+    if not accounts:
+        print("错误：账号文件中没有有效的账号。")
+        sys.exit(1)
+
+    academic_year_semester, is_auto = resolve_academic_semester(config)
+    if is_auto:
+        print(f"检测到学期设置为自动，已计算当前学期为: {academic_year_semester}")
+
+    # --- 3. 并发处理各账号（共享限速器、验证码识别、连接池与缓存） ---
+    summary, http_metrics = export_accounts(
+        accounts, config, provider_config, academic_year_semester, output_dir, max_accounts,
+    )
+    results = summary["accounts"]
+
+    # --- 4. 汇总报告 ---
+    summary_path = os.path.join(output_dir, summary_filename)
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    print(f"\n--- 批量导出完成 ---")
+    for r in results:
+        line = f"  {r['account']}: {r['status']} | 事件 {r['events']} | 耗时 {r['duration_seconds']}s"
+        if r["failed_weeks"]:
+            line += f" | 失败周次 {r['failed_weeks']}"
+        if r["cached_weeks"]:
+            line += f" | 缓存周次 {r['cached_weeks']}"
+        if r["message"]:
+            line += f" | {r['message']}"
+        print(line)
+    http_metrics.print_summary()
+    write_metrics_report(config.get("metrics"), http_metrics)
+    print(f"成功 {summary['succeeded']} / 失败 {summary['failed']}，总耗时 {summary['duration_seconds']}s")
+    print(f"汇总报告已保存至: {os.path.abspath(summary_path)}")
+    if summary["failed"]:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# benchmarks/bench_captcha.py
+"""
+验证码识别离线基准：在标注语料上运行与登录时相同的预处理 + ddddocr 流程，
+报告整体准确率、各预处理版本的命中率与单张耗时，无需访问教务系统。
+
+语料格式：一个目录，图片文件名以 4 位验证码标注开头，如 'a3kx.jpg' 或 'a3kx_20250901-080000.jpg'。
+- config.yml 中设置 captcha.corpus_dir 后，登录时被服务器接受的验证码会自动按此格式保存；
+- debug_captchas/ 中识别失败的样本人工核对后，在文件名前加上 '<验证码>_' 即可加入语料。
+
+用法（在项目根目录执行）：
+    python -m benchmarks.bench_captcha --corpus captcha_corpus [--workers 1] [--stats .captcha_stats.json]
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from core.captcha import (
+    CaptchaImage, CaptchaSolver, SolvedCaptchaCache, VariantStats,
+    DEFAULT_VARIANT_ORDER, get_shared_ocr, load_captcha_corpus, normalize_ocr_text,
+)
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _format_latency(values):
+    return f"{statistics.mean(values) * 1000:>8.1f}{_percentile(values, 0.5) * 1000:>8.1f}{_percentile(values, 0.95) * 1000:>8.1f}"
+
+
+def _evaluate_variants(ocr, samples):
+    """对每张图片运行所有预处理版本，返回 {版本: (命中数, 4位结果数, 耗时列表)}。"""
+    results = {label: [0, 0, []] for label in DEFAULT_VARIANT_ORDER}
+    for expected, image_bytes in samples:
+        image = CaptchaImage(image_bytes)
+        for label in DEFAULT_VARIANT_ORDER:
+            started = time.perf_counter()
+            candidate = image.variant(label)
+            code = normalize_ocr_text(ocr.classification(candidate)) if candidate is not None else ""
+            results[label][2].append(time.perf_counter() - started)
+            results[label][0] += code == expected
+            results[label][1] += len(code) == len(expected)
+    return results
+
+
+def _evaluate_solver(solver, ocr, samples):
+    """按登录时的流程识别每张图片，返回 (正确数, 忽略大小写正确数, 耗时列表, 命中版本计数)。"""
+    correct = correct_ignore_case = 0
+    latencies = []
+    winners = {}
+    for expected, image_bytes in samples:
+        started = time.perf_counter()
+        code, label, _ = solver.solve(ocr, image_bytes)
+        latencies.append(time.perf_counter() - started)
+        correct += code == expected
+        correct_ignore_case += (code or "").lower() == expected.lower()
+        winners[label or "-"] = winners.get(label or "-", 0) + 1
+    return correct, correct_ignore_case, latencies, winners
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="验证码识别离线基准")
+    arg_parser.add_argument("--corpus", default="captcha_corpus", help="标注验证码语料目录")
+    arg_parser.add_argument("--workers", type=int, default=1, help="CaptchaSolver 的并发识别数")
+    arg_parser.add_argument("--stats", default=None, help="使用该识别统计文件决定尝试顺序（只读）")
+    args = arg_parser.parse_args()
+
+    try:
+        labeled, unlabeled = load_captcha_corpus(args.corpus)
+    except FileNotFoundError:
+        labeled, unlabeled = [], 0
+    if not labeled:
+        print(f"语料目录 {args.corpus} 中没有已标注的验证码图片，格式说明见本文件开头。")
+        sys.exit(1)
+    samples = []
+    for expected, path in labeled:
+        with open(path, "rb") as f:
+            samples.append((expected, f.read()))
+
+    ocr = get_shared_ocr()
+    stats = VariantStats(args.stats)
+    # 只读取统计决定顺序，不把基准结果写回统计文件
+    stats.path = None
+    solver = CaptchaSolver(workers=args.workers, stats=stats)
+    # 预热：第一次推理包含 ONNX 会话的初始化开销
+    solver.solve(ocr, samples[0][1])
+
+    print(f"\n语料: {args.corpus}，已标注 {len(samples)} 张，未标注 {unlabeled} 张")
+    print(f"尝试顺序: {' > '.join(stats.order())}，workers={args.workers}")
+
+    correct, correct_ignore_case, latencies, winners = _evaluate_solver(solver, ocr, samples)
+    print(f"\n整体准确率: {correct / len(samples):.1%}（忽略大小写 {correct_ignore_case / len(samples):.1%}）")
+    print(f"{'':<22}{'mean':>8}{'p50':>8}{'p95':>8}  (ms/张)")
+    print(f"{'solver':<22}{_format_latency(latencies)}")
+    print("得到结果的版本: " + ", ".join(f"{label}={count}" for label, count in sorted(winners.items())))
+
+    cache = SolvedCaptchaCache()
+    for expected, image_bytes in samples:
+        cache.put(CaptchaImage(image_bytes).content_hash(), expected)
+    cached_solver = CaptchaSolver(workers=args.workers, stats=stats, cache=cache)
+    _, _, cached_latencies, cached_winners = _evaluate_solver(cached_solver, ocr, samples)
+    print(f"{'solver (缓存命中)':<18}{_format_latency(cached_latencies)}"
+          f"  命中 {cached_winners.get('cache', 0)}/{len(samples)}，不同哈希 {len(cache)}")
+
+    print(f"\n{'variant':<22}{'mean':>8}{'p50':>8}{'p95':>8}{'hit':>9}{'4-char':>9}")
+    for label, (hits, four_char, variant_latencies) in _evaluate_variants(ocr, samples).items():
+        print(f"{label:<22}{_format_latency(variant_latencies)}{hits / len(samples):>9.1%}{four_char / len(samples):>9.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# benchmarks/bench_e2e.py
+"""
+端到端基准：针对本机的教务系统替身（benchmarks/fake_gdut.py），以与 batch_run.py 相同的流程
+（登录 → 并发获取周课表 → 解析 → 生成 ICS 与 state）批量导出 1/20/500 个账号，
+报告吞吐量、各阶段耗时（来自 core.metrics）与内存峰值，用于离线发现 Scraper、
+parse_schedule_data 与 create_calendar_file 的性能回退。
+
+每个规模在独立的子进程中运行（内存峰值互不影响），替身服务器运行在父进程中。
+
+用法（在项目根目录执行）：
+    python -m benchmarks.bench_e2e [--accounts 1,20,500] [--latency 0.02] [--payload mixed]
+                                   [--login sso] [--multi-week] [--week-range] [--save result.json] [--compare baseline.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 报告中展示的阶段（core.metrics 中的 span 名称）
+REPORTED_SPANS = ("login", "fetch_week", "fetch_multi_week", "parse_week", "ics_build", "ics_write", "state_save")
+
+
+def _peak_rss_mib():
+    try:
+        import resource
+    except ImportError:  # Windows 上没有 resource 模块
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KiB 为单位，macOS 以字节为单位
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _span_totals(spans):
+    """把同名 span 的各标签合并为 {名称: {count, mean_ms, max_ms}}。"""
+    totals = {}
+    for name, entries in spans.items():
+        count = sum(entry["count"] for entry in entries)
+        totals[name] = {
+            "count": count,
+            "mean_ms": round(sum(entry["total_ms"] for entry in entries) / count, 2),
+            "max_ms": max(entry["max_ms"] for entry in entries),
+        }
+    return totals
+
+
+def run_scenario(params):
+    """在子进程中执行：导出 params["accounts"] 个账号，返回结果字典。"""
+    import tempfile
+
+    from batch_run import export_accounts
+    from benchmarks.fake_gdut import fake_provider_config
+
+    baseline_rss = _peak_rss_mib()
+    config = {
+        "total_semester_weeks": params["weeks"],
+        "fetch_concurrency": params["fetch_concurrency"],
+        "timezone": "Asia/Shanghai",
+        "quiet_parsing": True,
+        "ics_writer": params["ics_writer"],
+        "ics_recurrence": params["recurrence"],
+        "rate_limit": {"requests_per_second": params["rps"], "burst": params["rps"]},
+        "captcha": {},
+        # 教学周范围缓存只保存在内存中，每个规模都从头识别
+        "week_range": {"enabled": params["week_range"], "cache_file": ""},
+    }
+    accounts = [{"account": f"31{index:08d}", "password": "benchmark"} for index in range(params["accounts"])]
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 验证码失败样本等相对路径文件写入临时目录
+        os.chdir(work_dir)
+        started = time.perf_counter()
+        with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+            summary, _ = export_accounts(
+                accounts, config, fake_provider_config(params["base_url"], params["login"], params["multi_week"]), "202501",
+                os.path.join(work_dir, "out"), params["concurrent_accounts"],
+            )
+        elapsed = time.perf_counter() - started
+
+    return {
+        "accounts": params["accounts"],
+        "succeeded": summary["succeeded"],
+        "elapsed_s": round(elapsed, 3),
+        "accounts_per_s": round(params["accounts"] / elapsed, 2),
+        "weeks_per_s": round(params["accounts"] * params["weeks"] / elapsed, 1),
+        "requests": sum(entry["requests"] for entry in summary["http"].values()),
+        "baseline_rss_mib": baseline_rss,
+        "peak_rss_mib": _peak_rss_mib(),
+        "spans": _span_totals(summary["metrics"]["spans"]),
+    }
+
+
+def _run_child(params):
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_e2e", "--child", json.dumps(params, ensure_ascii=False)],
+        cwd=PROJECT_ROOT, capture_output=True, text=True,
+    )
+    if output.returncode != 0:
+        raise RuntimeError(f"基准子进程失败:\n{output.stderr}")
+    # ddddocr 加载时会打印欢迎信息，结果在最后一行
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def _print_results(results):
+    print(f"\n{'accounts':>8}{'ok':>6}{'elapsed s':>11}{'acct/s':>9}{'weeks/s':>9}{'requests':>10}{'rss MiB':>9}")
+    for r in results:
+        print(f"{r['accounts']:>8}{r['succeeded']:>6}{r['elapsed_s']:>11.2f}{r['accounts_per_s']:>9.2f}"
+              f"{r['weeks_per_s']:>9.1f}{r['requests']:>10}{r['peak_rss_mib'] or 0:>9.1f}")
+    print(f"\n各阶段耗时（毫秒，平均 / 最大）")
+    print(f"{'accounts':>8}" + "".join(f"{name:>20}" for name in REPORTED_SPANS))
+    for r in results:
+        cells = []
+        for name in REPORTED_SPANS:
+            span = r["spans"].get(name)
+            cells.append(f"{span['mean_ms']:.1f} / {span['max_ms']:.0f}" if span else "-")
+        print(f"{r['accounts']:>8}" + "".join(f"{cell:>20}" for cell in cells))
+
+
+def _compare(results, baseline_path, tolerance):
+    """与基线结果对比，吞吐量下降或阶段平均耗时上升超过 tolerance 时返回回退项列表。"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {entry["accounts"]: entry for entry in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        base = baseline.get(r["accounts"])
+        if not base:
+            continue
+        if r["accounts_per_s"] < base["accounts_per_s"] * (1 - tolerance):
+            regressions.append(f"{r['accounts']} 个账号: 吞吐量 {base['accounts_per_s']} -> {r['accounts_per_s']} 账号/秒")
+        for name in REPORTED_SPANS:
+            old, new = base["spans"].get(name), r["spans"].get(name)
+            # 1 毫秒以内的阶段受计时抖动影响较大，不参与比较
+            if old and new and old["mean_ms"] >= 1 and new["mean_ms"] > old["mean_ms"] * (1 + tolerance):
+                regressions.append(f"{r['accounts']} 个账号: {name} 平均 {old['mean_ms']} -> {new['mean_ms']} ms")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="端到端批量导出基准（本机教务系统替身）")
+    arg_parser.add_argument("--accounts", default="1,20,500", help="逗号分隔的账号数量，每个数量运行一次")
+    arg_parser.add_argument("--latency", type=float, default=0.02, help="替身服务器每个请求的模拟耗时（秒）")
+    arg_parser.add_argument("--payload", choices=("raw", "html", "mixed"), default="mixed", help="课表响应格式")
+    arg_parser.add_argument("--login", choices=("sso", "legacy"), default="sso", help="登录链路（legacy 需要 ddddocr）")
+    arg_parser.add_argument("--multi-week", action="store_true", help="替身提供并声明多周课表接口（一次请求覆盖所有周次）")
+    arg_parser.add_argument("--week-range", action="store_true", help="启用教学周范围识别（week_range），跳过学期末的空周")
+    arg_parser.add_argument("--weeks", type=int, default=20, help="每个账号获取的周数")
+    arg_parser.add_argument("--concurrent-accounts", type=int, default=4, help="并发处理的账号数")
+    arg_parser.add_argument("--fetch-concurrency", type=int, default=4, help="每个账号并发获取的周数")
+    arg_parser.add_argument("--rps", type=float, default=1000.0, help="每主机每秒请求数上限（默认实际上不限速）")
+    arg_parser.add_argument("--ics-writer", choices=("stream", "icalendar"), default="icalendar")
+    arg_parser.add_argument("--recurrence", action="store_true", help="启用 RRULE 合并（ics_recurrence）")
+    arg_parser.add_argument("--save", default=None, help="将结果保存为 JSON，可作为之后 --compare 的基线")
+    arg_parser.add_argument("--compare", default=None, help="与基线 JSON 对比，发现回退时以状态码 1 退出")
+    arg_parser.add_argument("--tolerance", type=float, default=0.2, help="允许的相对变化（默认 20%%）")
+    arg_parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_scenario(json.loads(args.child))))
+        return
+
+    from benchmarks.fake_gdut import FakeGdutServer
+
+    counts = [int(value) for value in args.accounts.split(",") if value.strip()]
+    with FakeGdutServer(latency=args.latency, payload=args.payload, login_mode=args.login,
+                        multi_week=args.multi_week) as server:
+        print(f"替身服务器: {server.base_url}，每请求 {args.latency * 1000:.0f} ms，响应格式 {args.payload}，登录 {args.login}"
+              f"{'，多周接口' if args.multi_week else ''}")
+        results = []
+        for count in counts:
+            print(f"  正在导出 {count} 个账号...", flush=True)
+            results.append(_run_child({
+                "accounts": count,
+                "weeks": args.weeks,
+                "concurrent_accounts": args.concurrent_accounts,
+                "fetch_concurrency": args.fetch_concurrency,
+                "rps": args.rps,
+                "ics_writer": args.ics_writer,
+                "recurrence": args.recurrence,
+                "base_url": server.base_url,
+                "login": args.login,
+                "multi_week": args.multi_week,
+                "week_range": args.week_range,
+            }))
+
+    _print_results(results)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存至: {os.path.abspath(args.save)}")
+    if args.compare:
+        regressions = _compare(results, args.compare, args.tolerance)
+        if regressions:
+            print(f"\n发现性能回退（超过 {args.tolerance:.0%}）:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\n与基线 {args.compare} 相比未发现超过 {args.tolerance:.0%} 的回退。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# benchmarks/bench_ics_writer.py
+"""
+ICS 生成基准：对比 icalendar.Calendar 整体序列化、流式写入（core.ics_writer）
+与启用 VEVENT 缓存（事件均未变化）时的耗时和峰值内存，并校验各方式输出的字节完全一致。
+
+用法（在项目根目录执行）：
+    python -m benchmarks.bench_ics_writer [--events 5000]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+import pytz
+from icalendar import Calendar, Event
+
+from core import ical_generator
+from core.ics_writer import build_component, serialize_component, CALENDAR_CANONICAL_ORDER, EVENT_CANONICAL_ORDER
+from core.models import CourseEvent
+from providers.gdut import GDUT_PROVIDER
+
+TIMEZONE = "Asia/Shanghai"
+PERIODS = ["0102", "0304", "0506", "0708", "0910", "010203", "1112"]
+# 覆盖转义（逗号/分号/反斜杠/换行）、多字节字符折行与长文本
+NAMES = [
+    "高等数学A(上)",
+    "大学英语, 听说; 读写",
+    "C\\C++ 程序设计\\",
+    "面向对象程序设计（Java）课程设计与综合实践——跨学院联合开课实验班专用长名称",
+    "Linear Algebra\nSection 2",
+]
+
+
+def _synthetic_events(count):
+    start = date(2025, 9, 1)
+    events = []
+    for i in range(count):
+        day = start + timedelta(days=i // 5 % 140)
+        events.append(CourseEvent(
+            name=f"{NAMES[i % len(NAMES)]} #{i // 700}",
+            teacher=f"教师{i % 37}" if i % 11 else "",
+            location=f"教{i % 5 + 1}-{100 + i % 300}" if i % 13 else None,
+            periods=PERIODS[i % len(PERIODS)],
+            date=day.isoformat(),
+        ))
+    return events
+
+
+def _check_serializer():
+    """在属性层面校验流式序列化与 icalendar 一致，覆盖取消事件使用的固定偏移时区与 UTC 时间。"""
+    tz = pytz.timezone(TIMEZONE)
+    fixed = dt_timezone(timedelta(hours=8))
+    now = datetime(2026, 1, 2, 3, 4, 5, 678, tzinfo=pytz.UTC)
+    calendar_props = [('PRODID', '-//Universal Course Calendar//github.com//'), ('VERSION', '2.0'),
+                      ('CALSCALE', 'GREGORIAN'), ('X-WR-CALNAME', 'GDUT 课程表, 测试'), ('X-WR-TIMEZONE', TIMEZONE)]
+    cases = []
+    for i, name in enumerate(NAMES):
+        cases.append([
+            ('UID', f"case-{i}@gdut-course-exporter"),
+            ('SUMMARY', name * (i + 1)),
+            ('DTSTART', tz.localize(datetime(2025, 9, 1 + i, 8, 30))),
+            ('DTEND', tz.localize(datetime(2025, 9, 1 + i, 10, 5))),
+            ('LOCATION', f"教{i}-101 ^ 教师\\{name}"),
+            ('DESCRIPTION', f"教师: {name}_节次: 0102" + "，" * i * 20),
+            ('DTSTAMP', now),
+            ('LAST-MODIFIED', datetime(2025, 1, 1, tzinfo=dt_timezone.utc)),
+            ('SEQUENCE', i),
+        ])
+        cases.append([
+            ('UID', f"cancel-{i}@gdut-course-exporter"),
+            ('SUMMARY', name),
+            ('DTSTART', datetime(2025, 9, 10, 9, 50, tzinfo=fixed)),
+            ('DTEND', datetime(2025, 9, 10, 11, 25, tzinfo=fixed)),
+            ('STATUS', 'CANCELLED'),
+            ('DTSTAMP', now),
+            ('LAST-MODIFIED', now),
+            ('SEQUENCE', i + 1),
+            ('DESCRIPTION', '该课程已被移除 / CANCELLED'),
+        ])
+    # 每周重复系列：RRULE、EXDATE 与 RECURRENCE-ID 覆盖
+    series_start = tz.localize(datetime(2025, 9, 1, 8, 30))
+    cases.append([
+        ('UID', "weekly-case@gdut-course-exporter"), ('SUMMARY', NAMES[0]),
+        ('DTSTART', series_start), ('DTEND', series_start + timedelta(minutes=95)),
+        ('DTSTAMP', now), ('SEQUENCE', 2),
+        ('RRULE', {'FREQ': 'WEEKLY', 'COUNT': 18}),
+        ('EXDATE', [series_start + timedelta(weeks=w) for w in (3, 7, 11, 12, 13, 14, 15)]),
+    ])
+    cases.append([
+        ('UID', "weekly-case@gdut-course-exporter"), ('SUMMARY', NAMES[0]),
+        ('DTSTART', series_start + timedelta(weeks=5)), ('DTEND', series_start + timedelta(weeks=5, minutes=95)),
+        ('LOCATION', '临时教室'), ('DTSTAMP', now), ('SEQUENCE', 2),
+        ('RECURRENCE-ID', series_start + timedelta(weeks=5)),
+    ])
+    cal = build_component(Calendar, calendar_props)
+    for props in cases:
+        cal.add_component(build_component(Event, props))
+    header = serialize_component("VCALENDAR", calendar_props, CALENDAR_CANONICAL_ORDER)
+    streamed = header[: -len("END:VCALENDAR\r\n")]
+    streamed += "".join(serialize_component("VEVENT", props, EVENT_CANONICAL_ORDER) for props in cases)
+    streamed += "END:VCALENDAR\r\n"
+    assert cal.to_ical() == streamed.encode("utf-8"), "流式序列化与 icalendar 输出不一致"
+
+
+def _run(events, workdir, state_template, streaming, cache_template=None):
+    """以同一份 state（及 VEVENT 缓存）运行一次生成，返回 (耗时秒, 峰值内存 MiB, 输出字节)。"""
+    state_path = os.path.join(workdir, "state.json")
+    output_path = os.path.join(workdir, "out.ics")
+    shutil.copyfile(state_template, state_path)
+    block_cache = None
+    if cache_template:
+        block_cache = os.path.join(workdir, "blocks.json")
+        shutil.copyfile(cache_template, block_cache)
+    tracemalloc.start()
+    started = time.perf_counter()
+    ical_generator.create_calendar_file(
+        events, GDUT_PROVIDER["class_time_map"], TIMEZONE, output_path,
+        state_path=state_path, streaming=streaming, block_cache=block_cache,
+    )
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    tracemalloc.stop()
+    with open(output_path, "rb") as f:
+        return elapsed, peak, f.read()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="ICS 生成基准")
+    arg_parser.add_argument("--events", type=int, default=5000, help="合成事件数量")
+    args = arg_parser.parse_args()
+
+    _check_serializer()
+    events = _synthetic_events(args.events)
+    with tempfile.TemporaryDirectory() as workdir:
+        # 先生成一次 state，使两次对比运行的 DTSTAMP/LAST-MODIFIED 均取自 state，输出可逐字节比较
+        state_template = os.path.join(workdir, "template.json")
+        cache_template = os.path.join(workdir, "template_blocks.json")
+        ical_generator.create_calendar_file(
+            events, GDUT_PROVIDER["class_time_map"], TIMEZONE, os.path.join(workdir, "seed.ics"),
+            state_path=state_template, streaming=True, block_cache=cache_template,
+        )
+        results = {}
+        for label, streaming, cache in (("calendar", False, None), ("stream", True, None), ("cached", True, cache_template)):
+            results[label] = _run(events, workdir, state_template, streaming, cache)
+
+    assert results["calendar"][2] == results["stream"][2] == results["cached"][2], "各写入方式的输出不一致"
+    print(f"\n事件数: {args.events}，输出大小: {len(results['stream'][2]) / 1024:.0f} KiB（各方式逐字节一致）")
+    print(f"{'writer':<10}{'time (s)':>10}{'peak (MiB)':>12}")
+    for label, (elapsed, peak, _) in results.items():
+        print(f"{label:<10}{elapsed:>10.2f}{peak:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# benchmarks/bench_parser.py
+"""
+课表响应解码的微基准：对比旧路径（json.loads 失败后构建 BeautifulSoup DOM）
+与当前的快速路径（按内容选择解析方式、正则定位 <p>、可选 orjson）。
+
+用法（在项目根目录执行）：
+    python -m benchmarks.bench_parser [--number 2000]
+"""
+import argparse
+import json
+import os
+import timeit
+
+from bs4 import BeautifulSoup
+
+from core import parser
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def _load_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def legacy_decode(response_text):
+    """旧版 parse_schedule_data 的解码逻辑（去掉日志输出），作为对照组。"""
+    try:
+        return json.loads(response_text)
+    except json.JSONDecodeError:
+        soup = BeautifulSoup(response_text, 'lxml')
+        p_tag = soup.find('p')
+        if p_tag:
+            return json.loads(p_tag.get_text(strip=True))
+        return None
+
+
+def fast_decode(response_text):
+    return parser._decode_schedule_payload(response_text, quiet=True)
+
+
+def _bench(func, payload, number):
+    # 取多次重复中的最小值，减少调度抖动的影响
+    best = min(timeit.repeat(lambda: func(payload), number=number, repeat=5))
+    return best / number * 1e6
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="课表响应解码微基准")
+    arg_parser.add_argument("--number", type=int, default=2000, help="每轮重复调用次数")
+    args = arg_parser.parse_args()
+
+    payloads = {
+        "raw_json": _load_fixture("week_raw.json"),
+        "html_wrapped": _load_fixture("week_wrapped.html"),
+    }
+    print(f"JSON 解码器: {'orjson' if parser.orjson is not None else 'json (标准库)'}")
+    print(f"{'payload':<14}{'legacy (us)':>14}{'fast (us)':>14}{'speedup':>10}")
+    for name, payload in payloads.items():
+        # 两条路径的解码结果必须一致
+        assert legacy_decode(payload) == fast_decode(payload), name
+        legacy_us = _bench(legacy_decode, payload, args.number)
+        fast_us = _bench(fast_decode, payload, args.number)
+        print(f"{name:<14}{legacy_us:>14.1f}{fast_us:>14.1f}{legacy_us / fast_us:>9.1f}x")
+
+    # 端到端解析（含事件构建），静默模式下不产生日志
+    for name, payload in payloads.items():
+        per_call = _bench(lambda text: parser.parse_schedule_data(text, quiet=True), payload, args.number)
+        print(f"parse_schedule_data[{name}] (quiet): {per_call:.1f} us/次")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/bench_startup.py
+"""
+启动耗时基准：在全新的解释器中测量从导入 core.scraper 到发出第一个请求的时间
+（time-to-first-request），对比启动时立即加载 ddddocr 模型（旧行为）与按需加载。
+第一个请求发往本机的临时 HTTP 服务，不访问教务系统。
+
+用法（在项目根目录执行）：
+    python -m benchmarks.bench_startup [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在子进程中执行；eager 模式在构造 Scraper 时立即加载模型，与旧版 Scraper.__init__ 的行为一致
+CHILD_SCRIPT = r"""
+import json, sys, time
+started = time.perf_counter()
+from core.scraper import Scraper
+from core.captcha import get_shared_ocr
+imported = time.perf_counter()
+provider = {"base_url": sys.argv[1]}
+scraper = Scraper(provider)
+if sys.argv[2] == "eager":
+    get_shared_ocr()
+constructed = time.perf_counter()
+scraper._request("GET", provider["base_url"] + "/", timeout=5)
+finished = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "construct": constructed - imported,
+    "first_request": finished - started,
+    "ddddocr_loaded": "ddddocr" in sys.modules,
+}))
+"""
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _run_child(base_url, mode):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, base_url, mode],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    ).stdout
+    # ddddocr 加载时会打印欢迎信息，结果在最后一行
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="启动耗时基准")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="每种模式运行的次数（取中位数）")
+    args = arg_parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        # 预热一次，让两种模式都使用已缓存的字节码与磁盘缓存
+        _run_child(base_url, "eager")
+        results = {}
+        for mode in ("eager", "lazy"):
+            runs = [_run_child(base_url, mode) for _ in range(args.repeat)]
+            results[mode] = runs
+    finally:
+        server.shutdown()
+
+    print(f"\n每种模式运行 {args.repeat} 次，取中位数（毫秒）")
+    print(f"{'mode':<8}{'import':>10}{'construct':>12}{'first request':>16}  ddddocr loaded")
+    for mode, runs in results.items():
+        medians = {key: statistics.median(run[key] for run in runs) * 1000 for key in ("import", "construct", "first_request")}
+        print(f"{mode:<8}{medians['import']:>10.1f}{medians['construct']:>12.1f}{medians['first_request']:>16.1f}  {runs[0]['ddddocr_loaded']}")
+
+
+if __name__ == "__main__":
+    main()
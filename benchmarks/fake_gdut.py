@@ -0,0 +1,286 @@
+# benchmarks/fake_gdut.py
+"""
+本机运行的教务系统替身，供基准测试离线使用（不访问 jxfw/authserver）。
+实现 Scraper 用到的全部接口：
+- SSO：/authserver/login（含 pwdEncryptSalt 的登录页与表单提交）、checkNeedCaptcha.htl、/new/ssoLogin 票据跳转；
+- 旧教务登录：/yzm 验证码图片、/new/login；
+- /login!welcome.action 与 xsgrkbcx!getKbRq.action 周课表接口（课程取自 fixtures/week_raw.json）；
+- multi_week=True 时另外提供多周课表接口 xsgrkbcx!getKbList.action（zc 为逗号分隔的周次）。
+每个请求按 latency 秒模拟服务端耗时；课表响应可选原始 JSON、<p> 包裹的 HTML 或两者按周交替。
+账号以 'bad' 开头时登录失败；旧教务登录接受任意 4 位验证码（识别准确率见 bench_captcha）。
+"""
+import gzip
+import io
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from providers.gdut import GDUT_PROVIDER
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "week_raw.json")
+PAYLOAD_MODES = ("raw", "html", "mixed")
+MULTI_WEEK_ENDPOINT = "xsgrkbcx!getKbList.action?xnxqdm={xnxqdm}&zc={weeks}"
+
+SSO_LOGIN_PAGE = """<!DOCTYPE html><html><head><meta charset="utf-8"><title>统一身份认证</title>
+<script>var captchaSwitch = "1";</script></head><body>
+<form id="pwdFromId" method="post" action="/authserver/login">
+<input id="username" name="username" value=""/>
+<input id="password" type="password" name="passwordText" value=""/>
+<input type="hidden" id="saltPassword" name="password" value=""/>
+<input type="hidden" name="captcha" value=""/>
+<input type="hidden" name="_eventId" value="submit"/>
+<input type="hidden" name="cllt" value="userNameLogin"/>
+<input type="hidden" name="dllt" value="generalLogin"/>
+<input type="hidden" name="lt" value=""/>
+<input type="hidden" id="pwdEncryptSalt" value="{salt}"/>
+<input type="hidden" id="execution" name="execution" value="{execution}"/>
+<input type="checkbox" name="rememberMe" value="true"/>
+</form></body></html>"""
+SSO_ERROR_PAGE = """<!DOCTYPE html><html><body><form id="pwdFromId"></form>
+<span id="showErrorTip"><span>您提供的用户名或者密码有误</span></span></body></html>"""
+LEGACY_LOGIN_PAGE = "<!DOCTYPE html><html><body><img src=\"/yzm?d=1\"/></body></html>"
+WELCOME_PAGE = "<!DOCTYPE html><html><head><title>教学管理系统</title></head><body>欢迎使用</body></html>"
+ILLEGAL_ACCESS_PAGE = "<!DOCTYPE html><html><body>非法访问！</body></html>"
+
+
+def fake_provider_config(base_url, login_mode="sso", multi_week=False):
+    """
+    返回指向替身服务器的 GDUT 适配器配置（不限速，由基准自行配置 rate_limit）。
+    multi_week=True 时声明替身的多周课表接口。
+    """
+    config = dict(GDUT_PROVIDER)
+    config.update(
+        base_url=base_url,
+        sso_login_url=f"{base_url}/authserver/login" if login_mode == "sso" else None,
+        sso_service_url=f"{base_url}/new/ssoLogin",
+        rate_limits={},
+    )
+    if multi_week:
+        config["schedule_endpoints"] = dict(
+            GDUT_PROVIDER["schedule_endpoints"], multi_week={"url": MULTI_WEEK_ENDPOINT, "max_weeks": 0},
+        )
+    return config
+
+
+def _captcha_image(text, seed):
+    """生成与教务系统验证码尺寸相近的 JPEG 图片。"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    rng = random.Random(seed)
+    image = Image.new("RGB", (90, 32), (rng.randint(200, 255),) * 3)
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.truetype("DejaVuSans-Bold.ttf", 22)
+    except OSError:
+        font = ImageFont.load_default()
+    for index, char in enumerate(text):
+        draw.text((6 + index * 20 + rng.randint(-2, 2), 3 + rng.randint(-2, 2)), char,
+                  fill=(rng.randint(0, 120),) * 3, font=font)
+    for _ in range(4):
+        draw.line([(rng.randint(0, 90), rng.randint(0, 32)), (rng.randint(0, 90), rng.randint(0, 32))],
+                  fill=(rng.randint(80, 180),) * 3)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+class FakeGdutHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=b"", headers=(), content_type="text/html; charset=utf-8"):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        if self.server.compress and len(body) > 256 and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=5)
+            headers = list(headers) + [("Content-Encoding", "gzip")]
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _redirect(self, location, headers=()):
+        self._reply(302, headers=[("Location", location)] + list(headers))
+
+    def _has_session(self):
+        for part in self.headers.get("Cookie", "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == "JSESSIONID" and self.server.is_session(value):
+                return True
+        return False
+
+    def _new_session_cookie(self):
+        return ("Set-Cookie", f"JSESSIONID={self.server.new_session()}; Path=/; HttpOnly")
+
+    def _read_form(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode("utf-8")).items()}
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        server.count(url.path)
+        if server.latency:
+            time.sleep(server.latency)
+
+        if url.path == "/":
+            if server.login_mode == "sso":
+                return self._redirect(f"{server.base_url}/authserver/login?service={server.base_url}/new/ssoLogin")
+            return self._reply(200, LEGACY_LOGIN_PAGE)
+        if url.path == "/authserver/login":
+            return self._reply(200, SSO_LOGIN_PAGE.format(salt="rjBFAaHsNkKAhpoi", execution=uuid.uuid4().hex))
+        if url.path == "/authserver/checkNeedCaptcha.htl":
+            return self._reply(200, '{"isNeed":false}', content_type="application/json")
+        if url.path == "/new/ssoLogin":
+            if not query.get("ticket"):
+                return self._redirect(f"{server.base_url}/")
+            return self._redirect(f"{server.base_url}/login!welcome.action", headers=[self._new_session_cookie()])
+        if url.path == "/login!welcome.action":
+            if self._has_session():
+                return self._reply(200, WELCOME_PAGE)
+            return self._redirect(f"{server.base_url}/")
+        if url.path == "/yzm":
+            return self._reply(200, server.captcha_image(), content_type="image/jpeg")
+        if url.path == "/xsgrkbcx!getKbRq.action":
+            if not self._has_session():
+                return self._reply(200, ILLEGAL_ACCESS_PAGE)
+            return self._reply(200, server.week_payload(int(query.get("zc", 1))))
+        if url.path == "/xsgrkbcx!getKbList.action" and server.multi_week:
+            if not self._has_session():
+                return self._reply(200, ILLEGAL_ACCESS_PAGE)
+            weeks = [int(week) for week in query.get("zc", "").split(",") if week.strip()]
+            return self._reply(200, server.multi_week_payload(weeks or [1]))
+        self._reply(404, "Not Found")
+
+    def do_POST(self):
+        server = self.server
+        path = urlsplit(self.path).path
+        form = self._read_form()
+        server.count(path)
+        if server.latency:
+            time.sleep(server.latency)
+
+        if path == "/authserver/login":
+            if form.get("username", "").startswith("bad") or not form.get("password"):
+                return self._reply(200, SSO_ERROR_PAGE)
+            return self._redirect(f"{server.base_url}/new/ssoLogin?ticket=ST-{uuid.uuid4().hex}")
+        if path == "/new/login":
+            if form.get("account", "").startswith("bad"):
+                return self._reply(200, '{"code":-1,"message":"用户名或密码错误"}', content_type="application/json")
+            if len(form.get("verifycode", "")) != 4:
+                return self._reply(200, '{"code":-3,"message":"验证码错误"}', content_type="application/json")
+            return self._reply(200, '{"code":0,"message":"登录成功"}', headers=[self._new_session_cookie()],
+                               content_type="application/json")
+        self._reply(404, "Not Found")
+
+
+class FakeGdutServer(ThreadingHTTPServer):
+    """
+    教务系统替身服务器，在后台线程中运行：
+
+        with FakeGdutServer(latency=0.02) as server:
+            provider_config = server.provider_config()
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.02, payload="mixed", login_mode="sso", teaching_weeks=16,
+                 semester_start=date(2025, 9, 1), compress=True, multi_week=False, port=0):
+        if payload not in PAYLOAD_MODES:
+            raise ValueError(f"payload 必须是 {PAYLOAD_MODES} 之一")
+        if login_mode not in ("sso", "legacy"):
+            raise ValueError("login_mode 必须是 'sso' 或 'legacy'")
+        super().__init__(("127.0.0.1", port), FakeGdutHandler)
+        self.latency = latency
+        self.payload = payload
+        self.login_mode = login_mode
+        self.teaching_weeks = teaching_weeks
+        self.semester_start = semester_start
+        self.compress = compress
+        self.multi_week = multi_week
+        with open(FIXTURE_PATH, "r", encoding="utf-8") as f:
+            self._courses = json.load(f)[0]
+        self._sessions = set()
+        self._captchas = [_captcha_image(f"{index:02d}ab"[:4], index) for index in range(8)]
+        self._requests = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def provider_config(self):
+        return fake_provider_config(self.base_url, self.login_mode, self.multi_week)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, path):
+        with self._lock:
+            self._requests[path] = self._requests.get(path, 0) + 1
+
+    def request_counts(self):
+        with self._lock:
+            return dict(self._requests)
+
+    def new_session(self):
+        session_id = uuid.uuid4().hex.upper()
+        with self._lock:
+            self._sessions.add(session_id)
+        return session_id
+
+    def is_session(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
+
+    def captcha_image(self):
+        return random.choice(self._captchas)
+
+    def _week_dates(self, week):
+        monday = self.semester_start + timedelta(weeks=week - 1)
+        return [{"xqmc": str(day + 1), "rq": (monday + timedelta(days=day)).isoformat()} for day in range(7)]
+
+    def _week_courses(self, week):
+        return [dict(course, zc=str(week)) for course in self._courses] if week <= self.teaching_weeks else []
+
+    def _wrap_payload(self, body, wrap_html):
+        if wrap_html:
+            return ('<html><head><meta http-equiv="Content-Type" content="text/html; charset=UTF-8"></head>'
+                    f"<body><p>{body}</p></body></html>")
+        return body
+
+    def week_payload(self, week):
+        """第 week 周的课表响应：[课程列表, 日期映射]，教学周之后的周次没有课程。"""
+        body = json.dumps([self._week_courses(week), self._week_dates(week)], ensure_ascii=False)
+        return self._wrap_payload(body, self.payload == "html" or (self.payload == "mixed" and week % 2 == 0))
+
+    def multi_week_payload(self, weeks):
+        """多周课表响应：weeks 各周的课程（zc 为所在周次）与第一周的日期映射。"""
+        courses = [course for week in weeks for course in self._week_courses(week)]
+        body = json.dumps([courses, self._week_dates(weeks[0])], ensure_ascii=False)
+        return self._wrap_payload(body, self.payload == "html")
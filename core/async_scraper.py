@@ -0,0 +1,555 @@
+# core/async_scraper.py
+import asyncio
+import ssl
+import time
+from urllib.parse import urlsplit
+
+try:
+    import httpx
+except ImportError:  # 可选依赖：仅在 config.yml 中选择 scraper: async 时需要
+    httpx = None
+
+from core.http import DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_MAXSIZE, KEEPALIVE_SOCKET_OPTIONS
+from core.metrics import get_metrics
+from core.ratelimit import RETRYABLE_STATUS_CODES, THROTTLE_STATUS_CODES, parse_retry_after
+from core.scraper import ScraperBase, IDEMPOTENT_METHODS, SESSION_INVALID_MARKERS
+
+_metrics = get_metrics()
+
+
+def _require_httpx():
+    if httpx is None:
+        raise ImportError("异步模式需要安装 httpx：pip install httpx")
+
+
+def _is_ssl_error(error):
+    """沿异常链查找 ssl.SSLError，httpx 会把证书错误包装为 ConnectError。"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, ssl.SSLError):
+            return True
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def create_async_transport(options=None, pool_size=None, verify=True):
+    """
+    根据 config.yml 的 http 段构造可在多个 AsyncScraper 间共享的 httpx 连接池，
+    与同步版本的 build_http_adapter 对应：单主机连接数取 http.pool_maxsize 与并发请求数中的较大者。
+    """
+    _require_httpx()
+    options = options or {}
+    per_host = max(int(options.get("pool_maxsize", DEFAULT_POOL_MAXSIZE)), int(pool_size or 1))
+    # httpx 只限制连接总数，按同时访问的主机数放大
+    max_connections = per_host * int(options.get("pool_connections", DEFAULT_POOL_CONNECTIONS))
+    return httpx.AsyncHTTPTransport(
+        verify=verify,
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        socket_options=KEEPALIVE_SOCKET_OPTIONS if options.get("tcp_keepalive", True) else None,
+    )
+
+
+class AsyncScraper(ScraperBase):
+    """
+    基于 httpx.AsyncClient 的异步版 Scraper：登录（SSO 与旧教务验证码链路）与课表获取的流程、
+    日志和返回值都与 Scraper 相同，只是方法均为协程。多个实例可在同一个事件循环中并发运行：
+    - transport: 共享的 httpx.AsyncHTTPTransport（连接池），Cookie 仍保存在各自的 AsyncClient 中；
+    - request_semaphore: 共享的 asyncio.Semaphore，限制所有实例同时进行中的请求数；
+    - executor: 运行验证码 OCR、登录页解析与密码加密等 CPU 密集步骤的线程池，默认使用事件循环的默认线程池。
+    请求节奏同样由 rate_limiter 按主机控制，等待与退避均使用 asyncio.sleep，不会阻塞其他账号。
+    """
+
+    def __init__(self, provider_config, rate_limiter=None, ocr=None, transport=None, session_cache=None,
+                 captcha_solver=None, request_semaphore=None, executor=None, metrics=None, http_options=None):
+        _require_httpx()
+        super().__init__(provider_config, rate_limiter, ocr, session_cache, captcha_solver)
+        self._http_options = http_options or {}
+        # 自行创建的连接池在 aclose() 时关闭；共享的连接池由创建方关闭
+        self._owned_transports = []
+        if transport is None:
+            transport = create_async_transport(self._http_options, verify=not self._ssl_verification_disabled)
+            self._owned_transports.append(transport)
+        self.client = self._new_client(transport)
+        self.request_semaphore = request_semaphore
+        self.executor = executor
+        self.metrics = metrics
+
+    def _new_client(self, transport, cookies=None):
+        headers = dict(self.headers)
+        if not self._http_options.get("compression", True):
+            headers["Accept-Encoding"] = "identity"
+        return httpx.AsyncClient(transport=transport, headers=headers, cookies=cookies)
+
+    async def aclose(self):
+        for transport in self._owned_transports:
+            await transport.aclose()
+        self._owned_transports = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def _cookie_jar(self):
+        return self.client.cookies.jar
+
+    def _disable_ssl_verification(self):
+        # httpx 的证书校验在连接池上设置，改用一个不校验证书的新连接池并保留 Cookie
+        self._ssl_verification_disabled = True
+        transport = create_async_transport(self._http_options, verify=False)
+        self._owned_transports.append(transport)
+        self.client = self._new_client(transport, cookies=self.client.cookies)
+
+    async def _run_blocking(self, func, *args):
+        """在线程池中运行 CPU 密集或阻塞的函数。"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def _send_once(self, method, url, allow_redirects, kwargs):
+        phases = {}
+        marks = {}
+
+        async def trace(event, info):
+            # 记录新建连接（TCP，含 DNS 解析）、TLS 握手与首字节时间；复用连接时没有前两项
+            now = time.perf_counter()
+            name, _, stage = event.rpartition(".")
+            if stage == "started":
+                marks[name] = now
+            elif stage == "complete":
+                if name in ("connection.connect_tcp", "connection.start_tls") and name in marks:
+                    phases[name] = phases.get(name, 0.0) + now - marks[name]
+                elif name == "http11.receive_response_headers" and "http11.send_request_headers" in marks:
+                    phases["ttfb"] = phases.get("ttfb", 0.0) + now - marks["http11.send_request_headers"]
+
+        started = time.perf_counter()
+        response = await self.client.request(
+            method, url, follow_redirects=allow_redirects, extensions={"trace": trace}, **kwargs
+        )
+        if self.metrics is not None:
+            timing = {
+                "dns": None,
+                "connect": phases.get("connection.connect_tcp"),
+                "tls": phases.get("connection.start_tls"),
+                "ttfb": phases.get("ttfb"),
+            }
+            self.metrics.record(
+                urlsplit(str(response.url)).netloc, timing, time.perf_counter() - started,
+                response.num_bytes_downloaded, len(response.content),
+            )
+        return response
+
+    async def _send(self, method, url, allow_redirects=True, **kwargs):
+        """发送单个请求，并在允许时对证书问题做一次不校验证书的回退。"""
+        try:
+            return await self._send_once(method, url, allow_redirects, kwargs)
+        except httpx.ConnectError as e:
+            if not _is_ssl_error(e):
+                raise
+            if self.provider_config.get("allow_insecure_ssl_fallback", False) and not self._ssl_verification_disabled:
+                self._disable_ssl_verification()
+                print("检测到证书校验失败，已回退为不校验证书继续访问。")
+                return await self._send_once(method, url, allow_redirects, kwargs)
+            raise
+
+    async def _request(self, method, url, **kwargs):
+        """
+        与 Scraper._request 相同：按主机限速，幂等请求遇到 5xx/超时/连接错误时
+        按带抖动的指数退避自动重试，并遵守服务端返回的 Retry-After。
+        """
+        limiter = self.rate_limiter
+        retries = limiter.max_retries if method.upper() in IDEMPOTENT_METHODS else 0
+        for attempt in range(retries + 1):
+            wait = limiter.reserve(url)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                if self.request_semaphore is not None:
+                    async with self.request_semaphore:
+                        response = await self._send(method, url, **kwargs)
+                else:
+                    response = await self._send(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if _is_ssl_error(e) or attempt >= retries:
+                    raise
+                _metrics.increment("http_retries", reason=type(e).__name__)
+                delay = limiter.backoff_delay(attempt)
+                await asyncio.sleep(delay)
+                print(f"  请求失败（{type(e).__name__}），已等待{delay:.1f}秒后重试...")
+                continue
+
+            _metrics.increment("http_responses", status=response.status_code)
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if response.status_code in THROTTLE_STATUS_CODES:
+                    limiter.record_throttle(url, retry_after)
+                if attempt < retries:
+                    _metrics.increment("http_retries", reason=str(response.status_code))
+                    delay = limiter.backoff_delay(attempt, retry_after)
+                    await asyncio.sleep(delay)
+                    print(f"  服务端返回 HTTP {response.status_code}，已等待{delay:.1f}秒后重试...")
+                    continue
+                return response
+
+            limiter.record_success(url)
+            return response
+
+    async def _wait_before_retry(self, attempt, action, indent="  "):
+        """按退避策略等待后再进行下一次尝试。attempt 从 1 开始。"""
+        delay = self.rate_limiter.backoff_delay(attempt - 1)
+        print(f"{indent}等待{delay:.1f}秒后{action}...")
+        await asyncio.sleep(delay)
+
+    async def _probe_login_environment(self):
+        """检测当前学校站点主入口和脚本使用的旧登录链路是否一致。"""
+        if self._environment_checked:
+            return
+
+        self._environment_checked = True
+        try:
+            with _metrics.span("login_step", step="probe"):
+                response = await self._request("GET", self.base_url, timeout=10, allow_redirects=False)
+            location = response.headers.get("Location", "")
+            if response.is_redirect and "authserver" in location:
+                self._note_sso_redirect(location)
+        except httpx.HTTPError as e:
+            print(f"登录环境探测失败，跳过主入口检查: {e}")
+
+    async def _check_sso_captcha_requirement(self, account):
+        if not self._sso_login_url:
+            return False, ""
+
+        auth_base = self._sso_login_url.rsplit("/", 1)[0]
+        check_url = f"{auth_base}/checkNeedCaptcha.htl"
+        try:
+            with _metrics.span("login_step", step="sso_captcha_check"):
+                response = await self._request("GET", check_url, params={"username": account}, timeout=10)
+            response.raise_for_status()
+            response_json = response.json()
+            return bool(response_json.get("isNeed")), ""
+        except Exception as e:
+            return False, f"验证码需求探测失败: {e}"
+
+    async def _follow_sso_success_redirect(self, redirect_url):
+        try:
+            with _metrics.span("login_step", step="sso_redirect"):
+                final_response = await self._request("GET", redirect_url, timeout=20, allow_redirects=True)
+            print(f"  SSO 跳转完成，当前页面: {final_response.url}")
+            if self._is_jxfw_url(str(final_response.url)):
+                return True
+            print("  SSO 登录后未进入教务系统目标页。")
+            return False
+        except httpx.HTTPError as e:
+            print(f"  跟进 SSO 登录跳转失败: {e}")
+            return False
+
+    async def _login_via_sso(self, account, password):
+        sso_login_url = self._build_sso_login_url()
+        if not sso_login_url:
+            print("未配置 SSO 登录地址，无法执行 SSO 登录。")
+            return False
+
+        print("正在尝试通过统一身份认证（SSO）登录...")
+        try:
+            with _metrics.span("login_step", step="sso_page"):
+                login_page_response = await self._request("GET", sso_login_url, timeout=20)
+            login_page_response.raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"  获取 SSO 登录页失败: {e}")
+            return False
+
+        login_html = login_page_response.text
+        soup, pwd_form = await self._run_blocking(self._parse_sso_login_page, login_html)
+        if not pwd_form:
+            print("  未在 SSO 登录页找到用户名密码登录表单。")
+            return False
+
+        need_captcha, captcha_probe_error = await self._check_sso_captcha_requirement(account)
+        if captcha_probe_error:
+            print(f"  {captcha_probe_error}")
+
+        captcha_switch = self._extract_script_var(login_html, "captchaSwitch")
+        if need_captcha:
+            print("  当前账号在 SSO 侧被要求先通过验证码校验。")
+            if captcha_switch == "2":
+                print("  当前学校启用了滑块验证码，脚本暂不支持自动完成该挑战。")
+                return False
+            print(f"  检测到验证码开关模式: {captcha_switch or 'unknown'}。")
+            print("  当前实现仅处理无需验证码的 SSO 登录场景。")
+            return False
+
+        try:
+            with _metrics.span("login_step", step="sso_encrypt"):
+                form_data = await self._run_blocking(self._build_sso_form_data, soup, pwd_form, account, password)
+        except Exception as e:
+            print(f"  组装 SSO 登录表单失败: {e}")
+            return False
+
+        try:
+            with _metrics.span("login_step", step="sso_submit"):
+                login_response = await self._request(
+                    "POST",
+                    sso_login_url,
+                    data=form_data,
+                    timeout=20,
+                    allow_redirects=False
+                )
+        except httpx.HTTPError as e:
+            print(f"  提交 SSO 登录表单失败: {e}")
+            return False
+
+        if login_response.is_redirect:
+            redirect_url = login_response.headers.get("Location", "")
+            print(f"  SSO 登录已拿到票据跳转: {redirect_url}")
+            if not redirect_url:
+                print("  SSO 登录返回了重定向，但缺少目标地址。")
+                return False
+            if await self._follow_sso_success_redirect(redirect_url):
+                print("SSO 登录成功！")
+                return True
+            return False
+
+        error_message = await self._run_blocking(self._extract_sso_error, login_response.text)
+        if error_message:
+            print(f"  SSO 登录失败: {error_message}")
+            return False
+
+        print(f"  SSO 登录失败，收到未识别响应。HTTP状态码: {login_response.status_code}")
+        print(f"  响应前200字符: {login_response.text[:200]}")
+        return False
+
+    async def _get_captcha_and_ocr(self, max_ocr_retries=3):
+        """
+        获取验证码图片并在线程池中进行OCR识别。
+        返回 (verify_code, success) 元组。
+        """
+        for ocr_attempt in range(1, max_ocr_retries + 1):
+            try:
+                print(f"    获取验证码图片 (OCR尝试 {ocr_attempt}/{max_ocr_retries})...")
+                captcha_url = f"{self.base_url}/yzm?d=1"
+                with _metrics.span("login_step", step="captcha_fetch"):
+                    captcha_response = await self._request("GET", captcha_url, timeout=10)
+                captcha_response.raise_for_status()
+                self._last_captcha_bytes = captcha_response.content
+                self._last_captcha_note = None
+                self._last_captcha_variant = None
+
+                print("    正在进行OCR识别...")
+                with _metrics.span("login_step", step="ocr"):
+                    verify_code, label, observed_results = await self._run_blocking(
+                        self._solve_captcha, captcha_response.content
+                    )
+                _metrics.increment("captcha_ocr", result="ok" if verify_code else "failed")
+                if verify_code:
+                    print(f"    OCR 识别成功 ({label}): {verify_code}")
+                    self._last_captcha_variant = label
+                    return verify_code, True
+
+                self._report_captcha_failure(observed_results)
+                if ocr_attempt < max_ocr_retries:
+                    await self._wait_before_retry(ocr_attempt, "重试OCR", indent="    ")
+            except httpx.HTTPError as e:
+                print(f"    获取验证码时网络请求失败: {e}")
+                if ocr_attempt < max_ocr_retries:
+                    await self._wait_before_retry(ocr_attempt, "重试获取验证码", indent="    ")
+            except Exception as e:
+                print(f"    验证码处理过程中发生未预期错误: {e}")
+                if ocr_attempt < max_ocr_retries:
+                    await self._wait_before_retry(ocr_attempt, "重试获取验证码", indent="    ")
+        return None, False # OCR重试次数用完仍未成功
+
+    async def is_session_valid(self):
+        """用一次轻量请求访问教务系统欢迎页，判断当前会话是否仍处于登录状态。"""
+        check_url = f"{self.base_url}/login!welcome.action"
+        try:
+            with _metrics.span("login_step", step="session_check"):
+                response = await self._request("GET", check_url, timeout=10, allow_redirects=False)
+        except httpx.HTTPError as e:
+            print(f"  会话有效性检查失败: {e}")
+            return False
+        if response.is_redirect or response.status_code != 200:
+            return False
+        text = response.text
+        return not any(marker in text for marker in SESSION_INVALID_MARKERS)
+
+    async def _restore_cached_session(self, account):
+        if not self._session_cache:
+            return False
+        snapshot = self._session_cache.load(self.base_url, account)
+        if not snapshot:
+            return False
+        print("发现已缓存的登录会话，正在验证是否仍然有效...")
+        self.restore_session_state(snapshot)
+        if await self.is_session_valid():
+            print("缓存会话有效，跳过登录流程。")
+            return True
+        print("缓存会话已失效，将重新登录。")
+        self._session_cache.invalidate(self.base_url, account)
+        self._cookie_jar().clear()
+        self._environment_checked = False
+        return False
+
+    async def login(self, account, password):
+        with _metrics.span("login"):
+            if await self._restore_cached_session(account):
+                _metrics.increment("login_result", result="cached")
+                return True
+            success = await self._login(account, password)
+        _metrics.increment("login_result", result="ok" if success else "failed")
+        if success and self._session_cache:
+            self._session_cache.save(self.base_url, account, self.export_session_state())
+        return success
+
+    async def _login(self, account, password):
+        print("正在尝试自动识别验证码登录...")
+        await self._probe_login_environment()
+        if self._use_sso_login:
+            return await self._login_via_sso(account, password)
+
+        if not self._legacy_login_allowed:
+            print("当前适配器已禁用旧教务登录链路。")
+            return False
+
+        max_login_retries = 3
+        for login_attempt in range(1, max_login_retries + 1):
+            print(f"  登录尝试 {login_attempt}/{max_login_retries}...")
+
+            # 1. 获取验证码和OCR识别
+            verify_code, ocr_success = await self._get_captcha_and_ocr()
+            if not ocr_success:
+                print(f"  第 {login_attempt} 次登录尝试：验证码OCR识别连续失败。")
+                if self._last_captcha_note:
+                    print(f"  最近失败验证码样本已保存至: {self._last_captcha_note}")
+                if login_attempt < max_login_retries:
+                    await self._wait_before_retry(login_attempt, "进行下次登录尝试")
+                continue # 重试整个登录过程（包括重新获取验证码）
+
+            # 2. 准备登录数据（密码加密在线程池中进行）
+            try:
+                login_data = await self._run_blocking(self._build_legacy_login_data, account, password, verify_code)
+            except Exception as e:
+                print(f"  加密密码时出错: {e}")
+                return False # 加密错误通常是配置或代码问题，重试无意义
+
+            # 3. 发送登录请求
+            try:
+                print("  正在提交登录请求...")
+                login_url = f"{self.base_url}/new/login"
+                with _metrics.span("login_step", step="submit"):
+                    login_response = await self._request("POST", login_url, data=login_data, timeout=10)
+                login_response.raise_for_status()
+
+                try:
+                    response_json = login_response.json()
+                except ValueError: # json.JSONDecodeError inherits from ValueError
+                    print(f"  登录响应非JSON格式，可能存在系统问题。响应内容前100字符: {login_response.text[:100]}")
+                    if login_attempt < max_login_retries:
+                        await self._wait_before_retry(login_attempt, "进行下次登录尝试")
+                    continue # 重试整个登录过程
+
+                result = self._handle_legacy_login_result(response_json, verify_code)
+                if result is not None:
+                    return result
+
+            except httpx.TimeoutException:
+                print("  登录请求超时。")
+            except httpx.TransportError:
+                print("  登录请求连接失败。")
+            except httpx.HTTPError as e:
+                print(f"  登录时发生网络错误: {e}")
+            except Exception as e:
+                print(f"  登录过程中发生未预期错误: {e}")
+
+            if login_attempt < max_login_retries:
+                await self._wait_before_retry(login_attempt, "进行下次登录尝试")
+
+        print(f"登录连续失败 {max_login_retries} 次，登录终止。")
+        return False
+
+    async def get_schedule_data(self, academic_year, week):
+        print(f"正在获取第 {week} 周的课表...")
+        started = time.perf_counter()
+        max_retries = 2
+        for attempt in range(1, max_retries + 1):
+            try:
+                main_page_url = f"{self.base_url}/login!welcome.action"
+                data_url = self._week_url(academic_year, week)
+                print(f"  获取课表数据 (尝试 {attempt}/{max_retries})...")
+                response = await self._request("GET", data_url, headers={'Referer': main_page_url}, timeout=10)
+
+                if response.status_code != 200:
+                    print(f"  获取课表数据失败，HTTP状态码: {response.status_code}")
+                    if attempt < max_retries:
+                        await self._wait_before_retry(attempt, "重试")
+                    continue # 重试
+
+                if response.text.lstrip().startswith("<!DOCTYPE") or "非法访问" in response.text:
+                    print("  课表数据接口返回了非法访问页面，而不是周课表数据。")
+                    if attempt < max_retries:
+                        await self._wait_before_retry(attempt, "重试")
+                    continue
+                print(f"  第 {week} 周课表数据获取成功。")
+                self._record_week_fetch(week, started, attempt, len(response.content))
+                return response.text
+            except httpx.TimeoutException:
+                print(f"  获取第 {week} 周数据时请求超时。")
+            except httpx.TransportError:
+                print(f"  获取第 {week} 周数据时连接失败。")
+            except httpx.HTTPError as e:
+                print(f"  获取第 {week} 周数据时发生网络错误: {e}")
+            except Exception as e:
+                print(f"  获取第 {week} 周数据时发生未预期错误: {e}")
+
+            if attempt < max_retries:
+                await self._wait_before_retry(attempt, "重试")
+
+        print(f"获取第 {week} 周课表数据连续失败 {max_retries} 次。")
+        self._record_week_fetch(week, started, max_retries, None)
+        return None
+
+    async def get_multi_week_data(self, academic_year, weeks):
+        """Scraper.get_multi_week_data 的异步版本。"""
+        print(f"正在通过多周接口获取第 {weeks[0]}-{weeks[-1]} 周的课表...")
+        started = time.perf_counter()
+        main_page_url = f"{self.base_url}/login!welcome.action"
+        try:
+            response = await self._request("GET", self._multi_week_url(academic_year, weeks),
+                                           headers={'Referer': main_page_url}, timeout=20)
+        except httpx.HTTPError as e:
+            print(f"  多周课表接口请求失败: {e}")
+            _metrics.increment("fetch_multi_week_result", result="failed")
+            return None
+        return self._accept_multi_week_response(
+            weeks, started, response.status_code, response.text, len(response.content),
+        )
+
+    async def get_schedule_data_for_weeks(self, academic_year, weeks, max_workers=1):
+        """
+        批量获取多个周次的课表数据。适配器声明了多周接口时优先用它一次覆盖多周，
+        其余周次最多 max_workers 个同时请求（asyncio.Semaphore）。
+        返回按周次升序排列的 {week: response_text}，获取失败的周次值为 None。
+        """
+        weeks = sorted(set(weeks))
+        results = {}
+        for batch in self._multi_week_batches(weeks):
+            if not self.multi_week_available():
+                break
+            results.update(await self.get_multi_week_data(academic_year, batch) or {})
+        remaining = [week for week in weeks if week not in results]
+        if results and remaining:
+            print(f"  多周接口未覆盖的 {len(remaining)} 周改为逐周获取。")
+        if max_workers > 1 and len(remaining) > 1:
+            print(f"  并发获取 {len(remaining)} 周课表数据（最大并发数 {max_workers}）...")
+        semaphore = asyncio.Semaphore(max(1, max_workers))
+
+        async def fetch(week):
+            async with semaphore:
+                try:
+                    return await self.get_schedule_data(academic_year, week)
+                except Exception as e:
+                    print(f"  获取第 {week} 周数据时发生未预期错误: {e}")
+                    return None
+
+        texts = await asyncio.gather(*(fetch(week) for week in remaining))
+        results.update(zip(remaining, texts))
+        return {week: results[week] for week in weeks}
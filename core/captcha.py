@@ -0,0 +1,378 @@
+# core/captcha.py
+import io
+import os
+import re
+import json
+import hashlib
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from PIL import Image, ImageOps
+
+from core.utils import atomic_write
+
+# 预处理版本的默认尝试顺序（没有统计数据时使用）
+DEFAULT_VARIANT_ORDER = ("raw", "autocontrast", "enlarged", "threshold", "threshold_enlarged")
+CAPTCHA_LENGTH = 4
+# 从缓存中取得结果时使用的版本名（不参与预处理版本的统计）
+CACHE_LABEL = "cache"
+# 标注语料：文件名以 4 位字母数字标注开头，后接 '_' 或扩展名，如 'a3kx.jpg'、'a3kx_20250901-080000.jpg'
+CORPUS_FILENAME_PATTERN = re.compile(r"^([A-Za-z0-9]{4})(?:_[^.]*)?\.(?:jpe?g|png|gif|bmp)$", re.IGNORECASE)
+
+_shared_ocr = None
+_shared_ocr_lock = threading.Lock()
+
+
+def get_shared_ocr():
+    """
+    返回进程内共享的 ddddocr.DdddOcr 实例，第一次调用时才导入 ddddocr 并加载识别模型。
+    走 SSO 登录或命中会话缓存时从不需要验证码识别，也就不必承担这部分启动开销。
+    """
+    global _shared_ocr
+    with _shared_ocr_lock:
+        if _shared_ocr is None:
+            # ddddocr 仍在使用 Pillow 10 中已移除的 Image.ANTIALIAS
+            if not hasattr(Image, 'ANTIALIAS'):
+                setattr(Image, 'ANTIALIAS', Image.LANCZOS)
+            import ddddocr
+            # The unsupported 'show_ad' argument has been removed below
+            _shared_ocr = ddddocr.DdddOcr()
+        return _shared_ocr
+
+
+def normalize_ocr_text(text):
+    """过滤 OCR 结果中的噪声字符，仅保留字母和数字。"""
+    if text is None:
+        return ""
+    return re.sub(r"[^A-Za-z0-9]", "", str(text)).strip()
+
+
+def is_confident(code):
+    return len(code) == CAPTCHA_LENGTH
+
+
+class CaptchaImage:
+    """
+    一张验证码及其预处理版本。各版本在第一次用到时才生成并缓存，
+    中间结果（灰度、自动对比度、放大图）在版本之间共享；可被多个线程同时访问。
+    """
+
+    def __init__(self, image_bytes):
+        self.image_bytes = image_bytes
+        self._cache = {}
+        # 版本之间有依赖（放大图依赖自动对比度），需要可重入锁
+        self._lock = threading.RLock()
+        self._decode_failed = False
+
+    def _get(self, key, build):
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = build()
+            return self._cache[key]
+
+    def _base(self):
+        return self._get("base", lambda: Image.open(io.BytesIO(self.image_bytes)).convert("L"))
+
+    def _autocontrast(self):
+        return self._get("autocontrast", lambda: ImageOps.autocontrast(self._base()))
+
+    def content_hash(self):
+        """
+        图像字节的 SHA-256（16 进制字符串），用作识别缓存的键：只有同一张验证码原样重复下发时才会命中，
+        不会因两张图像相似而误用另一张验证码的结果。
+        """
+        return self._get("content_hash", lambda: hashlib.sha256(self.image_bytes).hexdigest())
+
+    def _enlarged(self):
+        def build():
+            base = self._base()
+            return self._autocontrast().resize((base.width * 2, base.height * 2), Image.LANCZOS)
+        return self._get("enlarged", build)
+
+    def variant(self, label):
+        """
+        返回指定预处理版本，可直接交给 ddddocr 识别（原图为 bytes，其余为 PIL 灰度图，无需再编码为 PNG）。
+        图像无法解码时，除原图外的版本返回 None。
+        """
+        if label == "raw":
+            return self.image_bytes
+        if self._decode_failed:
+            return None
+        try:
+            if label == "autocontrast":
+                return self._autocontrast()
+            if label == "enlarged":
+                return self._enlarged()
+            if label == "threshold":
+                return self._get("threshold", lambda: self._autocontrast().point(lambda p: 255 if p > 150 else 0).convert("L"))
+            if label == "threshold_enlarged":
+                return self._get("threshold_enlarged", lambda: self._enlarged().point(lambda p: 255 if p > 165 else 0).convert("L"))
+        except Exception as e:
+            self._decode_failed = True
+            print(f"    验证码图像预处理失败，回退到原图OCR: {e}")
+            return None
+        raise ValueError(f"未知的验证码预处理版本: {label}")
+
+
+class VariantStats:
+    """
+    记录各预处理版本识别出的验证码被服务器接受/拒绝的次数，并据此调整尝试顺序：
+    按平滑后的接受率（(接受+1)/(接受+拒绝+2)）从高到低排列，未尝试过的版本排在中间，仍有机会被尝试。
+    path 为空时只在内存中统计。
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._counts = self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception as e:
+            print(f"[captcha] 读取识别统计失败，将重新统计: {e}")
+            return {}
+
+    def _score(self, label):
+        counts = self._counts.get(label) or {}
+        accepted = counts.get("accepted", 0)
+        rejected = counts.get("rejected", 0)
+        return (accepted + 1) / (accepted + rejected + 2)
+
+    def order(self, labels=DEFAULT_VARIANT_ORDER):
+        with self._lock:
+            return sorted(labels, key=lambda label: (-self._score(label), labels.index(label)))
+
+    def record(self, label, accepted):
+        with self._lock:
+            counts = self._counts.setdefault(label, {"accepted": 0, "rejected": 0})
+            counts["accepted" if accepted else "rejected"] += 1
+            if self.path:
+                try:
+                    atomic_write(self.path, json.dumps(self._counts, ensure_ascii=False, indent=2, sort_keys=True))
+                except Exception as e:
+                    print(f"[captcha] 写入识别统计失败: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self._counts))
+
+
+class SolvedCaptchaCache:
+    """
+    已被服务器确认的验证码识别结果，按图像字节的 SHA-256（CaptchaImage.content_hash）索引。
+    只缓存登录时被接受的结果；命中后若被服务器拒绝则立即移除。
+    最多保留 max_entries 条（淘汰最早加入的），path 为空时只在内存中缓存。
+    """
+
+    def __init__(self, path=None, max_entries=5000):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return OrderedDict()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                return OrderedDict()
+            # 旧版本按 16 位 dHash 索引的条目不再使用
+            return OrderedDict((key, code) for key, code in data.items() if len(key) == 64)
+        except Exception as e:
+            print(f"[captcha] 读取验证码缓存失败，将重新缓存: {e}")
+            return OrderedDict()
+
+    def _persist(self):
+        if self.path:
+            try:
+                atomic_write(self.path, json.dumps(self._entries, ensure_ascii=False))
+            except Exception as e:
+                print(f"[captcha] 写入验证码缓存失败: {e}")
+
+    def get(self, image_hash):
+        if image_hash is None:
+            return None
+        with self._lock:
+            return self._entries.get(image_hash)
+
+    def put(self, image_hash, code):
+        if image_hash is None or not code:
+            return
+        with self._lock:
+            if self._entries.get(image_hash) == code:
+                return
+            self._entries[image_hash] = code
+            self._entries.move_to_end(image_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._persist()
+
+    def discard(self, image_hash):
+        with self._lock:
+            if self._entries.pop(image_hash, None) is not None:
+                self._persist()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def load_captcha_corpus(directory):
+    """
+    读取标注验证码语料目录，返回 ([(标注, 文件路径), ...], 未标注文件数)。
+    标注写在文件名开头（见 CORPUS_FILENAME_PATTERN）；debug_captchas/ 中的样本人工核对后，
+    在文件名前加上 '<验证码>_' 即可加入语料。
+    """
+    samples = []
+    unlabeled = 0
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        match = CORPUS_FILENAME_PATTERN.match(name)
+        if match:
+            samples.append((match.group(1), path))
+        else:
+            unlabeled += 1
+    return samples, unlabeled
+
+
+def save_corpus_sample(directory, code, image_bytes):
+    """将服务器确认过的验证码按语料格式保存，返回文件路径。"""
+    os.makedirs(directory, exist_ok=True)
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(directory, f"{code}_{timestamp}.jpg")
+    suffix = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f"{code}_{timestamp}-{suffix}.jpg")
+        suffix += 1
+    with open(path, "wb") as f:
+        f.write(image_bytes)
+    return path
+
+
+class CaptchaSolver:
+    """
+    对一张验证码的多个预处理版本运行 OCR，得到第一个 4 位字母数字结果即停止。
+    - workers <= 1：按顺序逐个生成版本并识别；
+    - workers > 1：在共享线程池上并发识别多个版本，任一版本得到可信结果后不再提交剩余版本。
+    尝试顺序由 VariantStats 根据历史接受率自适应调整。同一个实例可在多个 Scraper 之间共享。
+    提供 cache 时，先按图像字节的 SHA-256（CaptchaImage.content_hash）查找已被服务器确认的结果，命中则跳过 OCR；
+    提供 corpus_dir 时，被服务器接受的验证码会按标注语料格式保存，供离线基准使用。
+    """
+
+    def __init__(self, workers=1, stats=None, cache=None, corpus_dir=None):
+        self.workers = max(1, int(workers or 1))
+        self.stats = stats or VariantStats()
+        self.cache = cache
+        self.corpus_dir = corpus_dir
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, options):
+        """根据 config.yml 的 captcha 段构造。"""
+        options = options or {}
+        cache = None
+        if options.get("cache_file"):
+            cache = SolvedCaptchaCache(options["cache_file"], options.get("cache_max_entries", 5000))
+        return cls(
+            workers=options.get("ocr_workers", 1),
+            stats=VariantStats(options.get("stats_file") or None),
+            cache=cache,
+            corpus_dir=options.get("corpus_dir") or None,
+        )
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="captcha-ocr")
+            return self._executor
+
+    def solve(self, ocr, image_bytes):
+        """
+        识别验证码，返回 (code, label, observed)：
+        code 为识别出的 4 位结果（失败时为 None），label 为得到该结果的预处理版本，
+        observed 为各已完成版本的 'label:原始结果->过滤后结果' 列表，便于排查。
+        """
+        image = CaptchaImage(image_bytes)
+        if self.cache is not None:
+            cached = self.cache.get(image.content_hash())
+            if cached:
+                return cached, CACHE_LABEL, [f"{CACHE_LABEL}:{cached}"]
+        order = self.stats.order()
+        if self.workers <= 1:
+            return self._solve_sequential(ocr, image, order)
+        return self._solve_concurrent(ocr, image, order)
+
+    def _solve_sequential(self, ocr, image, order):
+        observed = []
+        for label in order:
+            candidate = image.variant(label)
+            if candidate is None:
+                continue
+            raw_result = ocr.classification(candidate)
+            code = normalize_ocr_text(raw_result)
+            observed.append(f"{label}:{raw_result}->{code}")
+            if is_confident(code):
+                return code, label, observed
+        return None, None, observed
+
+    def _solve_concurrent(self, ocr, image, order):
+        def classify(label):
+            candidate = image.variant(label)
+            if candidate is None:
+                return label, None, ""
+            raw_result = ocr.classification(candidate)
+            return label, raw_result, normalize_ocr_text(raw_result)
+
+        executor = self._get_executor()
+        pending_labels = list(order)
+        running = set()
+        observed = []
+        while pending_labels or running:
+            # 最多同时提交 workers 个版本，得到可信结果后剩余版本不再提交
+            while pending_labels and len(running) < self.workers:
+                running.add(executor.submit(classify, pending_labels.pop(0)))
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                label, raw_result, code = future.result()
+                if raw_result is None:
+                    continue
+                observed.append(f"{label}:{raw_result}->{code}")
+                if is_confident(code):
+                    for other in running:
+                        other.cancel()
+                    return code, label, observed
+        return None, None, observed
+
+    def record_outcome(self, label, accepted, image_bytes=None, code=None):
+        """
+        登录请求返回后调用：记录该版本的识别结果是否被服务器接受。
+        传入 image_bytes 与 code 时，同时更新识别缓存并（按配置）保存标注样本。
+        """
+        if not label:
+            return
+        if label != CACHE_LABEL:
+            self.stats.record(label, accepted)
+        if image_bytes is None:
+            return
+        if self.cache is not None:
+            image_hash = CaptchaImage(image_bytes).content_hash()
+            if accepted:
+                self.cache.put(image_hash, code)
+            elif label == CACHE_LABEL:
+                self.cache.discard(image_hash)
+        if accepted and code and self.corpus_dir:
+            try:
+                save_corpus_sample(self.corpus_dir, code, image_bytes)
+            except OSError as e:
+                print(f"[captcha] 保存验证码样本失败: {e}")
@@ -0,0 +1,234 @@
+# core/http.py
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util import make_headers
+from urllib3.util.connection import allowed_gai_family
+
+from core.metrics import TimingStats
+
+# 每个会话会访问 SSO 认证服务器与教务系统两个主机，外加少量跳转主机
+DEFAULT_POOL_CONNECTIONS = 4
+# requests 的默认单主机连接池大小
+DEFAULT_POOL_MAXSIZE = 10
+# 开启 TCP keepalive，避免两次请求间隔较长时空闲连接被中间设备回收
+KEEPALIVE_SOCKET_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+
+
+def accept_encoding_header(compression=True):
+    """
+    返回 Accept-Encoding 请求头：gzip/deflate，以及已安装解码器时的 br（brotli）与 zstd。
+    compression=False 时要求服务器不压缩响应。
+    """
+    if not compression:
+        return "identity"
+    return make_headers(accept_encoding=True)["accept-encoding"]
+
+
+class _TimingConnectionMixin:
+    """
+    记录新建连接各阶段耗时：DNS 解析、TCP 连接、TLS 握手（秒）。
+    先自行解析主机名并计时，再按解析出的地址依次尝试连接（与 urllib3 的 create_connection 相同），
+    TLS 证书校验与 SNI 仍使用原主机名。
+    """
+
+    timing = None
+
+    def _new_conn(self):
+        host = self._dns_host
+        started = time.perf_counter()
+        try:
+            addresses = [info[4][0] for info in socket.getaddrinfo(host, self.port, allowed_gai_family(), socket.SOCK_STREAM)]
+        except socket.gaierror:
+            # 交给 urllib3 再解析一次，抛出与原实现一致的异常类型
+            return super()._new_conn()
+        resolved = time.perf_counter()
+        last_error = None
+        try:
+            for address in dict.fromkeys(addresses):
+                self._dns_host = address
+                try:
+                    sock = super()._new_conn()
+                    break
+                except ConnectTimeoutError as e:
+                    last_error = e
+            else:
+                raise last_error
+        finally:
+            self._dns_host = host
+        self._phase_times = (resolved - started, time.perf_counter() - resolved)
+        return sock
+
+    def connect(self):
+        started = time.perf_counter()
+        self._phase_times = None
+        super().connect()
+        elapsed = time.perf_counter() - started
+        dns, tcp = self._phase_times or (0.0, elapsed)
+        tls = max(0.0, elapsed - dns - tcp) if isinstance(self, HTTPSConnection) else None
+        self.timing = {"dns": dns, "connect": tcp, "tls": tls}
+
+    def pop_timing(self):
+        """取出最近一次建立连接的耗时；连接被复用时返回 None。"""
+        timing, self.timing = self.timing, None
+        return timing
+
+
+class TimingHTTPConnection(_TimingConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimingHTTPSConnection(_TimingConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimingHTTPConnection
+
+
+class TimingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimingHTTPSConnection
+
+
+class HttpMetrics:
+    """
+    按主机汇总请求耗时：新建/复用连接数、DNS、TCP 连接、TLS 握手、首字节时间（TTFB）、
+    请求总耗时，以及线上传输字节数与解压后的字节数。可在多个会话与线程间共享。
+    """
+
+    PHASES = ("dns", "connect", "tls", "ttfb", "total")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def record(self, host, timing, total, wire_bytes, body_bytes):
+        with self._lock:
+            stats = self._hosts.setdefault(host, {
+                "requests": 0, "new_connections": 0, "wire_bytes": 0, "body_bytes": 0,
+                **{phase: TimingStats() for phase in self.PHASES},
+            })
+            stats["requests"] += 1
+            stats["wire_bytes"] += wire_bytes
+            stats["body_bytes"] += body_bytes
+            if timing.get("connect") is not None:
+                stats["new_connections"] += 1
+            for phase in self.PHASES:
+                value = total if phase == "total" else timing.get(phase)
+                if value is not None:
+                    stats[phase].add(value)
+
+    def summary(self):
+        """返回 {主机: {requests, new_connections, reused_connections, wire_bytes, body_bytes, <阶段>: {count, mean_ms, p95_ms, max_ms}}}。"""
+        with self._lock:
+            result = {}
+            for host, stats in self._hosts.items():
+                entry = {
+                    "requests": stats["requests"],
+                    "new_connections": stats["new_connections"],
+                    "reused_connections": stats["requests"] - stats["new_connections"],
+                    "wire_bytes": stats["wire_bytes"],
+                    "body_bytes": stats["body_bytes"],
+                }
+                for phase in self.PHASES:
+                    timing = stats[phase]
+                    if timing.count:
+                        entry[phase] = {
+                            "count": timing.count,
+                            "mean_ms": round(timing.mean * 1000, 2),
+                            "p95_ms": round(timing.percentile(0.95) * 1000, 2),
+                            "max_ms": round(timing.max * 1000, 2),
+                        }
+                result[host] = entry
+            return result
+
+    def print_summary(self):
+        summary = self.summary()
+        if not summary:
+            return
+        print("\n[HTTP] 请求耗时统计（毫秒，平均 / p95）:")
+        for host, entry in summary.items():
+            phases = "  ".join(
+                f"{phase} {entry[phase]['mean_ms']:.0f}/{entry[phase]['p95_ms']:.0f}"
+                for phase in self.PHASES if phase in entry
+            )
+            print(f"  {host}: {entry['requests']} 个请求，新建连接 {entry['new_connections']}，复用 {entry['reused_connections']}；"
+                  f"传输 {entry['wire_bytes'] / 1024:.0f} KiB（解压后 {entry['body_bytes'] / 1024:.0f} KiB）")
+            print(f"    {phases}")
+
+
+class TimingHTTPAdapter(HTTPAdapter):
+    """
+    带连接阶段计时的 HTTPAdapter：为每个响应附加 response.timing（dns/connect/tls/ttfb，秒；
+    复用连接时 dns/connect/tls 为 None），供 HttpMetrics 汇总。
+    可在多个 requests.Session 间共享，连接池大小应与总并发请求数匹配，
+    否则超出池大小的连接在归还时会被丢弃，下次请求需要重新握手。
+    """
+
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                 tcp_keepalive=True, compression=True, metrics=None, **kwargs):
+        self.tcp_keepalive = tcp_keepalive
+        self.accept_encoding = accept_encoding_header(compression)
+        self.metrics = metrics if metrics is not None else HttpMetrics()
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize, **kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        if self.tcp_keepalive:
+            pool_kwargs.setdefault("socket_options", HTTPConnection.default_socket_options + KEEPALIVE_SOCKET_OPTIONS)
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimingHTTPConnectionPool,
+            "https": TimingHTTPSConnectionPool,
+        }
+
+    def add_headers(self, request, **kwargs):
+        request.headers["Accept-Encoding"] = self.accept_encoding
+
+    def send(self, request, **kwargs):
+        started = time.perf_counter()
+        response = super().send(request, **kwargs)
+        elapsed = time.perf_counter() - started
+        connection = getattr(response.raw, "connection", None)
+        phases = connection.pop_timing() if hasattr(connection, "pop_timing") else None
+        timing = dict(phases) if phases else {"dns": None, "connect": None, "tls": None}
+        # 从发出请求到收到响应头，扣除建立连接的时间
+        timing["ttfb"] = max(0.0, elapsed - sum(v for v in timing.values() if v))
+        response.timing = timing
+        return response
+
+    def record(self, response, total):
+        """在响应体读取完毕后调用，记录该请求（含重定向经过的各跳）的耗时与字节数。"""
+        for hop in list(response.history) + [response]:
+            timing = getattr(hop, "timing", None)
+            if timing is None:
+                continue
+            try:
+                wire_bytes = hop.raw.tell()
+            except Exception:
+                wire_bytes = 0
+            # 重定向响应体很小，以收到响应头的时间作为该跳的总耗时；最后一跳包含读取响应体的时间
+            hop_total = total - sum(h.elapsed.total_seconds() for h in response.history) if hop is response else hop.elapsed.total_seconds()
+            self.metrics.record(urlsplit(hop.url).netloc, timing, hop_total, wire_bytes, len(hop.content))
+
+
+def build_http_adapter(options=None, pool_size=None, metrics=None):
+    """
+    根据 config.yml 的 http 段构造 TimingHTTPAdapter。
+    pool_size 为预期的最大并发请求数（如 fetch_concurrency，批量模式下乘以并发账号数），
+    单主机连接池大小取其与 http.pool_maxsize 中的较大者。
+    """
+    options = options or {}
+    pool_maxsize = max(int(options.get("pool_maxsize", DEFAULT_POOL_MAXSIZE)), int(pool_size or 1))
+    return TimingHTTPAdapter(
+        pool_connections=int(options.get("pool_connections", DEFAULT_POOL_CONNECTIONS)),
+        pool_maxsize=pool_maxsize,
+        tcp_keepalive=options.get("tcp_keepalive", True),
+        compression=options.get("compression", True),
+        metrics=metrics,
+    )
@@ -1,74 +1,127 @@
 # core/ical_generator.py
-from icalendar import Calendar, Event
 from datetime import datetime
 import pytz
 import json
 import hashlib
 import os
+import time
 
-
-STATE_DEFAULT_FILENAME = "ical_state.json"
-DOMAIN_SUFFIX = "gdut-course-exporter"
-
-
-def _safe_load_state(path):
-    if not path or not os.path.exists(path):
-        return {}
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, dict):
-                return data
-            print("[state] 文件内容不是对象，忽略。")
-            return {}
-    except Exception as e:
-        print(f"[state] 读取失败，将忽略旧状态: {e}")
-        return {}
-
-
-def _safe_write_state(path, state):
-    if not path:
-        return
-    try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(state, f, ensure_ascii=False, indent=2, sort_keys=True)
-    except Exception as e:
-        print(f"[state] 写入失败: {e}")
+from core.models import CourseEvent, DOMAIN_SUFFIX
+from core.time_resolver import get_time_resolver
+from core.ics_writer import open_calendar_writer, open_block_cache, serialize_component, EVENT_CANONICAL_ORDER
+from core.state_store import open_state_store, StateLoadError
+from core.recurrence import group_weekly_series
+from core.metrics import get_metrics
 
 
-def _normalize_text(s):
-    if s is None:
-        return ""
-    return str(s).strip().replace("\n", " ")
-
+STATE_DEFAULT_FILENAME = "ical_state.json"
+DEFAULT_CALENDAR_NAME = "GDUT 课程表"
+# state 中保存运行元数据的保留键（UID 总是包含 '@'，不会与之冲突）
+STATE_META_KEY = "_meta"
+# 生成逻辑变化导致同样输入产生不同输出时递增，使旧指纹失效
+FINGERPRINT_VERSION = 2
 
-def _build_uid(event_data):
-    # 使用课程名+日期+节次 生成可读且稳定的 UID
-    name = _normalize_text(event_data.get("name"))
-    date = _normalize_text(event_data.get("date"))
-    periods = _normalize_text(event_data.get("periods"))
-    base = f"{name}-{date}-{periods}".lower()
-    # 去除空白和特殊字符
-    safe = ''.join(ch for ch in base if ch.isalnum() or ch in ('-', '_'))
-    # 确保不为空
-    if not safe:
-        safe = hashlib.sha1(base.encode('utf-8')).hexdigest()[:12]
-    return f"{safe}@{DOMAIN_SUFFIX}"
+_metrics = get_metrics()
 
 
-def _event_content_hash(fields):
+def compute_input_fingerprint(raw_inputs, class_time_map, timezone, calendar_name=DEFAULT_CALENDAR_NAME, recurrence=False):
+    """
+    计算生成日历所需全部输入的指纹：按顺序的原始课表响应、节次时间表、时区、日历名称与输出模式。
+    raw_inputs 为字符串序列，获取失败的项可以为 None。
+    """
     h = hashlib.sha256()
-    for item in fields:
-        if isinstance(item, str):
-            val = item
+    h.update(f"v{FINGERPRINT_VERSION}|{timezone}|{calendar_name}|".encode("utf-8"))
+    if recurrence:
+        # 仅在非默认模式下参与计算，保持已有指纹不变
+        h.update(b"recurrence|")
+    for period in sorted(class_time_map):
+        start, end = class_time_map[period]
+        h.update(f"{period}={start}-{end};".encode("utf-8"))
+    for item in raw_inputs:
+        if item is None:
+            h.update(b"|none")
         else:
-            val = str(item)
-        h.update(val.encode('utf-8'))
-        h.update(b"|")
+            data = item.encode("utf-8")
+            h.update(f"|{len(data)}:".encode("utf-8"))
+            h.update(data)
     return h.hexdigest()
 
 
-def create_calendar_file(events, class_time_map, timezone, filename, *, state_path=STATE_DEFAULT_FILENAME, calendar_name="GDUT 课程表"):
+def is_calendar_up_to_date(filename, state_path, fingerprint):
+    """输出文件存在且 state 中记录的输入指纹与本次一致时返回 True，此时可跳过解析与生成。"""
+    if not state_path or not fingerprint or not os.path.exists(filename):
+        return False
+    try:
+        with _metrics.span("state_load"):
+            meta = open_state_store(state_path).get(STATE_META_KEY) or {}
+    except StateLoadError as e:
+        print(f"[state] {e}")
+        return False
+    return meta.get("input_fingerprint") == fingerprint
+
+
+def _append_change_feed(path, changes, run_at):
+    """将本次运行的变更以 JSON Lines 追加到 path，同一次运行的记录共用 run_at。"""
+    run_at_iso = run_at.isoformat()
+    lines = "".join(
+        json.dumps({"run_at": run_at_iso, **change}, ensure_ascii=False) + "\n" for change in changes
+    )
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(lines)
+    except Exception as e:
+        print(f"[错误] 写入变更记录失败: {e}")
+
+
+def write_empty_calendar(filename, timezone, calendar_name=DEFAULT_CALENDAR_NAME):
+    """
+    写出不含任何事件的日历，用于本次没有变化时清空增量 ICS，避免下游重复处理上一次的变化。
+    写入失败时只输出错误并返回 False，不影响本次运行的其他结果。
+    """
+    try:
+        writer = open_calendar_writer(filename, _calendar_props(timezone, calendar_name), streaming=True)
+        writer.close()
+    except Exception as e:
+        print(f"[错误] 写入增量 ICS 文件失败: {e}")
+        return False
+    return True
+
+
+def _calendar_props(timezone, calendar_name):
+    return [
+        ('PRODID', '-//Universal Course Calendar//github.com//'),
+        ('VERSION', '2.0'),
+        ('CALSCALE', 'GREGORIAN'),
+        ('X-WR-CALNAME', calendar_name),
+        ('X-WR-TIMEZONE', timezone),
+    ]
+
+
+def _course_event_props(uid, name, teacher, location, periods_str, start, end, dtstamp, last_modified, sequence):
+    teacher = teacher or ''
+    full_location = f"{location or ''} {teacher}".strip()
+    props = [
+        ('UID', uid),
+        ('SUMMARY', name),
+        ('DTSTART', start),
+        ('DTEND', end),
+    ]
+    if full_location:
+        props.append(('LOCATION', full_location))
+    props.extend([
+        ('DESCRIPTION', f"教师: {teacher}_节次: {periods_str}"),
+        ('DTSTAMP', dtstamp),
+        ('LAST-MODIFIED', last_modified),
+        ('SEQUENCE', sequence),
+    ])
+    return props
+
+
+def create_calendar_file(events, class_time_map, timezone, filename, *, state_path=STATE_DEFAULT_FILENAME, calendar_name=DEFAULT_CALENDAR_NAME, input_fingerprint=None, streaming=False, recurrence=False,
+                         change_feed_path=None, delta_filename=None, block_cache=None):
     """
     生成日历文件 (ICS)。
 
@@ -76,14 +129,17 @@ def create_calendar_file(events, class_time_map, timezone, filename, *, state_pa
     - 稳定 UID (课程名+日期+节次)
     - DTSTAMP / LAST-MODIFIED / SEQUENCE 管理（基于本地 state 文件）
     - 仅在事件实际内容变化时递增 sequence 和 last-modified
-    - 可通过 state_path=None/False 禁用状态持久化
+    - 可通过 state_path=None/False 禁用状态持久化；state_path 也可以是 core.state_store 中的后端对象
+    - state 文件存在但无法读取时抛出 StateLoadError，ICS 与 state 文件均保持不变
+    - input_fingerprint: 本次输入的指纹（见 compute_input_fingerprint），写入 state 供下次运行判断是否可跳过
+    - streaming=True 时逐个事件直接写入文件（见 core.ics_writer），不构建完整的 Calendar 对象，输出内容相同
+    - recurrence=True 时将每周重复的课程合并为 RRULE 系列（见 core.recurrence），state 按系列 UID 记录
+    - change_feed_path: 追加写入本次新增/更新/取消事件的 JSON Lines 文件（uid、状态、新旧起止时间）
+    - delta_filename: 额外输出只包含变化事件（含取消事件）的增量 ICS 文件
+    - block_cache: VEVENT 序列化缓存文件路径或 core.ics_writer.EventBlockCache 实例（需启用 state），
+      未变化的事件直接复用上次序列化的文本，只重新序列化新增/更新/取消的事件；启用时按流式方式写入，输出内容相同
     """
-    cal = Calendar()
-    cal.add('prodid', '-//Universal Course Calendar//github.com//')
-    cal.add('version', '2.0')
-    cal.add('calscale', 'GREGORIAN')
-    cal.add('X-WR-CALNAME', calendar_name)
-    cal.add('X-WR-TIMEZONE', timezone)
+    calendar_props = _calendar_props(timezone, calendar_name)
 
     tz = pytz.timezone(timezone)
     now_utc = datetime.utcnow().replace(tzinfo=pytz.UTC)
@@ -92,174 +148,353 @@ def create_calendar_file(events, class_time_map, timezone, filename, *, state_pa
         print("没有课程事件可以生成。")
         return
 
-    # 加载 state
+    # 加载 state；读取失败时直接抛出，避免用空状态覆盖历史记录
     use_state = bool(state_path)
-    state = _safe_load_state(state_path) if use_state else {}
-    # 只收集本轮仍存在或新增的事件；删除的将在后面单独检测
-    updated_state = {}
-
-    created = 0
-    updated = 0
-    unchanged = 0
-    cancelled = 0
-
-    for event_data in events:
-        # 解析时间段
-        periods_str = event_data.get("periods", "")
-        if len(periods_str) < 2:
-            # fallback，跳过异常 period
-            print(f"[警告] 节次字段异常: {periods_str} (跳过 UID 逻辑仍尝试生成)")
-        start_period = periods_str[:2]
-        end_period = periods_str[-2:]
-        start_time_str = class_time_map.get(start_period, ("00:00", ""))[0]
-        end_time_str = class_time_map.get(end_period, ("", "00:00"))[1]
-
-        # 构造开始结束时间（本地 tz）
+    state_store = open_state_store(state_path) if use_state else None
+    if use_state:
+        with _metrics.span("state_load"):
+            stored_state = state_store.load()
+    else:
+        stored_state = {}
+    state = dict(stored_state)
+    state.pop(STATE_META_KEY, None)
+
+    # 没有 state 时每个事件的 DTSTAMP 都是本次时间，缓存无法命中
+    blocks = open_block_cache(block_cache) if use_state else None
+    if blocks is not None:
+        blocks.begin(timezone)
+        streaming = True
+
+    try:
+        writer = open_calendar_writer(filename, calendar_props, streaming)
+    except Exception as e:
+        print(f"[错误] 写入 ICS 文件失败: {e}")
+        return
+    delta_writer = None
+    if delta_filename:
+        # 增量文件无法写入时只跳过增量文件，主日历与 state 照常生成
         try:
-            start_dt_local = tz.localize(datetime.strptime(f"{event_data['date']} {start_time_str}", '%Y-%m-%d %H:%M'))
-            end_dt_local = tz.localize(datetime.strptime(f"{event_data['date']} {end_time_str}", '%Y-%m-%d %H:%M'))
+            delta_writer = open_calendar_writer(delta_filename, calendar_props, streaming)
         except Exception as e:
-            print(f"[错误] 解析时间失败，事件已跳过: {event_data} / {e}")
-            continue
-
-        uid = _build_uid(event_data)
-
-        # 构建内容 hash
-        content_hash = _event_content_hash([
-            event_data.get('name'), event_data.get('date'), periods_str,
-            event_data.get('teacher'), event_data.get('location'),
-            start_dt_local.isoformat(), end_dt_local.isoformat()
-        ])
-
-        prev = state.get(uid) if use_state else None
-        if prev is None:
-            sequence = 0
-            dtstamp = now_utc
-            last_modified = now_utc
-            status_flag = 'created'
-            created += 1
-        else:
-            # 判断内容是否变化
-            if prev.get('content_hash') == content_hash:
-                sequence = prev.get('sequence', 0)
-                dtstamp = datetime.fromisoformat(prev.get('dtstamp')) if prev.get('dtstamp') else now_utc
+            print(f"[错误] 写入增量 ICS 文件失败，本次不输出增量文件: {e}")
+
+    try:
+        build_started = time.perf_counter()
+        # 本次新增/更新/取消的事件，用于变更记录
+        changes = []
+
+        # 启用 VEVENT 缓存时，当前 UID 本次重新序列化的文本
+        rendered = []
+
+        def emit_event(props, status_flag):
+            if blocks is None:
+                writer.write_event(props)
+                # 增量 ICS 只包含发生变化的事件
+                if delta_writer is not None and status_flag != 'unchanged':
+                    delta_writer.write_event(props)
+                return
+            text = serialize_component("VEVENT", props, EVENT_CANONICAL_ORDER)
+            rendered.append(text)
+            writer.write_block(text)
+            if delta_writer is not None and status_flag != 'unchanged':
+                delta_writer.write_block(text)
+
+        def reuse_block(uid, revision, content_hash, status=''):
+            """未变化的事件在缓存中有同一版本的文本时直接写入并返回 True。"""
+            sequence, dtstamp, last_modified, status_flag = revision
+            if blocks is None or status_flag != 'unchanged':
+                return False
+            text = blocks.get(uid, blocks.key(content_hash, sequence, dtstamp, last_modified, status))
+            if text is None:
+                return False
+            writer.write_block(text)
+            return True
+
+        def store_block(uid, revision, content_hash, status=''):
+            """把 uid 本次重新序列化的文本存入缓存。"""
+            if blocks is None:
+                return
+            sequence, dtstamp, last_modified, _ = revision
+            blocks.put(uid, blocks.key(content_hash, sequence, dtstamp, last_modified, status), "".join(rendered))
+            rendered.clear()
+
+        def record_change(uid, status_flag, summary, sequence, prev, start_iso=None, end_iso=None):
+            if status_flag == 'unchanged':
+                return
+            prev = prev or {}
+            changes.append({
+                'uid': uid,
+                'status': status_flag,
+                'summary': summary or '',
+                'sequence': sequence,
+                'old_start': prev.get('start'),
+                'old_end': prev.get('end'),
+                'new_start': start_iso,
+                'new_end': end_iso,
+            })
+
+        # 只收集本轮仍存在或新增的事件；删除的将在后面单独检测
+        updated_state = {}
+
+        created = 0
+        updated = 0
+        unchanged = 0
+        cancelled = 0
+
+        def revise(uid, content_hash):
+            """与 state 中的上一版本比较，返回 (sequence, dtstamp, last_modified, status_flag)。"""
+            nonlocal created, updated, unchanged
+            prev = state.get(uid) if use_state else None
+            if prev is None:
+                created += 1
+                return 0, now_utc, now_utc, 'created'
+            dtstamp = datetime.fromisoformat(prev.get('dtstamp')) if prev.get('dtstamp') else now_utc
+            # 判断内容是否变化；曾被取消又重新出现的事件必须递增修订号，订阅端才会恢复显示
+            if prev.get('content_hash') == content_hash and prev.get('status') != 'cancelled':
                 last_modified = datetime.fromisoformat(prev.get('last_modified')) if prev.get('last_modified') else now_utc
-                status_flag = 'unchanged'
                 unchanged += 1
-            else:
-                sequence = prev.get('sequence', 0) + 1
-                dtstamp = datetime.fromisoformat(prev.get('dtstamp')) if prev.get('dtstamp') else now_utc
-                last_modified = now_utc
-                status_flag = 'updated'
-                updated += 1
-
-        event = Event()
-        event.add('uid', uid)
-        event.add('summary', event_data.get("name"))
-        event.add('dtstart', start_dt_local)
-        event.add('dtend', end_dt_local)
-        full_location = f"{event_data.get('location','')} {event_data.get('teacher','')}".strip()
-        if full_location:
-            event.add('location', full_location)
-        event.add('description', f"教师: {event_data.get('teacher','')}_节次: {periods_str}")
-        event.add('dtstamp', dtstamp)
-        event.add('last-modified', last_modified)
-        event.add('sequence', sequence)
-
-        cal.add_component(event)
-
-        # 更新状态缓存
-        if use_state:
-            updated_state[uid] = {
-                'dtstamp': dtstamp.isoformat(),
-                'last_modified': last_modified.isoformat(),
-                'sequence': sequence,
-                'content_hash': content_hash,
-                'status': status_flag,
-                'start': start_dt_local.isoformat(),
-                'end': end_dt_local.isoformat(),
-                'summary': event_data.get('name') or ''
-            }
+                return prev.get('sequence', 0), dtstamp, last_modified, 'unchanged'
+            updated += 1
+            return prev.get('sequence', 0) + 1, dtstamp, now_utc, 'updated'
 
-    # 处理被删除的事件 -> 写入 CANCELLED 事件
-    if use_state:
-        current_uids = set(updated_state.keys())
-        previous_uids = set(state.keys())
-        removed = previous_uids - current_uids
-        if removed:
-            for uid in removed:
-                prev = state.get(uid) or {}
-                # 需要原始开始结束时间
-                try:
-                    start_iso = prev.get('start')
-                    end_iso = prev.get('end')
-                    if not (start_iso and end_iso):
-                        print(f"[删除] 跳过无起止时间的 UID: {uid}")
-                        continue
-                    start_dt = datetime.fromisoformat(start_iso)
-                    end_dt = datetime.fromisoformat(end_iso)
-                except Exception as e:
-                    print(f"[删除] 解析原时间失败 UID {uid}: {e}")
-                    continue
-
-                prev_dtstamp = prev.get('dtstamp')
-                try:
-                    dtstamp_val = datetime.fromisoformat(prev_dtstamp) if prev_dtstamp else now_utc
-                except Exception:
-                    dtstamp_val = now_utc
-
-                prev_seq = prev.get('sequence', 0)
-                seq_new = prev_seq + 1  # 删除视为一次修订
-
-                event = Event()
-                event.add('uid', uid)
-                event.add('summary', prev.get('summary', '取消的课程'))
-                # 对于取消事件仍需提供原 dtstart/dtend 便于匹配覆盖
-                try:
-                    if start_dt.tzinfo is None:
-                        start_dt = tz.localize(start_dt)
-                    if end_dt.tzinfo is None:
-                        end_dt = tz.localize(end_dt)
-                except Exception:
-                    pass
-                event.add('dtstart', start_dt)
-                event.add('dtend', end_dt)
-                event.add('status', 'CANCELLED')
-                event.add('dtstamp', dtstamp_val)
-                event.add('last-modified', now_utc)
-                event.add('sequence', seq_new)
-                event.add('description', '该课程已被移除 / CANCELLED')
-                cal.add_component(event)
-
-                # 写入新状态（保留以防以后再出现可继续递增）
+        def remember(uid, revision, content_hash, start_iso, end_iso, summary):
+            if use_state:
+                sequence, dtstamp, last_modified, status_flag = revision
                 updated_state[uid] = {
-                    'dtstamp': dtstamp_val.isoformat(),
-                    'last_modified': now_utc.isoformat(),
-                    'sequence': seq_new,
-                    'content_hash': prev.get('content_hash', ''),
-                    'status': 'cancelled',
-                    'start': start_dt.isoformat(),
-                    'end': end_dt.isoformat(),
-                    'summary': prev.get('summary', '')
+                    'dtstamp': dtstamp.isoformat(),
+                    'last_modified': last_modified.isoformat(),
+                    'sequence': sequence,
+                    'content_hash': content_hash,
+                    'status': status_flag,
+                    'start': start_iso,
+                    'end': end_iso,
+                    'summary': summary or ''
                 }
-                cancelled += 1
+
+        # 兼容旧调用方传入的 dict 事件
+        events = [e if isinstance(e, CourseEvent) else CourseEvent.from_dict(e) for e in events]
+
+        # 一次性为本批事件涉及的所有日期生成 (日期, 节次) -> 起止时间 表
+        resolver = get_time_resolver(class_time_map, timezone)
+        resolver.precompute(event_data.date for event_data in events)
+
+        if recurrence:
+            series_list, single_events = group_weekly_series(events)
+        else:
+            series_list, single_events = [], events
+
+        for series in series_list:
+            periods_str = series.periods
+            try:
+                start_dt_local, end_dt_local = resolver.resolve(series.first.date, periods_str)
+                excluded = [resolver.resolve(d, periods_str)[0] for d in series.excluded_dates()]
+                overrides = [(resolver.resolve(e.date, periods_str), e) for e in series.overrides()]
+            except Exception as e:
+                print(f"[错误] 解析时间失败，系列已跳过: {series} / {e}")
+                continue
+
+            uid = series.uid
+            start_iso = start_dt_local.isoformat()
+            end_iso = end_dt_local.isoformat()
+            content_hash = series.content_hash(start_iso, end_iso)
+            revision = revise(uid, content_hash)
+            sequence, dtstamp, last_modified, status_flag = revision
+
+            if not reuse_block(uid, revision, content_hash):
+                event_props = _course_event_props(
+                    uid, series.name, series.teacher, series.location, periods_str,
+                    start_dt_local, end_dt_local, dtstamp, last_modified, sequence,
+                )
+                event_props.append(('RRULE', {'FREQ': 'WEEKLY', 'COUNT': series.count}))
+                if excluded:
+                    event_props.append(('EXDATE', excluded))
+                emit_event(event_props, status_flag)
+
+                # 地点不同的那几次课以 RECURRENCE-ID 覆盖系列中的对应实例
+                for (override_start, override_end), occurrence in overrides:
+                    override_props = _course_event_props(
+                        uid, series.name, series.teacher, occurrence.location, periods_str,
+                        override_start, override_end, dtstamp, last_modified, sequence,
+                    )
+                    override_props.append(('RECURRENCE-ID', override_start))
+                    emit_event(override_props, status_flag)
+                store_block(uid, revision, content_hash)
+
+            record_change(uid, status_flag, series.name, sequence, state.get(uid), start_iso, end_iso)
+            remember(uid, revision, content_hash, start_iso, end_iso, series.name)
+
+        for event_data in single_events:
+            # 解析时间段
+            periods_str = event_data.periods
+            if len(periods_str) < 2:
+                # fallback，跳过异常 period
+                print(f"[警告] 节次字段异常: {periods_str} (跳过 UID 逻辑仍尝试生成)")
+
+            # 构造开始结束时间（本地 tz），直接查预先生成的解析表
+            try:
+                start_dt_local, end_dt_local = resolver.resolve(event_data.date, periods_str)
+            except Exception as e:
+                print(f"[错误] 解析时间失败，事件已跳过: {event_data} / {e}")
+                continue
+
+            uid = event_data.uid
+            start_iso = start_dt_local.isoformat()
+            end_iso = end_dt_local.isoformat()
+
+            # 构建内容 hash（缓存在事件对象上）
+            content_hash = event_data.content_hash(start_iso, end_iso)
+            revision = revise(uid, content_hash)
+            sequence, dtstamp, last_modified, status_flag = revision
+
+            if not reuse_block(uid, revision, content_hash):
+                emit_event(_course_event_props(
+                    uid, event_data.name, event_data.teacher, event_data.location, periods_str,
+                    start_dt_local, end_dt_local, dtstamp, last_modified, sequence,
+                ), status_flag)
+                store_block(uid, revision, content_hash)
+
+            # 更新状态缓存
+            record_change(uid, status_flag, event_data.name, sequence, state.get(uid), start_iso, end_iso)
+            remember(uid, revision, content_hash, start_iso, end_iso, event_data.name)
+
+        # 处理被删除的事件 -> 写入 CANCELLED 事件
+        if use_state:
+            current_uids = set(updated_state.keys())
+            previous_uids = set(state.keys())
+            removed = previous_uids - current_uids
+            if removed:
+                for uid in removed:
+                    prev = state.get(uid) or {}
+                    # 需要原始开始结束时间
+                    try:
+                        start_iso = prev.get('start')
+                        end_iso = prev.get('end')
+                        if not (start_iso and end_iso):
+                            print(f"[删除] 跳过无起止时间的 UID: {uid}")
+                            continue
+                        start_dt = datetime.fromisoformat(start_iso)
+                        end_dt = datetime.fromisoformat(end_iso)
+                    except Exception as e:
+                        print(f"[删除] 解析原时间失败 UID {uid}: {e}")
+                        continue
+
+                    prev_dtstamp = prev.get('dtstamp')
+                    try:
+                        dtstamp_val = datetime.fromisoformat(prev_dtstamp) if prev_dtstamp else now_utc
+                    except Exception:
+                        dtstamp_val = now_utc
+
+                    prev_seq = prev.get('sequence', 0)
+                    # 上一轮已经取消过的事件保持原修订号，不再重复计为变化
+                    already_cancelled = prev.get('status') == 'cancelled'
+                    if already_cancelled:
+                        seq_new = prev_seq
+                        try:
+                            last_modified_val = datetime.fromisoformat(prev['last_modified'])
+                        except Exception:
+                            last_modified_val = now_utc
+                    else:
+                        seq_new = prev_seq + 1  # 删除视为一次修订
+                        last_modified_val = now_utc
+
+                    # 对于取消事件仍需提供原 dtstart/dtend 便于匹配覆盖
+                    try:
+                        if start_dt.tzinfo is None:
+                            start_dt = tz.localize(start_dt)
+                        if end_dt.tzinfo is None:
+                            end_dt = tz.localize(end_dt)
+                    except Exception:
+                        pass
+                    revision = (seq_new, dtstamp_val, last_modified_val, 'unchanged' if already_cancelled else 'cancelled')
+                    prev_hash = prev.get('content_hash', '')
+                    if not reuse_block(uid, revision, prev_hash, 'cancelled'):
+                        emit_event([
+                            ('UID', uid),
+                            ('SUMMARY', prev.get('summary', '取消的课程')),
+                            ('DTSTART', start_dt),
+                            ('DTEND', end_dt),
+                            ('STATUS', 'CANCELLED'),
+                            ('DTSTAMP', dtstamp_val),
+                            ('LAST-MODIFIED', last_modified_val),
+                            ('SEQUENCE', seq_new),
+                            ('DESCRIPTION', '该课程已被移除 / CANCELLED'),
+                        ], revision[3])
+                        store_block(uid, revision, prev_hash, 'cancelled')
+                    if not already_cancelled:
+                        record_change(uid, 'cancelled', prev.get('summary', ''), seq_new, prev)
+
+                    # 写入新状态（保留以防以后再出现可继续递增）
+                    updated_state[uid] = {
+                        'dtstamp': dtstamp_val.isoformat(),
+                        'last_modified': last_modified_val.isoformat(),
+                        'sequence': seq_new,
+                        'content_hash': prev.get('content_hash', ''),
+                        'status': 'cancelled',
+                        'start': start_dt.isoformat(),
+                        'end': end_dt.isoformat(),
+                        'summary': prev.get('summary', '')
+                    }
+                    if not already_cancelled:
+                        cancelled += 1
+    except BaseException:
+        # 生成过程中出错时删除临时文件，目标文件保持不变
+        writer.abort()
+        if delta_writer is not None:
+            delta_writer.abort()
+        raise
+
+    _metrics.observe("ics_build", time.perf_counter() - build_started)
 
     # 写 ICS 文件
     try:
-        with open(filename, 'wb') as f:
-            f.write(cal.to_ical())
+        with _metrics.span("ics_write"):
+            writer.close()
     except Exception as e:
         print(f"[错误] 写入 ICS 文件失败: {e}")
+        if delta_writer is not None:
+            delta_writer.abort()
         return
+    if blocks is not None:
+        blocks.commit()
+        for result, count in (("hit", blocks.hits), ("miss", blocks.misses)):
+            if count:
+                _metrics.increment("ics_block_cache", count, result=result)
+    if delta_writer is not None:
+        try:
+            with _metrics.span("ics_write", file="delta"):
+                delta_writer.close()
+        except Exception as e:
+            print(f"[错误] 写入增量 ICS 文件失败: {e}")
 
     # 写 state 文件
     if use_state:
-        _safe_write_state(state_path, updated_state)
+        if input_fingerprint:
+            updated_state[STATE_META_KEY] = {"input_fingerprint": input_fingerprint}
+        try:
+            with _metrics.span("state_save"):
+                state_store.save(updated_state, previous=stored_state)
+        except Exception as e:
+            print(f"[state] 写入失败: {e}")
+
+    # 追加变更记录（每个变化的事件一行）
+    if change_feed_path and changes:
+        with _metrics.span("change_feed_write"):
+            _append_change_feed(change_feed_path, changes, now_utc)
+
+    for status_flag, count in (("created", created), ("updated", updated), ("unchanged", unchanged), ("cancelled", cancelled)):
+        if count:
+            _metrics.increment("ics_events", count, status=status_flag)
 
     print(f"\n--- 日历文件已成功生成 ---")
     print(f"文件名: {filename}")
     if use_state:
         print(f"事件统计: 新增 {created} | 更新 {updated} | 未变化 {unchanged} | 取消 {cancelled}")
-        print(f"状态文件: {state_path}")
+        print(f"状态文件: {getattr(state_store, 'path', state_path)}")
     else:
-        print("(未使用状态持久化，所有事件会被订阅端视为可能的更新。)")
\ No newline at end of file
+        print("(未使用状态持久化，所有事件会被订阅端视为可能的更新。)")
+    if blocks is not None:
+        print(f"VEVENT 缓存: 复用 {blocks.hits} | 重新序列化 {blocks.misses}")
+    if delta_writer is not None:
+        print(f"增量文件: {delta_filename}（{len(changes)} 个变化的事件）")
+    if series_list:
+        print(f"每周重复系列: {len(series_list)} 个（合并了 {sum(len(s.occurrences) for s in series_list)} 次课程）")
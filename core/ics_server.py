@@ -0,0 +1,297 @@
+# core/ics_server.py
+import os
+import gzip
+import socket
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+from core.ical_generator import STATE_META_KEY
+from core.metrics import get_metrics
+from core.state_store import open_state_store, StateLoadError
+
+ICS_CONTENT_TYPE = "text/calendar; charset=utf-8"
+# 小于该字节数的日历不压缩
+GZIP_MIN_BYTES = 1024
+
+_metrics = get_metrics()
+
+
+class IcsEntry:
+    """一个已发布的日历：正文与预先压缩的 gzip 正文、强 ETag 与 Last-Modified，发布后不再修改。"""
+
+    __slots__ = ("body", "gzip_body", "etag", "gzip_etag", "last_modified", "last_modified_ts")
+
+    def __init__(self, body, digest, last_modified_ts):
+        self.body = body
+        self.gzip_body = gzip.compress(body, compresslevel=6, mtime=0) if len(body) >= GZIP_MIN_BYTES else None
+        # 同一内容的不同编码是不同的表示，强 ETag 需要区分
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gz"'
+        self.last_modified_ts = int(last_modified_ts)
+        self.last_modified = format_datetime(datetime.fromtimestamp(self.last_modified_ts, timezone.utc), usegmt=True)
+
+    def matches(self, if_none_match):
+        """If-None-Match 使用弱比较：忽略 W/ 前缀，任一编码的 ETag 相同即视为未变化。"""
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) in (self.etag, self.gzip_etag):
+                return True
+        return False
+
+
+def accepts_gzip(accept_encoding):
+    """
+    解析 Accept-Encoding 的逗号分隔列表：gzip（或 x-gzip）的 q 值大于 0 时返回 True，
+    q=0 表示明确拒绝；未列出 gzip 时按 * 的 q 值判断。
+    """
+    explicit = wildcard = None
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value.strip())
+                except ValueError:
+                    quality = 0.0
+        if coding in ("gzip", "x-gzip"):
+            explicit = bool(explicit) or quality > 0
+        elif coding == "*":
+            wildcard = quality > 0
+    if explicit is not None:
+        return explicit
+    return bool(wildcard)
+
+
+def _state_digest(state):
+    """
+    由 state 中各 UID 的内容哈希、修订号、状态与最后修改时间计算摘要，返回 (摘要, 最新的修改时间戳)。
+    ICS 中每个事件的内容都由这些字段决定。
+    """
+    h = hashlib.sha256()
+    latest = None
+    for uid in sorted(state):
+        if uid == STATE_META_KEY or not isinstance(state[uid], dict):
+            continue
+        record = state[uid]
+        h.update(f"{uid}|{record.get('content_hash')}|{record.get('sequence')}|{record.get('status')}|"
+                 f"{record.get('last_modified')}\n".encode("utf-8"))
+        try:
+            modified = datetime.fromisoformat(record["last_modified"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            continue
+        latest = modified if latest is None else max(latest, modified)
+    return h.hexdigest(), latest
+
+
+def load_ics_entry(ics_path, state_path=None):
+    """
+    读取 ICS 文件并构造 IcsEntry。提供可读取的 state 时，ETag 与 Last-Modified 由 state 的内容哈希
+    与各事件的最后修改时间得出（再混入正文长度，防止 state 写入失败时与正文不一致）；
+    没有 state 时退回为正文的 SHA-256 与文件修改时间。
+    """
+    with open(ics_path, "rb") as f:
+        body = f.read()
+    digest = latest = None
+    if state_path and os.path.exists(state_path):
+        try:
+            state = open_state_store(state_path).load()
+        except StateLoadError as e:
+            print(f"[ics_server] 读取状态文件失败，改用正文计算 ETag: {e}")
+        else:
+            if any(key != STATE_META_KEY for key in state):
+                state_digest, latest = _state_digest(state)
+                digest = hashlib.sha256(f"{state_digest}|{len(body)}".encode("utf-8")).hexdigest()[:32]
+    if digest is None:
+        digest = hashlib.sha256(body).hexdigest()[:32]
+    if latest is None:
+        latest = os.path.getmtime(ics_path)
+    return IcsEntry(body, digest, latest)
+
+
+class IcsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "GDUT-Course-Exporter"
+
+    def setup(self):
+        super().setup()
+        # 响应头与正文分两次写出，关闭 Nagle 算法避免长连接上的每个请求多等一个延迟 ACK
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_headers(self, status, entry, body=None, encoding=None):
+        self.send_response(status)
+        self.send_header("ETag", entry.gzip_etag if encoding == "gzip" else entry.etag)
+        self.send_header("Last-Modified", entry.last_modified)
+        self.send_header("Cache-Control", f"max-age={self.server.max_age}")
+        self.send_header("Vary", "Accept-Encoding")
+        if body is not None:
+            self.send_header("Content-Type", ICS_CONTENT_TYPE)
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+    def _not_modified(self, entry):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return entry.matches(if_none_match)
+        # 只有没有 If-None-Match 时才使用 If-Modified-Since
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return entry.last_modified_ts <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _serve(self, include_body):
+        name = unquote(urlsplit(self.path).path).lstrip("/")
+        entry = self.server.registry.get(name)
+        if entry is None:
+            body = b"Not Found"
+            self.send_response(404)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if include_body:
+                self.wfile.write(body)
+            return
+        use_gzip = entry.gzip_body is not None and accepts_gzip(self.headers.get("Accept-Encoding"))
+        encoding = "gzip" if use_gzip else None
+        if self._not_modified(entry):
+            _metrics.increment("ics_server_responses", result="not_modified")
+            self._send_headers(304, entry, encoding=encoding)
+            return
+        body = entry.gzip_body if use_gzip else entry.body
+        _metrics.increment("ics_server_responses", result="gzip" if use_gzip else "full")
+        self._send_headers(200, entry, body, encoding)
+        if include_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._serve(True)
+
+    def do_HEAD(self):
+        self._serve(False)
+
+
+class IcsServer(ThreadingHTTPServer):
+    """
+    从内存提供已生成的 ICS 文件（/<文件名>），支持强 ETag、Last-Modified、
+    If-None-Match / If-Modified-Since 条件请求（304）与预先压缩的 gzip 响应。
+    每次请求只做一次字典查找，发布新版本时整体替换条目，正在进行的请求仍使用旧版本。
+
+        server = IcsServer.from_config(config.get("ics_server"))
+        server.start()
+        server.publish_file("my_courses.ics", "my_courses.ics", "ical_state.json")
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=8080, max_age=300):
+        super().__init__((host, port), IcsHandler)
+        self.max_age = int(max_age)
+        self.registry = {}
+        self._thread = None
+        self._watchers = []
+        self._stopping = threading.Event()
+
+    @classmethod
+    def from_config(cls, options):
+        """根据 config.yml 的 ics_server 段构造服务器（尚未启动）；未启用时返回 None。"""
+        options = options or {}
+        if not options.get("enabled", False):
+            return None
+        return cls(options.get("host", "127.0.0.1"), options.get("port", 8080), options.get("max_age", 300))
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="ics-server", daemon=True)
+        self._thread.start()
+        print(f"[ics_server] 日历订阅服务已启动: {self.url}/")
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        self.shutdown()
+        self.server_close()
+
+    def publish(self, name, entry):
+        """发布或替换名为 name 的日历（原子替换）。"""
+        self.registry[name] = entry
+
+    def unpublish(self, name):
+        self.registry.pop(name, None)
+
+    def publish_file(self, name, ics_path, state_path=None):
+        """在 create_calendar_file 完成后调用：读取文件并发布，返回新的 IcsEntry。"""
+        entry = load_ics_entry(ics_path, state_path)
+        self.publish(name, entry)
+        return entry
+
+    def watch_directory(self, directory, state_suffix=".json", interval=10.0):
+        """
+        在后台线程中每 interval 秒扫描 directory 下的 *.ics 并发布有变化的文件，适合与
+        batch_run.py 的输出目录配合：<学号>.ics 对应的状态文件为 <学号>_state<state_suffix>。
+        ICS 比状态文件新时说明生成尚未结束，等状态文件写入后再发布。
+        """
+        seen = {}
+
+        def stat_key(path):
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+            return st.st_mtime_ns, st.st_size, st.st_ino
+
+        def scan():
+            names = set()
+            for filename in sorted(os.listdir(directory)):
+                if not filename.endswith(".ics"):
+                    continue
+                names.add(filename)
+                ics_path = os.path.join(directory, filename)
+                state_path = os.path.join(directory, f"{filename[:-4]}_state{state_suffix}")
+                key = (stat_key(ics_path), stat_key(state_path))
+                if key[0] is None or seen.get(filename) == key:
+                    continue
+                if key[1] is not None and key[0][0] > key[1][0] and time.time() - key[0][0] / 1e9 < 2 * interval:
+                    continue
+                try:
+                    self.publish_file(filename, ics_path, state_path)
+                except OSError as e:
+                    print(f"[ics_server] 读取 {ics_path} 失败: {e}")
+                    continue
+                seen[filename] = key
+            for filename in list(seen):
+                if filename not in names:
+                    del seen[filename]
+                    self.unpublish(filename)
+
+        def loop():
+            while not self._stopping.wait(interval):
+                try:
+                    scan()
+                except OSError as e:
+                    print(f"[ics_server] 扫描目录 {directory} 失败: {e}")
+
+        scan()
+        watcher = threading.Thread(target=loop, name="ics-watch", daemon=True)
+        watcher.start()
+        self._watchers.append(watcher)
+        print(f"[ics_server] 已发布 {len(seen)} 个日历，每 {interval:g} 秒检查 {os.path.abspath(directory)} 中的更新。")
+        return watcher
@@ -0,0 +1,276 @@
+# core/ics_writer.py
+import os
+import json
+import tempfile
+from datetime import datetime, date
+
+from icalendar import Calendar, Event
+from icalendar.parser import escape_char, foldline, param_value
+from icalendar.prop import vRecur
+from icalendar.timezone import tzid_from_dt
+
+from core.utils import atomic_write
+
+# 与 icalendar 中 Calendar / Event 的 canonical_order 保持一致，其余属性按字母序排在后面
+CALENDAR_CANONICAL_ORDER = (
+    "VERSION", "PRODID", "CALSCALE", "METHOD", "DESCRIPTION",
+    "X-WR-CALDESC", "NAME", "X-WR-CALNAME",
+)
+EVENT_CANONICAL_ORDER = (
+    "SUMMARY", "DTSTART", "DTEND", "DURATION", "DTSTAMP", "UID",
+    "RECURRENCE-ID", "SEQUENCE", "RRULE", "RDATE", "EXDATE",
+)
+# 折行阈值（字节）；更短的行无需逐字符处理
+FOLD_LIMIT = 75
+
+
+def sort_properties(props, canonical_order):
+    """按 canonical_order 排序属性名，规则与 icalendar 的 canonsort_keys 相同。"""
+    canonical_map = {name: i for i, name in enumerate(canonical_order)}
+    head = [item for item in props if item[0] in canonical_map]
+    tail = [item for item in props if item[0] not in canonical_map]
+    head.sort(key=lambda item: canonical_map[item[0]])
+    tail.sort(key=lambda item: item[0])
+    return head + tail
+
+
+def _format_datetime(dt):
+    """返回 (参数串, 值)，与 icalendar 的 vDatetime 输出一致：UTC 以 Z 结尾，其他时区带 TZID 参数。"""
+    value = f"{dt.year:04}{dt.month:02}{dt.day:02}T{dt.hour:02}{dt.minute:02}{dt.second:02}"
+    tzid = tzid_from_dt(dt) if dt.tzinfo is not None else None
+    if tzid == "UTC":
+        return "", value + "Z"
+    if tzid:
+        return f";TZID={param_value(tzid)}", value
+    return "", value
+
+
+def format_property(name, value):
+    """
+    将单个属性序列化为一行（未折行）内容行。
+    支持 str / int / datetime / date，dict（RRULE）以及 datetime 列表（EXDATE/RDATE）。
+    """
+    if isinstance(value, str):
+        if name.startswith("X-"):
+            # icalendar 将未登记的扩展属性按原样输出，不做 TEXT 转义
+            return f"{name}:{value}"
+        return f"{name}:{escape_char(value)}"
+    if isinstance(value, bool):
+        raise TypeError(f"不支持的属性值类型: {name}={value!r}")
+    if isinstance(value, int):
+        return f"{name}:{value}"
+    if isinstance(value, datetime):
+        params, text = _format_datetime(value)
+        return f"{name}{params}:{text}"
+    if isinstance(value, date):
+        return f"{name};VALUE=DATE:{value.year:04}{value.month:02}{value.day:02}"
+    if isinstance(value, dict):
+        return f"{name}:{vRecur(value).to_ical().decode('utf-8')}"
+    if isinstance(value, (list, tuple)) and value and all(isinstance(v, datetime) for v in value):
+        # 与 icalendar 的 vDDDLists 一致：值以逗号连接，TZID 取自带时区的元素
+        params = ""
+        texts = []
+        for dt in value:
+            dt_params, text = _format_datetime(dt)
+            params = dt_params or params
+            texts.append(text)
+        return f"{name}{params}:{','.join(texts)}"
+    raise TypeError(f"不支持的属性值类型: {name}={value!r}")
+
+
+def fold_content_line(line):
+    """按 RFC 5545 折行；不超过阈值的纯 ASCII 行直接返回，避免逐字符处理。"""
+    if len(line) < FOLD_LIMIT and line.isascii():
+        return line
+    return foldline(line)
+
+
+def serialize_component(name, props, canonical_order):
+    """将组件序列化为 CRLF 分隔的文本（含 BEGIN/END 行，末尾带 CRLF）。"""
+    lines = [f"BEGIN:{name}"]
+    for prop_name, value in sort_properties(props, canonical_order):
+        lines.append(fold_content_line(format_property(prop_name, value)))
+    lines.append(f"END:{name}")
+    lines.append("")
+    return "\r\n".join(lines)
+
+
+def build_component(component_cls, props):
+    """用 [(属性名, 值), ...] 构建 icalendar 组件。"""
+    component = component_cls()
+    for name, value in props:
+        component.add(name, value)
+    return component
+
+
+class CalendarObjectWriter:
+    """
+    默认写入方式：先构建完整的 icalendar.Calendar，close() 时一次性写出。
+    接口与 StreamingCalendarWriter 相同。
+    """
+
+    def __init__(self, filename, calendar_props):
+        self.filename = filename
+        self.calendar = build_component(Calendar, calendar_props)
+
+    def write_event(self, props):
+        self.calendar.add_component(build_component(Event, props))
+
+    def close(self):
+        # 原子替换，读取方（如 core.ics_server）不会读到写了一半的文件
+        atomic_write(self.filename, self.calendar.to_ical())
+
+    def abort(self):
+        pass
+
+
+class StreamingCalendarWriter:
+    """
+    流式 ICS 写入器：依次写入 VCALENDAR 头、逐个 VEVENT 与结尾，
+    不在内存中构建 icalendar.Calendar，也不一次性生成整个文件的字节串。
+    输出与 Calendar.to_ical() 逐字节一致（属性顺序、转义、折行、TZID 均沿用 icalendar 的规则）。
+
+    内容先写入目标目录下的临时文件，close() 时再重命名覆盖目标文件；
+    写入过程中的错误会被记录，并在 close() 时抛出，此时目标文件保持不变。
+    """
+
+    def __init__(self, filename, calendar_props):
+        self.filename = filename
+        directory = os.path.dirname(filename) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(filename))
+        self._file = os.fdopen(fd, "wb")
+        self._error = None
+        header = serialize_component("VCALENDAR", calendar_props, CALENDAR_CANONICAL_ORDER)
+        # 去掉 END:VCALENDAR，事件写完后再补上
+        self._write(header[: -len("END:VCALENDAR\r\n")])
+
+    def _write(self, text):
+        if self._error is not None:
+            return
+        try:
+            self._file.write(text.encode("utf-8"))
+        except Exception as e:
+            self._error = e
+
+    def write_event(self, props):
+        """写入一个 VEVENT，props 为 [(属性名, 值), ...]。"""
+        self._write(serialize_component("VEVENT", props, EVENT_CANONICAL_ORDER))
+
+    def write_block(self, text):
+        """写入已序列化的 VEVENT 文本（serialize_component 的输出，可包含多个 VEVENT）。"""
+        self._write(text)
+
+    def close(self):
+        """写入结尾并替换目标文件；之前有写入错误时清理临时文件并抛出该错误。"""
+        self._write("END:VCALENDAR\r\n")
+        try:
+            if self._error is None:
+                self._file.close()
+                # mkstemp 创建的文件权限为 0600，这里与直接 open() 写出的文件保持一致
+                mode = os.stat(self.filename).st_mode & 0o777 if os.path.exists(self.filename) else 0o644
+                os.chmod(self._tmp_path, mode)
+                os.replace(self._tmp_path, self.filename)
+                return
+        except Exception as e:
+            self._error = e
+        self.abort()
+        raise self._error
+
+    def abort(self):
+        """放弃本次写入，删除临时文件。"""
+        try:
+            self._file.close()
+        except Exception:
+            pass
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+class EventBlockCache:
+    """
+    VEVENT 序列化缓存：按 UID 保存上一次写出的 VEVENT 文本（每周重复系列与其 RECURRENCE-ID
+    覆盖实例合为一块）及版本键。版本键由内容哈希、SEQUENCE、DTSTAMP 与 LAST-MODIFIED 组成，
+    相同版本键的事件序列化结果必然相同，create_calendar_file 直接复用缓存的文本，
+    只重新序列化新增、更新与新取消的事件。
+
+    每次生成的流程为 begin() -> get()/put() -> commit()；只有 ICS 写入成功后才调用 commit()，
+    此时缓存替换为本次输出的全部 UID 并写入 path（path 为空时只保存在内存中，适合常驻进程复用同一实例）。
+    缓存文件记录格式版本与时区，与本次生成不一致时整体作废。
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path=None):
+        self.path = path or None
+        self.hits = 0
+        self.misses = 0
+        self._context = None
+        self._blocks = None
+        self._next = {}
+
+    @staticmethod
+    def key(content_hash, sequence, dtstamp, last_modified, status=""):
+        return f"{content_hash}|{sequence}|{dtstamp.isoformat()}|{last_modified.isoformat()}|{status}"
+
+    def _load(self):
+        blocks = {}
+        if not self.path or not os.path.exists(self.path):
+            return blocks
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict) and data.get("version") == self.FORMAT_VERSION and data.get("timezone") == self._context:
+                blocks = data.get("blocks") or {}
+        except Exception as e:
+            print(f"[ics_cache] 读取 VEVENT 缓存失败，本次将重新序列化全部事件: {e}")
+        return blocks if isinstance(blocks, dict) else {}
+
+    def begin(self, timezone):
+        """开始一次生成；时区决定 DTSTART/DTEND 的 TZID，变化时之前的缓存全部作废。"""
+        if self._blocks is None or self._context != timezone:
+            self._context = timezone
+            self._blocks = self._load()
+        self._next = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, uid, key):
+        """返回 uid 在同一版本键下缓存的 VEVENT 文本，没有时返回 None。"""
+        entry = self._blocks.get(uid)
+        if entry is not None and entry[0] == key:
+            self._next[uid] = entry
+            self.hits += 1
+            return entry[1]
+        return None
+
+    def put(self, uid, key, text):
+        self._next[uid] = [key, text]
+        self.misses += 1
+
+    def commit(self):
+        """以本次输出的 UID 替换缓存（不再出现的 UID 随之清除），并写入缓存文件。"""
+        self._blocks, self._next = self._next, {}
+        if not self.path:
+            return
+        data = {"version": self.FORMAT_VERSION, "timezone": self._context, "blocks": self._blocks}
+        try:
+            atomic_write(self.path, json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+        except OSError as e:
+            print(f"[ics_cache] 写入 VEVENT 缓存失败: {e}")
+
+
+def open_block_cache(block_cache):
+    """block_cache 可以是缓存文件路径或 EventBlockCache 实例；为空时返回 None。"""
+    if not block_cache:
+        return None
+    if isinstance(block_cache, EventBlockCache):
+        return block_cache
+    return EventBlockCache(block_cache)
+
+
+def open_calendar_writer(filename, calendar_props, streaming=False):
+    """按写入方式创建写入器：streaming=True 为流式写入，否则构建完整 Calendar 后写出。"""
+    if streaming:
+        return StreamingCalendarWriter(filename, calendar_props)
+    return CalendarObjectWriter(filename, calendar_props)
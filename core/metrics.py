@@ -0,0 +1,245 @@
+# core/metrics.py
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from core.utils import atomic_write
+
+# Prometheus 指标名前缀
+PROMETHEUS_PREFIX = "gdut_exporter"
+# 每个计时序列保留的样本数（用于估计 p95）
+RESERVOIR_SIZE = 1024
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+
+def _prometheus_name(name):
+    return f"{PROMETHEUS_PREFIX}_" + "".join(ch if ch.isalnum() else "_" for ch in name)
+
+
+class TimingStats:
+    """
+    一个计时序列的有界汇总：次数、总和与最大值精确累计，p95 由固定大小的水库抽样估计
+    （记录次数不超过 reservoir_size 时为精确值）。常驻进程中内存占用不随记录次数增长。
+    不加锁，由调用方保证线程安全。
+    """
+
+    __slots__ = ("count", "total", "max", "_samples", "_size", "_random")
+
+    def __init__(self, reservoir_size=RESERVOIR_SIZE):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples = []
+        self._size = reservoir_size
+        self._random = random.Random()
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if len(self._samples) < self._size:
+            self._samples.append(value)
+        else:
+            index = self._random.randrange(self.count)
+            if index < self._size:
+                self._samples[index] = value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        return _percentile(sorted(self._samples), fraction) if self._samples else 0.0
+
+
+class Metrics:
+    """
+    进程内共享的轻量指标：计时区间（span，记录次数与耗时分布，见 TimingStats）与计数器，均可附带标签。
+    线程安全；标签只应使用取值有限的字段（如周次、状态码、步骤），不要使用账号等高基数字段。
+
+        with metrics.span("fetch_week", week=3):
+            ...
+        metrics.increment("http_retries", reason="503")
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+        self._started = time.perf_counter()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    @contextmanager
+    def span(self, name, **labels):
+        """记录 with 代码块的耗时（含异常退出），也可用于协程中的 async 代码块。"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            stats = self._spans.get(key)
+            if stats is None:
+                stats = self._spans[key] = TimingStats()
+            stats.add(seconds)
+
+    def increment(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self._started = time.perf_counter()
+
+    def summary(self, http_metrics=None):
+        """
+        返回可直接序列化为 JSON 的汇总：
+        {elapsed_s, spans: {名称: [{labels, count, total_ms, mean_ms, p95_ms, max_ms}]},
+         counters: {名称: [{labels, value}]}, http: HttpMetrics.summary()（传入时）}。
+        """
+        with self._lock:
+            spans = {
+                key: (stats.count, stats.total, stats.percentile(0.95), stats.max)
+                for key, stats in self._spans.items()
+            }
+            counters = dict(self._counters)
+            elapsed = time.perf_counter() - self._started
+
+        result = {"elapsed_s": round(elapsed, 3), "spans": {}, "counters": {}}
+        for (name, labels), (count, total, p95, max_value) in sorted(spans.items()):
+            result["spans"].setdefault(name, []).append({
+                "labels": dict(labels),
+                "count": count,
+                "total_ms": round(total * 1000, 2),
+                "mean_ms": round(total / count * 1000, 2),
+                "p95_ms": round(p95 * 1000, 2),
+                "max_ms": round(max_value * 1000, 2),
+            })
+        for (name, labels), value in sorted(counters.items()):
+            result["counters"].setdefault(name, []).append({"labels": dict(labels), "value": value})
+        if http_metrics is not None:
+            result["http"] = http_metrics.summary()
+        return result
+
+    def to_prometheus(self, http_metrics=None):
+        """
+        输出 Prometheus 文本格式（可交给 node_exporter 的 textfile collector 采集）：
+        span 输出为 summary 类型的 _count/_sum（秒），计数器输出为 counter 类型的 _total。
+        """
+        with self._lock:
+            spans = {key: (stats.count, stats.total) for key, stats in self._spans.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        declared = set()
+
+        def declare(metric, metric_type, help_text):
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} {metric_type}")
+
+        for (name, labels), (count, total) in sorted(spans.items()):
+            metric = _prometheus_name(name) + "_seconds"
+            declare(metric, "summary", f"Duration of {name}")
+            lines.append(f"{metric}_count{_prometheus_labels(labels)} {count}")
+            lines.append(f"{metric}_sum{_prometheus_labels(labels)} {total:.6f}")
+        for (name, labels), value in sorted(counters.items()):
+            metric = _prometheus_name(name) + "_total"
+            declare(metric, "counter", f"Count of {name}")
+            lines.append(f"{metric}{_prometheus_labels(labels)} {value}")
+
+        if http_metrics is not None:
+            fields = (
+                ("requests", "http_requests_total", "counter", "HTTP requests per host"),
+                ("new_connections", "http_new_connections_total", "counter", "New TCP connections per host"),
+                ("wire_bytes", "http_wire_bytes_total", "counter", "Response bytes received on the wire"),
+                ("body_bytes", "http_body_bytes_total", "counter", "Decoded response body bytes"),
+            )
+            summary = http_metrics.summary()
+            for field, suffix, metric_type, help_text in fields:
+                metric = f"{PROMETHEUS_PREFIX}_{suffix}"
+                declare(metric, metric_type, help_text)
+                for host, entry in sorted(summary.items()):
+                    lines.append(f"{metric}{_prometheus_labels([('host', host)])} {entry[field]}")
+
+        declare(f"{PROMETHEUS_PREFIX}_last_run_timestamp_seconds", "gauge", "Unix time when the report was written")
+        lines.append(f"{PROMETHEUS_PREFIX}_last_run_timestamp_seconds {time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+    def print_summary(self):
+        """按名称汇总输出各阶段的调用次数与总耗时（合并所有标签）。"""
+        summary = self.summary()
+        if not summary["spans"]:
+            return
+        print(f"\n[指标] 各阶段耗时（总计 / 平均，毫秒），运行总耗时 {summary['elapsed_s']:.1f} 秒:")
+        for name, entries in summary["spans"].items():
+            count = sum(entry["count"] for entry in entries)
+            total_ms = sum(entry["total_ms"] for entry in entries)
+            print(f"  {name}: {count} 次，{total_ms:.0f} / {total_ms / count:.1f}")
+
+    def write_report(self, json_path=None, prometheus_path=None, http_metrics=None):
+        """把汇总写入 JSON 文件和/或 Prometheus 文本文件（原子替换），返回汇总字典。"""
+        summary = self.summary(http_metrics)
+        if json_path:
+            atomic_write(json_path, json.dumps(summary, ensure_ascii=False, indent=2))
+        if prometheus_path:
+            atomic_write(prometheus_path, self.to_prometheus(http_metrics))
+        return summary
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    """返回进程内共享的 Metrics 实例。"""
+    return _metrics
+
+
+def write_metrics_report(options=None, http_metrics=None, metrics=None):
+    """
+    按 config.yml 的 metrics 段输出运行指标：file 为 JSON 汇总路径，prometheus_file 为
+    Prometheus 文本格式路径（为空时不输出）。返回汇总字典；两者均未配置时返回 None。
+    """
+    options = options or {}
+    metrics = metrics or _metrics
+    json_path = options.get("file") or None
+    prometheus_path = options.get("prometheus_file") or None
+    if not json_path and not prometheus_path:
+        return None
+    try:
+        summary = metrics.write_report(json_path, prometheus_path, http_metrics)
+    except OSError as e:
+        print(f"[指标] 写入运行指标失败: {e}")
+        return None
+    metrics.print_summary()
+    for path in (json_path, prometheus_path):
+        if path:
+            print(f"运行指标已保存至: {os.path.abspath(path)}")
+    return summary
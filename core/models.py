@@ -0,0 +1,122 @@
+# core/models.py
+import sys
+import hashlib
+
+DOMAIN_SUFFIX = "gdut-course-exporter"
+
+
+def normalize_text(s):
+    if s is None:
+        return ""
+    return str(s).strip().replace("\n", " ")
+
+
+def _uid_from_base(base):
+    # 去除空白和特殊字符
+    safe = ''.join(ch for ch in base if ch.isalnum() or ch in ('-', '_'))
+    # 确保不为空
+    if not safe:
+        safe = hashlib.sha1(base.encode('utf-8')).hexdigest()[:12]
+    return f"{safe}@{DOMAIN_SUFFIX}"
+
+
+def build_uid(name, date, periods):
+    # 使用课程名+日期+节次 生成可读且稳定的 UID
+    base = f"{normalize_text(name)}-{normalize_text(date)}-{normalize_text(periods)}".lower()
+    return _uid_from_base(base)
+
+
+def build_series_uid(name, teacher, weekday, periods):
+    # 每周重复系列的 UID：课程名+教师+星期+节次，带 weekly- 前缀以区别于单次课程
+    base = f"weekly-{normalize_text(name)}-{normalize_text(teacher)}-w{weekday}-{normalize_text(periods)}".lower()
+    return _uid_from_base(base)
+
+
+def event_content_hash(fields):
+    h = hashlib.sha256()
+    for item in fields:
+        if isinstance(item, str):
+            val = item
+        else:
+            val = str(item)
+        h.update(val.encode('utf-8'))
+        h.update(b"|")
+    return h.hexdigest()
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class CourseEvent:
+    """
+    单条课程事件。
+    使用 __slots__ 代替逐事件的 dict，并对重复出现的课程名/教师/地点等字符串做驻留，
+    UID 与内容哈希在首次使用时计算并缓存在对象上。
+    为兼容旧代码，仍支持 event['name'] / event.get('name') 形式的读取。
+    """
+
+    __slots__ = ("name", "teacher", "location", "periods", "date", "_uid", "_hash_key", "_content_hash")
+
+    FIELDS = ("name", "teacher", "location", "periods", "date")
+
+    def __init__(self, name, teacher, location, periods, date):
+        self.name = _intern(name)
+        self.teacher = _intern(teacher)
+        self.location = _intern(location)
+        self.periods = _intern(periods)
+        self.date = _intern(date)
+        self._uid = None
+        self._hash_key = None
+        self._content_hash = None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("name"), data.get("teacher"), data.get("location"), data.get("periods", ""), data.get("date"))
+
+    def to_dict(self):
+        return {"id": self.id, **{field: getattr(self, field) for field in self.FIELDS}}
+
+    @property
+    def id(self):
+        """去重用的唯一键，与旧版 dict 事件的 'id' 元组一致。"""
+        return (self.date, self.periods, self.name, self.teacher, self.location)
+
+    @property
+    def uid(self):
+        if self._uid is None:
+            self._uid = build_uid(self.name, self.date, self.periods)
+        return self._uid
+
+    def content_hash(self, start_iso, end_iso):
+        """事件内容哈希，字段顺序与 state 中已保存的哈希保持一致；按起止时间缓存。"""
+        key = (start_iso, end_iso)
+        if self._hash_key != key:
+            self._content_hash = event_content_hash([
+                self.name, self.date, self.periods, self.teacher, self.location, start_iso, end_iso
+            ])
+            self._hash_key = key
+        return self._content_hash
+
+    def get(self, key, default=None):
+        if key == "id":
+            return self.id
+        if key in self.FIELDS:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        if key == "id":
+            return self.id
+        if key in self.FIELDS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __eq__(self, other):
+        return isinstance(other, CourseEvent) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"CourseEvent({self.to_dict()!r})"
@@ -1,8 +1,23 @@
 # core/parser.py
+import html
 import json
 import re
+from datetime import date, timedelta
 from bs4 import BeautifulSoup
 
+from core.models import CourseEvent
+
+try:
+    import orjson
+except ImportError:  # 可选依赖：安装后自动使用更快的 JSON 解码器
+    orjson = None
+
+# 匹配第一个 <p> 开始标签，用于不构建 DOM 的快速提取
+_P_OPEN_TAG_RE = re.compile(r"<p(?:\s[^>]*)?>", re.I)
+
+def _silent(*args, **kwargs):
+    pass
+
 def _log_snippet(text, msg_prefix=""):
     """安全地记录文本片段用于调试"""
     if not text:
@@ -12,47 +27,157 @@ def _log_snippet(text, msg_prefix=""):
     snippet = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '?', text[:200])
     print(f"{msg_prefix}响应内容片段: {snippet}")
 
-def parse_schedule_data(response_text):
+def _json_loads(text):
+    """优先使用可选的 orjson 解码；其失败时再交给标准库，以保持原有的容错行为与报错信息。"""
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+def _extract_wrapped_json(response_text):
     """
-    健壮地解析课表数据。
-    优先尝试直接解析JSON，如果失败，则尝试从HTML的<p>标签中提取JSON。
+    不构建 DOM，直接定位 HTML 包装中第一个 <p> 标签内的文本并反转义。
+    找不到 <p> 标签或其中还嵌套了其他标签时返回 None，交由 BeautifulSoup 处理。
+    """
+    match = _P_OPEN_TAG_RE.search(response_text)
+    if not match:
+        return None
+    # 用 str.find 定位结束标签，避免惰性正则在长文本上逐字符回溯
+    start = match.end()
+    end = response_text.find("</p>", start)
+    if end < 0:
+        end = response_text.find("</P>", start)
+    if end < 0:
+        return None
+    inner = response_text[start:end]
+    if "<" in inner:
+        return None
+    return html.unescape(inner).strip()
+
+def _decode_schedule_payload(response_text, quiet=False):
     """
+    健壮地解码课表接口返回的 JSON。
+    1. 内容看起来是 JSON（以 [ 或 { 开头）时直接解析；
+    2. 否则用正则定位 HTML 中的 <p> 标签并解析其中的 JSON，无需构建 DOM；
+    3. 以上都失败时，回退到 BeautifulSoup 提取第一个 <p> 标签。
+    quiet=True 时只输出警告与错误。解析失败时返回 None。
+    """
+    log = _silent if quiet else print
     if not response_text or response_text.isspace():
         print("  警告：收到空的或仅包含空白字符的课表响应。")
-        return []
+        return None
 
     # 1. 尝试直接作为JSON解析 (适用于服务器环境)
-    try:
-        print("  尝试直接解析JSON数据...")
-        raw_data = json.loads(response_text)
-        print("  JSON数据解析成功。")
-    except json.JSONDecodeError as e1:
-        _log_snippet(response_text, "  直接解析JSON失败: ")
-        # 2. 如果直接解析失败，则尝试作为HTML解析 (适用于本地环境)
-        print("  尝试从HTML <p>标签中提取JSON...")
+    if response_text.lstrip()[:1] in ("[", "{"):
         try:
-            soup = BeautifulSoup(response_text, 'lxml')
-            p_tag = soup.find('p')
-            if p_tag:
-                json_string = p_tag.get_text(strip=True)
-                # 再次尝试解析提取出的字符串
-                raw_data = json.loads(json_string)
-                print("  从HTML中提取JSON并解析成功。")
-            else:
-                print("  在HTML响应中未找到<p>标签，无法提取JSON。")
-                _log_snippet(response_text)
-                return []
-        except json.JSONDecodeError as e2:
-            print(f"  从HTML <p>标签提取的文本也无法解析为JSON: {e2}")
-            _log_snippet(response_text)
-            return []
+            log("  尝试直接解析JSON数据...")
+            raw_data = _json_loads(response_text)
+            log("  JSON数据解析成功。")
+            return raw_data
+        except json.JSONDecodeError:
+            _log_snippet(response_text, "  直接解析JSON失败: ")
         except Exception as e:
-            print(f"  从HTML中提取并解析JSON时发生未预期错误: {e}")
+            print(f"  直接解析JSON时发生未预期错误: {e}")
             _log_snippet(response_text)
-            return []
+            return None
+
+    # 2. 快速路径：直接定位 HTML 包装中的 <p> 标签 (适用于本地环境)
+    json_string = _extract_wrapped_json(response_text)
+    if json_string is not None:
+        try:
+            raw_data = _json_loads(json_string)
+            log("  从HTML中提取JSON并解析成功。")
+            return raw_data
+        except json.JSONDecodeError:
+            pass
+
+    # 3. 回退：使用 BeautifulSoup 解析 HTML
+    log("  尝试从HTML <p>标签中提取JSON...")
+    try:
+        soup = BeautifulSoup(response_text, 'lxml')
+        p_tag = soup.find('p')
+        if p_tag:
+            json_string = p_tag.get_text(strip=True)
+            # 再次尝试解析提取出的字符串
+            raw_data = _json_loads(json_string)
+            log("  从HTML中提取JSON并解析成功。")
+            return raw_data
+        print("  在HTML响应中未找到<p>标签，无法提取JSON。")
+        _log_snippet(response_text)
+        return None
+    except json.JSONDecodeError as e2:
+        print(f"  从HTML <p>标签提取的文本也无法解析为JSON: {e2}")
+        _log_snippet(response_text)
+        return None
     except Exception as e:
-        print(f"  直接解析JSON时发生未预期错误: {e}")
+        print(f"  从HTML中提取并解析JSON时发生未预期错误: {e}")
         _log_snippet(response_text)
+        return None
+
+def extract_week_dates(response_text):
+    """从单周课表响应的日期映射中提取该周各天的日期字符串（升序），无法提取时返回空列表。"""
+    raw_data = _decode_schedule_payload(response_text, quiet=True)
+    if not isinstance(raw_data, list) or len(raw_data) < 2 or not isinstance(raw_data[1], list):
+        return []
+    return sorted(item['rq'] for item in raw_data[1] if isinstance(item, dict) and item.get('rq'))
+
+def inspect_week_payload(response_text):
+    """返回单周课表响应的 (课程数, 各天日期字符串升序列表)；无法解码时课程数为 None。"""
+    raw_data = _decode_schedule_payload(response_text, quiet=True)
+    if not isinstance(raw_data, list) or len(raw_data) < 2 or not isinstance(raw_data[0], list):
+        return None, []
+    dates = []
+    if isinstance(raw_data[1], list):
+        dates = sorted(item['rq'] for item in raw_data[1] if isinstance(item, dict) and item.get('rq'))
+    return len(raw_data[0]), dates
+
+def split_multi_week_payload(response_text, weeks, reference_week=None):
+    """
+    把多周（或整学期）课表响应拆分为与单周接口格式相同的 {week: 响应文本}，只保留 weeks 中的周次。
+    响应应为 [课程列表, 日期映射]，每门课程的 zc 字段为其所在周次；日期映射对应 reference_week
+    （默认为 weeks 中的第一周），其余周次的日期按相差的周数推算。格式不符时返回 None。
+    """
+    raw_data = _decode_schedule_payload(response_text, quiet=True)
+    if (not isinstance(raw_data, list) or len(raw_data) < 2
+            or not isinstance(raw_data[0], list) or not isinstance(raw_data[1], list)):
+        return None
+    courses_list, date_mapping_list = raw_data[0], raw_data[1]
+    try:
+        reference_dates = [(item['xqmc'], date.fromisoformat(item['rq'])) for item in date_mapping_list]
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not reference_dates:
+        return None
+
+    weeks = sorted(weeks)
+    courses_by_week = {week: [] for week in weeks}
+    for course in courses_list:
+        try:
+            week = int(course['zc'])
+        except (KeyError, TypeError, ValueError):
+            # 课程缺少周次时无法判断归属，整份响应不可用
+            return None
+        if week in courses_by_week:
+            courses_by_week[week].append(course)
+
+    reference_week = weeks[0] if reference_week is None else reference_week
+    split = {}
+    for week in weeks:
+        offset = timedelta(weeks=week - reference_week)
+        dates = [{"xqmc": name, "rq": (day + offset).isoformat()} for name, day in reference_dates]
+        split[week] = json.dumps([courses_by_week[week], dates], ensure_ascii=False)
+    return split
+
+def parse_schedule_data(response_text, quiet=False):
+    """
+    健壮地解析课表数据。
+    优先尝试直接解析JSON，如果失败，则尝试从HTML的<p>标签中提取JSON。
+    quiet=True 时只输出警告与错误，适合批量处理时减少日志量。
+    """
+    raw_data = _decode_schedule_payload(response_text, quiet=quiet)
+    if raw_data is None:
         return []
 
     # --- 后续的解析逻辑 ---
@@ -91,22 +216,13 @@ def parse_schedule_data(response_text):
             # print(f"  警告：无法为课程 '{course.get('kcmc', 'Unknown')}' 找到有效日期 (星期: {day_of_week})。")
             continue 
 
-        # 构建唯一ID和事件详情
-        unique_id = (
-            course_date_str,
-            course.get('jcdm'),
-            course.get('kcmc'),
-            course.get('teaxms'),
-            course.get('jxcdmc')
+        # 构建事件（唯一ID见 CourseEvent.id）
+        event_details = CourseEvent(
+            course.get('kcmc'), course.get('teaxms'), course.get('jxcdmc'),
+            course.get('jcdm'), course_date_str
         )
-        
-        event_details = {
-            "id": unique_id,
-            "name": course.get('kcmc'), "teacher": course.get('teaxms'),
-            "location": course.get('jxcdmc'), "periods": course.get('jcdm'),
-            "date": course_date_str
-        }
         events.append(event_details)
     
-    print(f"  成功解析出 {len(events)} 个课程事件。")
+    if not quiet:
+        print(f"  成功解析出 {len(events)} 个课程事件。")
     return events
\ No newline at end of file
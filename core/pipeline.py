@@ -0,0 +1,214 @@
+# core/pipeline.py
+import sys
+from importlib import import_module
+
+from core.ical_generator import compute_input_fingerprint, DEFAULT_CALENDAR_NAME
+from core.metrics import get_metrics
+from core.parser import parse_schedule_data, extract_week_dates
+from core.utils import get_current_academic_semester, compute_teaching_week
+
+_metrics = get_metrics()
+
+
+def load_provider(provider_name):
+    """按名称加载 providers 目录下的学校适配器配置。失败时抛出 ImportError/AttributeError。"""
+    provider_module = import_module(f"providers.{provider_name}")
+    return getattr(provider_module, f"{provider_name.upper()}_PROVIDER")
+
+
+def resolve_academic_semester(config):
+    """读取配置中的学期代码；为空或为 'auto' 时根据当前日期自动计算。"""
+    academic_year_semester = config.get("academic_year_semester")
+    if not academic_year_semester or str(academic_year_semester).lower() == 'auto':
+        return get_current_academic_semester(), True
+    return str(academic_year_semester), False
+
+
+def exit_login_failed():
+    """登录失败时输出排查提示并以状态码 1 退出（run.py 与 daemon.py 共用）。"""
+    print("[错误] 登录失败，流程终止。")
+    print("请检查以下几点：")
+    print("1. 账号和密码是否正确。")
+    print("2. 验证码是否能被正确识别（如果一直失败，可能是教务系统变更）。")
+    print("3. 网络连接是否正常。")
+    sys.exit(1)
+
+
+def current_teaching_week(weekly_responses):
+    """利用 {week: 原始响应} 中任意一周的日期映射推算当前教学周，无法推算时返回 None。"""
+    for week in sorted(weekly_responses, reverse=True):
+        if weekly_responses[week] is None:
+            continue
+        dates = extract_week_dates(weekly_responses[week])
+        if dates:
+            try:
+                return compute_teaching_week(week, dates)
+            except ValueError:
+                continue
+    return None
+
+
+def _current_teaching_week(cached_entries):
+    return current_teaching_week({week: entry["text"] for week, entry in cached_entries.items()})
+
+
+def _plan_semester_fetch(base_url, academic_year_semester, weeks, response_cache, account, force_refresh):
+    """返回 (weeks, cached_entries, served_from_cache, weeks_to_fetch)。"""
+    weeks = sorted(set(weeks))
+    cached_entries = {}
+    if response_cache and account:
+        cached_entries = response_cache.get_many(base_url, account, academic_year_semester, weeks)
+
+    served_from_cache = {}
+    if cached_entries and not force_refresh:
+        current_week = _current_teaching_week(cached_entries)
+        if current_week is not None:
+            served_from_cache = {
+                week: entry["text"] for week, entry in cached_entries.items() if week < current_week
+            }
+
+    weeks_to_fetch = [week for week in weeks if week not in served_from_cache]
+    return weeks, cached_entries, served_from_cache, weeks_to_fetch
+
+
+def _merge_semester_fetch(base_url, academic_year_semester, plan, fetched, response_cache, account):
+    """写回新获取的响应，并与缓存合并为 (responses, cached_weeks)。"""
+    weeks, cached_entries, served_from_cache, _ = plan
+    if response_cache and account:
+        succeeded = {week: text for week, text in fetched.items() if text is not None}
+        if succeeded:
+            response_cache.put_many(base_url, account, academic_year_semester, succeeded)
+
+    responses = {}
+    cached_weeks = sorted(served_from_cache)
+    for week in weeks:
+        if week in served_from_cache:
+            responses[week] = served_from_cache[week]
+        elif fetched.get(week) is None and week in cached_entries:
+            print(f"  第 {week} 周数据获取失败，回退使用上次缓存的数据。")
+            responses[week] = cached_entries[week]["text"]
+            cached_weeks.append(week)
+        else:
+            responses[week] = fetched.get(week)
+    if cached_weeks:
+        _metrics.increment("response_cache_weeks", len(cached_weeks))
+    return responses, sorted(cached_weeks)
+
+
+def _start_week_range_scan(scraper, academic_year_semester, plan, week_range, account):
+    """需要逐周请求时开始教学周范围扫描；未启用或多周接口可用（一次请求即可覆盖）时返回 None。"""
+    if week_range is None or not plan[3] or scraper.multi_week_available():
+        return None
+    return week_range.scan(scraper.base_url, account, academic_year_semester, plan[0], plan[2])
+
+
+def _finish_week_range_scan(scan, plan):
+    """结束扫描，并从计划中去掉被跳过的周次（它们不出现在结果中，也不算作获取失败）。"""
+    skipped = set(scan.finish())
+    weeks, cached_entries, served_from_cache, weeks_to_fetch = plan
+    return (
+        [week for week in weeks if week not in skipped], cached_entries, served_from_cache,
+        [week for week in weeks_to_fetch if week not in skipped],
+    )
+
+
+def fetch_semester_responses(scraper, academic_year_semester, weeks, max_workers=1,
+                             response_cache=None, account=None, force_refresh=False, week_range=None):
+    """
+    获取多个周次的原始课表响应，返回 (responses, cached_weeks)。
+    启用 response_cache 时，早于当前教学周的周次直接使用缓存（除非 force_refresh），
+    其余周次重新请求；请求失败但有缓存时回退使用旧缓存。
+    传入 week_range（WeekRangeDetector）时按周次顺序分批请求，识别出学期末的空周后停止，
+    被跳过的周次不出现在 responses 中。
+    """
+    plan = _plan_semester_fetch(scraper.base_url, academic_year_semester, weeks, response_cache, account, force_refresh)
+    scan = _start_week_range_scan(scraper, academic_year_semester, plan, week_range, account)
+    fetched = {}
+    if scan is not None:
+        while True:
+            batch = scan.next_batch(max_workers)
+            if not batch:
+                break
+            results = scraper.get_schedule_data_for_weeks(academic_year_semester, batch, max_workers=max_workers)
+            scan.record(results)
+            fetched.update(results)
+        plan = _finish_week_range_scan(scan, plan)
+    elif plan[3]:
+        fetched = scraper.get_schedule_data_for_weeks(academic_year_semester, plan[3], max_workers=max_workers)
+    return _merge_semester_fetch(scraper.base_url, academic_year_semester, plan, fetched, response_cache, account)
+
+
+async def fetch_semester_responses_async(scraper, academic_year_semester, weeks, max_workers=1,
+                                         response_cache=None, account=None, force_refresh=False, week_range=None):
+    """fetch_semester_responses 的异步版本，scraper 为 AsyncScraper。"""
+    plan = _plan_semester_fetch(scraper.base_url, academic_year_semester, weeks, response_cache, account, force_refresh)
+    scan = _start_week_range_scan(scraper, academic_year_semester, plan, week_range, account)
+    fetched = {}
+    if scan is not None:
+        while True:
+            batch = scan.next_batch(max_workers)
+            if not batch:
+                break
+            results = await scraper.get_schedule_data_for_weeks(academic_year_semester, batch, max_workers=max_workers)
+            scan.record(results)
+            fetched.update(results)
+        plan = _finish_week_range_scan(scan, plan)
+    elif plan[3]:
+        fetched = await scraper.get_schedule_data_for_weeks(academic_year_semester, plan[3], max_workers=max_workers)
+    return _merge_semester_fetch(scraper.base_url, academic_year_semester, plan, fetched, response_cache, account)
+
+
+def parse_semester_responses(weekly_responses, quiet=False):
+    """
+    按周次顺序解析原始响应并去重，返回 (事件列表, 获取失败的周次列表)。
+    quiet=True 时不输出逐周的解析进度，只保留警告。
+    """
+    all_semester_events = {}
+    failed_weeks = []
+    # 按周次顺序解析，保证去重结果与逐周获取时一致
+    for week in sorted(weekly_responses):
+        response_text = weekly_responses[week]
+        if response_text is not None: # 空字符串也是有效响应
+            if not quiet:
+                print(f"  解析第 {week} 周数据...")
+            with _metrics.span("parse_week", week=week):
+                weekly_events = parse_schedule_data(response_text, quiet=quiet)
+            if not weekly_events:
+                print(f"  警告：第 {week} 周数据解析后未生成任何事件。")
+            for event in weekly_events:
+                # 使用课程的唯一ID去重
+                all_semester_events[event.id] = event
+        else:
+            print(f"  第 {week} 周数据获取失败。")
+            failed_weeks.append(week)
+    return list(all_semester_events.values()), failed_weeks
+
+
+def semester_fingerprint(weekly_responses, class_time_map, timezone, calendar_name=DEFAULT_CALENDAR_NAME, recurrence=False):
+    """按周次顺序计算整个学期输入的指纹。"""
+    return compute_input_fingerprint(
+        (weekly_responses[week] for week in sorted(weekly_responses)),
+        class_time_map, timezone, calendar_name, recurrence=recurrence,
+    )
+
+
+def collect_semester_events(scraper, academic_year_semester, total_weeks, max_workers=1,
+                            response_cache=None, account=None, force_refresh=False, quiet=False, week_range=None):
+    """
+    获取并解析整个学期的课表，返回结果字典：
+    - events: 去重后的事件列表
+    - failed_weeks: 获取失败的周次
+    - cached_weeks: 使用缓存数据的周次
+    - responses: {week: 原始响应}，失败周次为 None
+    """
+    weekly_responses, cached_weeks = fetch_semester_responses(
+        scraper, academic_year_semester, range(1, total_weeks + 1), max_workers=max_workers,
+        response_cache=response_cache, account=account, force_refresh=force_refresh, week_range=week_range,
+    )
+    events, failed_weeks = parse_semester_responses(weekly_responses, quiet=quiet)
+    return {
+        "events": events,
+        "failed_weeks": failed_weeks,
+        "cached_weeks": cached_weeks,
+        "responses": weekly_responses,
+    }
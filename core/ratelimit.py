@@ -0,0 +1,154 @@
+# core/ratelimit.py
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# 遇到这些状态码时视为服务端暂时不可用，可以退避后重试
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+# 这些状态码说明服务端在主动限流，需要同时降低该主机的请求速率
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+class TokenBucket:
+    """
+    令牌桶：每秒补充 rate 个令牌，最多累积 burst 个。
+    速率会在服务端限流时下调，并在连续成功后逐步恢复到配置值（AIMD）。
+    """
+
+    def __init__(self, rate, burst=1):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated_at
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+
+    def reserve(self):
+        """预占一个令牌，返回调用方需要等待的秒数。"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            return max(wait, self._blocked_until - now)
+
+    def block_for(self, seconds):
+        """在 seconds 秒内暂停该主机的所有请求（例如服务端返回了 Retry-After）。"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def slow_down(self, factor=0.5, min_rate=0.2):
+        with self._lock:
+            self.rate = max(min_rate, self.rate * factor)
+
+    def speed_up(self, step=0.1):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + step)
+
+
+class RateLimiter:
+    """
+    按主机限速，并负责失败重试时的退避计算。
+    同一个实例可以在多个 Scraper 之间共享，从而让所有账号共同遵守每个主机的请求预算。
+    host_rates: {主机名: 每秒请求数}，未列出的主机使用 default_rate。
+    """
+
+    def __init__(self, host_rates=None, default_rate=4.0, burst=2, max_retries=3, backoff_base=0.5, backoff_max=30.0):
+        self.host_rates = dict(host_rates or {})
+        self.default_rate = float(default_rate)
+        self.burst = burst
+        self.max_retries = int(max_retries)
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, options=None, provider_config=None):
+        """
+        根据 config.yml 的 rate_limit 段与适配器中声明的 rate_limits 构造限速器。
+        config.yml 中的主机配置优先于适配器的默认值。
+        """
+        options = options or {}
+        host_rates = dict((provider_config or {}).get("rate_limits", {}))
+        host_rates.update(options.get("hosts") or {})
+        return cls(
+            host_rates=host_rates,
+            default_rate=options.get("requests_per_second", 4.0),
+            burst=options.get("burst", 2),
+            max_retries=options.get("max_retries", 3),
+            backoff_base=options.get("backoff_base", 0.5),
+            backoff_max=options.get("backoff_max", 30.0),
+        )
+
+    def _bucket(self, url):
+        host = urlparse(url).hostname or ""
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                rate = self.host_rates.get(host, self.default_rate)
+                bucket = TokenBucket(rate, self.burst)
+                self._buckets[host] = bucket
+            return bucket
+
+    def reserve(self, url):
+        """预占该主机的一个请求令牌，返回需要等待的秒数（异步调用方据此自行等待）。"""
+        return self._bucket(url).reserve()
+
+    def acquire(self, url):
+        """阻塞直到该主机的请求预算允许发出下一个请求。"""
+        wait = self.reserve(url)
+        if wait > 0:
+            time.sleep(wait)
+
+    def record_success(self, url):
+        self._bucket(url).speed_up()
+
+    def record_throttle(self, url, retry_after=None):
+        bucket = self._bucket(url)
+        bucket.slow_down()
+        if retry_after:
+            bucket.block_for(min(retry_after, self.backoff_max))
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """
+        第 attempt 次（从 0 开始）失败后的等待时间：带等值抖动（equal jitter）的指数退避，在 [上限/2, 上限] 内随机取值。
+        服务端给出 Retry-After 时以其为准（不超过 backoff_max）。
+        """
+        if retry_after is not None:
+            return min(max(0.0, retry_after), self.backoff_max)
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def sleep_backoff(self, attempt, retry_after=None):
+        delay = self.backoff_delay(attempt, retry_after)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 头，支持秒数与 HTTP 日期两种格式；无法解析时返回 None。"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,96 @@
+# core/recurrence.py
+from collections import Counter
+from datetime import date, timedelta
+
+from core.models import build_series_uid, event_content_hash
+
+
+class CourseSeries:
+    """
+    同一课程在固定星期、固定节次上的每周重复（对应一个带 RRULE 的 VEVENT）。
+    - 出现次数最多的地点作为系列地点，其余地点的那几次课输出为 RECURRENCE-ID 覆盖；
+    - 首末两次课之间缺少的周次输出为 EXDATE。
+    """
+
+    __slots__ = ("name", "teacher", "periods", "weekday", "occurrences", "location", "_uid")
+
+    def __init__(self, name, teacher, periods, weekday, occurrences):
+        self.name = name
+        self.teacher = teacher
+        self.periods = periods
+        self.weekday = weekday
+        self.occurrences = sorted(occurrences, key=lambda e: e.date)
+        # 次数相同时取较早出现的地点
+        self.location = Counter(e.location for e in self.occurrences).most_common(1)[0][0]
+        self._uid = None
+
+    @property
+    def uid(self):
+        if self._uid is None:
+            self._uid = build_series_uid(self.name, self.teacher, self.weekday, self.periods)
+        return self._uid
+
+    @property
+    def first(self):
+        return self.occurrences[0]
+
+    @property
+    def count(self):
+        """RRULE 的 COUNT：首末两次课之间（含）的周数。"""
+        first = date.fromisoformat(self.occurrences[0].date)
+        last = date.fromisoformat(self.occurrences[-1].date)
+        return (last - first).days // 7 + 1
+
+    def excluded_dates(self):
+        """首末两次课之间没有上课的日期（'YYYY-MM-DD'）。"""
+        first = date.fromisoformat(self.occurrences[0].date)
+        present = {e.date for e in self.occurrences}
+        week_dates = ((first + timedelta(weeks=i)).isoformat() for i in range(self.count))
+        return [d for d in week_dates if d not in present]
+
+    def overrides(self):
+        """地点与系列地点不同的单次课程。"""
+        return [e for e in self.occurrences if e.location != self.location]
+
+    def content_hash(self, start_iso, end_iso):
+        """系列内容哈希：任何一次课的增删或地点变化都会使其改变。"""
+        return event_content_hash([
+            "weekly", self.name, self.teacher, self.location, self.periods, start_iso, end_iso, self.count,
+            ",".join(self.excluded_dates()),
+            ",".join(f"{e.date}={e.location}" for e in self.overrides()),
+        ])
+
+    def __repr__(self):
+        return f"CourseSeries({self.name!r}, {self.teacher!r}, weekday={self.weekday}, periods={self.periods!r}, count={len(self.occurrences)})"
+
+
+def group_weekly_series(events):
+    """
+    按 (课程名, 教师, 星期, 节次) 将事件合并为每周重复的系列，返回 (系列列表, 单独输出的事件列表)。
+    只出现一次的课程、日期无法解析的事件，以及同一系列同一天的重复事件（仅地点不同）不参与合并。
+    """
+    groups = {}
+    singles = []
+    for event in events:
+        try:
+            weekday = date.fromisoformat(event.date).weekday()
+        except (TypeError, ValueError):
+            singles.append(event)
+            continue
+        groups.setdefault((event.name, event.teacher, weekday, event.periods), []).append(event)
+
+    series_list = []
+    for (name, teacher, weekday, periods), members in groups.items():
+        by_date = {}
+        for event in members:
+            if event.date in by_date:
+                singles.append(event)
+            else:
+                by_date[event.date] = event
+        if len(by_date) == 1:
+            singles.extend(by_date.values())
+            continue
+        series_list.append(CourseSeries(name, teacher, periods, weekday, by_date.values()))
+
+    series_list.sort(key=lambda s: (s.first.date, s.periods, s.name or ""))
+    return series_list, singles
@@ -0,0 +1,82 @@
+# core/response_cache.py
+import os
+import json
+import time
+import hashlib
+import threading
+
+from core.utils import atomic_write
+
+
+class ResponseCache:
+    """
+    周课表原始响应缓存。
+    - 正文按 SHA-256 内容寻址保存在 blobs/ 下，相同内容只存一份；
+    - 每个 (站点, 账号, 学期) 对应一个索引文件，记录各周次的内容哈希与获取时间。
+    """
+
+    def __init__(self, cache_dir=".response_cache"):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, options):
+        """根据 config.yml 的 response_cache 段构造缓存；未启用时返回 None。"""
+        options = options or {}
+        if not options.get("enabled", False):
+            return None
+        return cls(options.get("dir", ".response_cache"))
+
+    def _index_path(self, site, account, xnxqdm):
+        key = hashlib.sha256(f"{site}|{account}|{xnxqdm}".encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.cache_dir, "index", f"{key}.json")
+
+    def _blob_path(self, content_hash):
+        return os.path.join(self.cache_dir, "blobs", f"{content_hash}.txt")
+
+    def _load_index(self, site, account, xnxqdm):
+        path = self._index_path(site, account, xnxqdm)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception as e:
+            print(f"[cache] 读取响应缓存索引失败，将忽略缓存: {e}")
+            return {}
+
+    def get_many(self, site, account, xnxqdm, weeks):
+        """一次读取多个周次的缓存，返回 {week: entry}，仅包含命中的周次。"""
+        results = {}
+        index = self._load_index(site, account, xnxqdm)
+        for week in weeks:
+            entry = index.get(str(week))
+            if not entry:
+                continue
+            try:
+                with open(self._blob_path(entry["hash"]), "r", encoding="utf-8", newline="") as f:
+                    results[week] = {"text": f.read(), "hash": entry["hash"], "fetched_at": entry.get("fetched_at", 0)}
+            except (OSError, KeyError):
+                continue
+        return results
+
+    def put_many(self, site, account, xnxqdm, responses):
+        """
+        写入多个周次的响应 {week: text}，返回内容发生变化的周次列表。
+        """
+        changed = []
+        with self._lock:
+            index = self._load_index(site, account, xnxqdm)
+            now = time.time()
+            for week, text in responses.items():
+                content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                blob_path = self._blob_path(content_hash)
+                if not os.path.exists(blob_path):
+                    atomic_write(blob_path, text)
+                previous = index.get(str(week))
+                if not previous or previous.get("hash") != content_hash:
+                    changed.append(week)
+                index[str(week)] = {"hash": content_hash, "fetched_at": now}
+            atomic_write(self._index_path(site, account, xnxqdm), json.dumps(index, sort_keys=True))
+        return changed
@@ -1,79 +1,124 @@
 # core/scraper.py
-import io
 import os
 import re
 import time
 import base64
 import random
-from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
 
-import ddddocr
 import requests
+from requests.cookies import create_cookie
 import urllib3
 from bs4 import BeautifulSoup
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad
-from PIL import Image, ImageOps
 
-if not hasattr(Image, 'ANTIALIAS'):
-    setattr(Image, 'ANTIALIAS', Image.LANCZOS)
+from core.captcha import CaptchaSolver, get_shared_ocr
+from core.http import build_http_adapter
+from core.metrics import get_metrics
+from core.parser import split_multi_week_payload
+from core.ratelimit import RateLimiter, RETRYABLE_STATUS_CODES, THROTTLE_STATUS_CODES, parse_retry_after
 
-class Scraper:
-    def __init__(self, provider_config):
+# 只有幂等请求才会在 5xx/超时后自动重试，登录表单等 POST 请求交由上层逻辑决定
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# 会话失效时欢迎页中会出现的内容（非法访问提示、登录表单、验证码地址）
+SESSION_INVALID_MARKERS = ("非法访问", "pwdFromId", "/yzm")
+
+# 适配器未声明 schedule_endpoints 时使用的单周课表接口
+DEFAULT_WEEK_ENDPOINT = "xsgrkbcx!getKbRq.action?xnxqdm={xnxqdm}&zc={week}"
+
+# 这些状态码说明多周接口不存在，之后不再尝试
+MULTI_WEEK_UNSUPPORTED_STATUS_CODES = (400, 404, 405, 501)
+
+_metrics = get_metrics()
+
+
+class ScraperBase:
+    """
+    Scraper 与 AsyncScraper 共用的部分：适配器配置、登录状态、验证码识别，
+    以及不涉及网络请求的页面解析与加密辅助方法。
+    """
+
+    def __init__(self, provider_config, rate_limiter=None, ocr=None, session_cache=None, captcha_solver=None):
         self.base_url = provider_config["base_url"]
         self.headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36'}
-        self.session = requests.Session()
-        self.session.headers.update(self.headers)
-        # The unsupported 'show_ad' argument has been removed below
-        self.ocr = ddddocr.DdddOcr()
+        self._ocr = ocr
         self.provider_config = provider_config
-        self.session.verify = provider_config.get("ssl_verify", True)
+        self.rate_limiter = rate_limiter or RateLimiter.from_config(None, provider_config)
         self._environment_checked = False
         self._last_captcha_bytes = None
         self._last_captcha_note = None
+        self._last_captcha_variant = None
+        self.captcha_solver = captcha_solver or CaptchaSolver()
         self._captcha_debug_dir = os.path.abspath("debug_captchas")
-        self._ssl_verification_disabled = not self.session.verify
+        self._ssl_verification_disabled = not provider_config.get("ssl_verify", True)
         self._legacy_login_allowed = provider_config.get("legacy_login_allowed", True)
         self._sso_login_url = provider_config.get("sso_login_url")
         self._sso_service_url = provider_config.get("sso_service_url", f"{self.base_url}/new/ssoLogin")
         self._use_sso_login = bool(self._sso_login_url)
         self._sso_redirect_url = None
-
-        if not self.session.verify:
-            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-    def _request(self, method, url, **kwargs):
-        """统一处理请求，并在允许时对证书问题做一次不校验证书的回退。"""
-        try:
-            return self.session.request(method, url, **kwargs)
-        except requests.exceptions.SSLError as e:
-            if self.provider_config.get("allow_insecure_ssl_fallback", False) and not self._ssl_verification_disabled:
-                self._ssl_verification_disabled = True
-                self.session.verify = False
-                urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-                print("检测到证书校验失败，已回退为不校验证书继续访问。")
-                return self.session.request(method, url, **kwargs)
-            raise e
-
-    def _probe_login_environment(self):
-        """检测当前学校站点主入口和脚本使用的旧登录链路是否一致。"""
-        if self._environment_checked:
-            return
-
+        self._session_cache = session_cache
+        self._schedule_endpoints = provider_config.get("schedule_endpoints") or {}
+
+    @property
+    def ocr(self):
+        """验证码识别引擎，未显式传入时在第一次访问时加载共享模型。"""
+        if self._ocr is None:
+            self._ocr = get_shared_ocr()
+        return self._ocr
+
+    def _cookie_jar(self):
+        """当前会话的 http.cookiejar.CookieJar，由子类提供。"""
+        raise NotImplementedError
+
+    def _disable_ssl_verification(self):
+        """关闭证书校验（证书回退或恢复的会话快照要求时），由子类提供。"""
+        raise NotImplementedError
+
+    def export_session_state(self):
+        """导出可持久化的会话快照：Cookie、检测到的登录方式与证书回退状态。"""
+        cookies = [
+            {
+                "name": c.name, "value": c.value, "domain": c.domain, "path": c.path,
+                "secure": c.secure, "expires": c.expires,
+            }
+            for c in self._cookie_jar()
+        ]
+        return {
+            "cookies": cookies,
+            "use_sso_login": self._use_sso_login,
+            "sso_login_url": self._sso_login_url,
+            "sso_redirect_url": self._sso_redirect_url,
+            "ssl_verification_disabled": self._ssl_verification_disabled,
+        }
+
+    def restore_session_state(self, snapshot):
+        """从 export_session_state 生成的快照恢复会话，跳过登录环境探测。"""
+        jar = self._cookie_jar()
+        jar.clear()
+        for c in snapshot.get("cookies", []):
+            jar.set_cookie(create_cookie(
+                c["name"], c["value"], domain=c.get("domain", ""), path=c.get("path", "/"),
+                secure=c.get("secure", False), expires=c.get("expires"),
+            ))
+        self._use_sso_login = snapshot.get("use_sso_login", self._use_sso_login)
+        self._sso_login_url = snapshot.get("sso_login_url") or self._sso_login_url
+        self._sso_redirect_url = snapshot.get("sso_redirect_url")
         self._environment_checked = True
-        try:
-            response = self._request("GET", self.base_url, timeout=10, allow_redirects=False)
-            location = response.headers.get("Location", "")
-            if response.is_redirect and "authserver" in location:
-                self._sso_redirect_url = location
-                self._use_sso_login = True
-                print("检测到学校主入口已切换到统一身份认证（SSO）。")
-                print(f"  当前主入口跳转至: {location}")
-                if not self._sso_login_url:
-                    self._sso_login_url = location.split("?", 1)[0]
-                print("  当前将优先使用 SSO 登录，再进入教务系统。")
-        except requests.exceptions.RequestException as e:
-            print(f"登录环境探测失败，跳过主入口检查: {e}")
+        if snapshot.get("ssl_verification_disabled") and not self._ssl_verification_disabled:
+            self._disable_ssl_verification()
+
+    def _note_sso_redirect(self, location):
+        """主入口跳转到统一身份认证时，记录跳转地址并切换为 SSO 登录。"""
+        self._sso_redirect_url = location
+        self._use_sso_login = True
+        print("检测到学校主入口已切换到统一身份认证（SSO）。")
+        print(f"  当前主入口跳转至: {location}")
+        if not self._sso_login_url:
+            self._sso_login_url = location.split("?", 1)[0]
+        print("  当前将优先使用 SSO 登录，再进入教务系统。")
 
     def _extract_script_var(self, html_text, var_name):
         pattern = rf'var\s+{re.escape(var_name)}\s*=\s*"([^"]*)"'
@@ -108,6 +153,274 @@ class Scraper:
                     return text
         return None
 
+    def _parse_sso_login_page(self, login_html):
+        """解析 SSO 登录页，返回 (soup, 用户名密码表单)；找不到表单时后者为 None。"""
+        soup = BeautifulSoup(login_html, "lxml")
+        return soup, soup.find("form", id="pwdFromId")
+
+    def _build_sso_form_data(self, soup, pwd_form, account, password):
+        """按登录页表单组装提交数据，密码使用页面提供的盐加密。"""
+        form_data = {
+            tag.get("name"): tag.get("value", "")
+            for tag in pwd_form.find_all("input")
+            if tag.get("name")
+        }
+        password_salt = soup.find("input", id="pwdEncryptSalt").get("value", "")
+        form_data["username"] = account
+        form_data["password"] = self._encrypt_sso_password(password, password_salt)
+        form_data.pop("passwordText", None)
+        form_data.pop("rememberMe", None)
+        return form_data
+
+    def _is_jxfw_url(self, url):
+        """判断 url 是否位于教务系统（适配器 base_url 所在的主机）。"""
+        return urlsplit(url).netloc == urlsplit(self.base_url).netloc
+
+    def _build_legacy_login_data(self, account, password, verify_code):
+        # 根据登录验证逻辑准备16字节的AES密钥 ↓↓↓ ---
+        encryption_key = (verify_code * 4)[:16]
+        password_encrypted = self.provider_config["encrypt_password_func"](password, encryption_key)
+        return {'account': account, 'pwd': password_encrypted, 'verifycode': verify_code}
+
+    def _handle_legacy_login_result(self, response_json, verify_code):
+        """
+        处理旧教务登录接口返回的 JSON，并记录验证码识别结果是否被接受。
+        返回 True 表示登录成功，False 表示账号或密码错误（重试无意义），None 表示可以重试。
+        """
+        code = response_json.get("code", -1)
+        message = response_json.get('message', '未知错误')
+        if code >= 0:
+            self.captcha_solver.record_outcome(
+                self._last_captcha_variant, True, self._last_captcha_bytes, verify_code
+            )
+            print("登录成功！")
+            return True
+        # 登录失败
+        # 尝试提供更具体的错误信息
+        if "验证码" in message or code == -3:
+            self.captcha_solver.record_outcome(
+                self._last_captcha_variant, False, self._last_captcha_bytes, verify_code
+            )
+            print(f"  登录失败: 验证码错误。OCR 结果可能失准，或旧接口校验规则已调整。")
+            saved_path = self._save_last_captcha_sample("captcha_rejected")
+            if saved_path:
+                self._last_captcha_note = saved_path
+                print(f"  本次被拒绝的验证码样本已保存至: {saved_path}")
+            # 验证码错误，应在下次尝试时重新获取
+        elif "密码" in message or "用户" in message or code in [-1, -2]:
+            print(f"  登录失败: 账号或密码错误。请检查配置。")
+            # 账号密码错误，重试无意义，可以直接返回失败
+            return False
+        else:
+            print(f"  登录失败: {message} (错误代码: {code})")
+        # 进行下次登录尝试（包括重新获取验证码）
+        return None
+
+    def _save_last_captcha_sample(self, reason):
+        """保存最近一次验证码图片，便于人工核对 OCR 是否失准。"""
+        if not self._last_captcha_bytes:
+            return None
+
+        os.makedirs(self._captcha_debug_dir, exist_ok=True)
+        safe_reason = re.sub(r"[^A-Za-z0-9_-]", "_", reason)[:40] or "unknown"
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        output_path = os.path.join(self._captcha_debug_dir, f"{timestamp}_{safe_reason}.jpg")
+        with open(output_path, "wb") as f:
+            f.write(self._last_captcha_bytes)
+        return output_path
+
+    def _record_week_fetch(self, week, started, attempts, body_bytes):
+        """记录一次周课表获取的耗时、重试次数与响应大小；body_bytes 为 None 表示获取失败。"""
+        _metrics.observe("fetch_week", time.perf_counter() - started, week=week)
+        _metrics.increment("fetch_week_result", result="failed" if body_bytes is None else "ok")
+        if attempts > 1:
+            _metrics.increment("fetch_week_retries", attempts - 1, week=week)
+        if body_bytes is not None:
+            _metrics.increment("fetch_week_bytes", body_bytes, week=week)
+
+    # 各教务系统的多周接口是否可用（按 base_url 在进程内共享，批量导出时只需探测一次）
+    _multi_week_support = {}
+
+    def _week_url(self, academic_year, week):
+        template = self._schedule_endpoints.get("week") or DEFAULT_WEEK_ENDPOINT
+        return f"{self.base_url}/{template.format(xnxqdm=academic_year, week=week)}"
+
+    def multi_week_available(self):
+        """适配器声明了多周接口，且尚未探测到该教务系统不支持时返回 True。"""
+        return bool(self._schedule_endpoints.get("multi_week")) and \
+            ScraperBase._multi_week_support.get(self.base_url) is not False
+
+    def _multi_week_batches(self, weeks):
+        """按适配器声明的多周接口把升序的 weeks 分组；接口不可用或只有一周时返回空列表。"""
+        if len(weeks) < 2 or not self.multi_week_available():
+            return []
+        spec = self._schedule_endpoints["multi_week"]
+        size = spec.get("max_weeks") or len(weeks)
+        if "{weeks}" not in spec["url"]:
+            # 整学期接口一次即可覆盖所有周次
+            size = len(weeks)
+        return [weeks[start:start + size] for start in range(0, len(weeks), size)]
+
+    def _multi_week_url(self, academic_year, weeks):
+        path = self._schedule_endpoints["multi_week"]["url"].format(
+            xnxqdm=academic_year, weeks=",".join(str(week) for week in weeks),
+        )
+        return f"{self.base_url}/{path}"
+
+    def _mark_multi_week_unsupported(self, reason):
+        print(f"  多周课表接口不可用（{reason}），之后改为逐周获取。")
+        ScraperBase._multi_week_support[self.base_url] = False
+        _metrics.increment("fetch_multi_week_result", result="unsupported")
+
+    def _accept_multi_week_response(self, weeks, started, status_code, response_text, body_bytes):
+        """
+        校验并拆分多周接口的响应，返回 {week: 单周响应}；不可用时返回 None，由调用方逐周获取。
+        接口不存在或响应格式无法拆分时，记住该教务系统不支持多周查询。
+        """
+        _metrics.observe("fetch_multi_week", time.perf_counter() - started)
+        if status_code in MULTI_WEEK_UNSUPPORTED_STATUS_CODES:
+            self._mark_multi_week_unsupported(f"HTTP {status_code}")
+            return None
+        if status_code != 200:
+            print(f"  多周课表接口请求失败，HTTP状态码: {status_code}")
+            _metrics.increment("fetch_multi_week_result", result="failed")
+            return None
+        if response_text.lstrip().startswith("<!DOCTYPE") or "非法访问" in response_text:
+            print("  多周课表接口返回了非法访问页面，而不是课表数据。")
+            _metrics.increment("fetch_multi_week_result", result="failed")
+            return None
+
+        spec = self._schedule_endpoints["multi_week"]
+        split = split_multi_week_payload(response_text, weeks, spec.get("dates_week"))
+        if split is None:
+            self._mark_multi_week_unsupported("响应格式无法按周拆分")
+            return None
+        ScraperBase._multi_week_support[self.base_url] = True
+        print(f"  第 {weeks[0]}-{weeks[-1]} 周课表数据通过多周接口获取成功。")
+        _metrics.increment("fetch_multi_week_result", result="ok")
+        _metrics.increment("fetch_multi_week_weeks", len(weeks))
+        _metrics.increment("fetch_multi_week_bytes", body_bytes)
+        return split
+
+    def _solve_captcha(self, image_bytes):
+        """识别验证码图片，返回 (code, label, observed)；首次调用时会加载 OCR 模型。"""
+        return self.captcha_solver.solve(self.ocr, image_bytes)
+
+    def _report_captcha_failure(self, observed_results):
+        print("    验证码识别失败，未得到4位字母数字结果。")
+        print(f"    OCR 候选结果: {' | '.join(observed_results)}")
+        saved_path = self._save_last_captcha_sample("ocr_failed")
+        if saved_path:
+            self._last_captcha_note = saved_path
+            print(f"    已保存失败验证码样本: {saved_path}")
+
+
+class Scraper(ScraperBase):
+    def __init__(self, provider_config, rate_limiter=None, ocr=None, http_adapter=None, session_cache=None, captcha_solver=None):
+        """
+        rate_limiter: 可在多个实例间共享的 RateLimiter，默认按适配器配置新建。
+        ocr: 可选的 ddddocr.DdddOcr 实例；默认在第一次识别验证码时才加载进程内共享的模型。
+        http_adapter: 可共享的 requests HTTPAdapter，多个会话共用同一个连接池，
+                      而 Cookie 仍然保存在各自的 Session 中互不影响。默认新建一个 TimingHTTPAdapter，
+                      为每个请求记录 DNS/连接/TLS/首字节耗时。
+        session_cache: 可选的 SessionCache，命中且验证有效时跳过完整登录流程。
+        captcha_solver: 可共享的 CaptchaSolver（多版本并发识别、自适应尝试顺序），默认逐个版本顺序识别。
+        """
+        super().__init__(provider_config, rate_limiter, ocr, session_cache, captcha_solver)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.http_adapter = http_adapter if http_adapter is not None else build_http_adapter()
+        self.session.mount("http://", self.http_adapter)
+        self.session.mount("https://", self.http_adapter)
+        self.session.verify = not self._ssl_verification_disabled
+
+        if not self.session.verify:
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    def _cookie_jar(self):
+        return self.session.cookies
+
+    def _disable_ssl_verification(self):
+        self._ssl_verification_disabled = True
+        self.session.verify = False
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    def _send(self, method, url, **kwargs):
+        """发送单个请求，并在允许时对证书问题做一次不校验证书的回退。"""
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.SSLError as e:
+            if self.provider_config.get("allow_insecure_ssl_fallback", False) and not self._ssl_verification_disabled:
+                self._disable_ssl_verification()
+                print("检测到证书校验失败，已回退为不校验证书继续访问。")
+                started = time.perf_counter()
+                response = self.session.request(method, url, **kwargs)
+            else:
+                raise e
+        # 共享的 TimingHTTPAdapter 汇总各请求的耗时；普通 HTTPAdapter 不做记录
+        record = getattr(self.http_adapter, "record", None)
+        if record is not None:
+            record(response, time.perf_counter() - started)
+        return response
+
+    def _request(self, method, url, **kwargs):
+        """
+        统一处理请求：按主机限速，幂等请求遇到 5xx/超时/连接错误时
+        按带抖动的指数退避自动重试，并遵守服务端返回的 Retry-After。
+        """
+        limiter = self.rate_limiter
+        retries = limiter.max_retries if method.upper() in IDEMPOTENT_METHODS else 0
+        for attempt in range(retries + 1):
+            limiter.acquire(url)
+            try:
+                response = self._send(method, url, **kwargs)
+            except requests.exceptions.SSLError:
+                raise
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                if attempt >= retries:
+                    raise
+                _metrics.increment("http_retries", reason=type(e).__name__)
+                delay = limiter.sleep_backoff(attempt)
+                print(f"  请求失败（{type(e).__name__}），已等待{delay:.1f}秒后重试...")
+                continue
+
+            _metrics.increment("http_responses", status=response.status_code)
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if response.status_code in THROTTLE_STATUS_CODES:
+                    limiter.record_throttle(url, retry_after)
+                if attempt < retries:
+                    _metrics.increment("http_retries", reason=str(response.status_code))
+                    delay = limiter.sleep_backoff(attempt, retry_after)
+                    print(f"  服务端返回 HTTP {response.status_code}，已等待{delay:.1f}秒后重试...")
+                    continue
+                return response
+
+            limiter.record_success(url)
+            return response
+
+    def _wait_before_retry(self, attempt, action, indent="  "):
+        """按退避策略等待后再进行下一次尝试，取代固定时长的 sleep。attempt 从 1 开始。"""
+        delay = self.rate_limiter.backoff_delay(attempt - 1)
+        print(f"{indent}等待{delay:.1f}秒后{action}...")
+        time.sleep(delay)
+
+    def _probe_login_environment(self):
+        """检测当前学校站点主入口和脚本使用的旧登录链路是否一致。"""
+        if self._environment_checked:
+            return
+
+        self._environment_checked = True
+        try:
+            with _metrics.span("login_step", step="probe"):
+                response = self._request("GET", self.base_url, timeout=10, allow_redirects=False)
+            location = response.headers.get("Location", "")
+            if response.is_redirect and "authserver" in location:
+                self._note_sso_redirect(location)
+        except requests.exceptions.RequestException as e:
+            print(f"登录环境探测失败，跳过主入口检查: {e}")
+
     def _check_sso_captcha_requirement(self, account):
         if not self._sso_login_url:
             return False, ""
@@ -115,7 +428,8 @@ class Scraper:
         auth_base = self._sso_login_url.rsplit("/", 1)[0]
         check_url = f"{auth_base}/checkNeedCaptcha.htl"
         try:
-            response = self._request("GET", check_url, params={"username": account}, timeout=10)
+            with _metrics.span("login_step", step="sso_captcha_check"):
+                response = self._request("GET", check_url, params={"username": account}, timeout=10)
             response.raise_for_status()
             response_json = response.json()
             return bool(response_json.get("isNeed")), ""
@@ -124,9 +438,10 @@ class Scraper:
 
     def _follow_sso_success_redirect(self, redirect_url):
         try:
-            final_response = self._request("GET", redirect_url, timeout=20, allow_redirects=True)
+            with _metrics.span("login_step", step="sso_redirect"):
+                final_response = self._request("GET", redirect_url, timeout=20, allow_redirects=True)
             print(f"  SSO 跳转完成，当前页面: {final_response.url}")
-            if "jxfw.gdut.edu.cn" in final_response.url:
+            if self._is_jxfw_url(final_response.url):
                 return True
             print("  SSO 登录后未进入教务系统目标页。")
             return False
@@ -142,15 +457,15 @@ class Scraper:
 
         print("正在尝试通过统一身份认证（SSO）登录...")
         try:
-            login_page_response = self._request("GET", sso_login_url, timeout=20)
+            with _metrics.span("login_step", step="sso_page"):
+                login_page_response = self._request("GET", sso_login_url, timeout=20)
             login_page_response.raise_for_status()
         except requests.exceptions.RequestException as e:
             print(f"  获取 SSO 登录页失败: {e}")
             return False
 
         login_html = login_page_response.text
-        soup = BeautifulSoup(login_html, "lxml")
-        pwd_form = soup.find("form", id="pwdFromId")
+        soup, pwd_form = self._parse_sso_login_page(login_html)
         if not pwd_form:
             print("  未在 SSO 登录页找到用户名密码登录表单。")
             return False
@@ -170,28 +485,21 @@ class Scraper:
             return False
 
         try:
-            form_data = {
-                tag.get("name"): tag.get("value", "")
-                for tag in pwd_form.find_all("input")
-                if tag.get("name")
-            }
-            password_salt = soup.find("input", id="pwdEncryptSalt").get("value", "")
-            form_data["username"] = account
-            form_data["password"] = self._encrypt_sso_password(password, password_salt)
-            form_data.pop("passwordText", None)
-            form_data.pop("rememberMe", None)
+            with _metrics.span("login_step", step="sso_encrypt"):
+                form_data = self._build_sso_form_data(soup, pwd_form, account, password)
         except Exception as e:
             print(f"  组装 SSO 登录表单失败: {e}")
             return False
 
         try:
-            login_response = self._request(
-                "POST",
-                sso_login_url,
-                data=form_data,
-                timeout=20,
-                allow_redirects=False
-            )
+            with _metrics.span("login_step", step="sso_submit"):
+                login_response = self._request(
+                    "POST",
+                    sso_login_url,
+                    data=form_data,
+                    timeout=20,
+                    allow_redirects=False
+                )
         except requests.exceptions.RequestException as e:
             print(f"  提交 SSO 登录表单失败: {e}")
             return False
@@ -216,56 +524,6 @@ class Scraper:
         print(f"  响应前200字符: {login_response.text[:200]}")
         return False
 
-    def _normalize_ocr_text(self, text):
-        """过滤 OCR 结果中的噪声字符，仅保留字母和数字。"""
-        if text is None:
-            return ""
-        return re.sub(r"[^A-Za-z0-9]", "", str(text)).strip()
-
-    def _image_to_png_bytes(self, image):
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        return buffer.getvalue()
-
-    def _build_ocr_candidates(self, image_bytes):
-        """
-        为同一张验证码生成多种预处理版本，提升旧接口验证码的识别率。
-        返回 [(label, image_bytes), ...]。
-        """
-        candidates = [("raw", image_bytes)]
-        try:
-            base = Image.open(io.BytesIO(image_bytes)).convert("L")
-            autocontrast = ImageOps.autocontrast(base)
-            enlarged = autocontrast.resize((base.width * 2, base.height * 2), Image.LANCZOS)
-            threshold = autocontrast.point(lambda p: 255 if p > 150 else 0).convert("L")
-            threshold_enlarged = enlarged.point(lambda p: 255 if p > 165 else 0).convert("L")
-
-            derived = [
-                ("autocontrast", autocontrast),
-                ("enlarged", enlarged),
-                ("threshold", threshold),
-                ("threshold_enlarged", threshold_enlarged),
-            ]
-            for label, image in derived:
-                candidates.append((label, self._image_to_png_bytes(image)))
-        except Exception as e:
-            print(f"    验证码图像预处理失败，回退到原图OCR: {e}")
-
-        return candidates
-
-    def _save_last_captcha_sample(self, reason):
-        """保存最近一次验证码图片，便于人工核对 OCR 是否失准。"""
-        if not self._last_captcha_bytes:
-            return None
-
-        os.makedirs(self._captcha_debug_dir, exist_ok=True)
-        safe_reason = re.sub(r"[^A-Za-z0-9_-]", "_", reason)[:40] or "unknown"
-        timestamp = time.strftime("%Y%m%d-%H%M%S")
-        output_path = os.path.join(self._captcha_debug_dir, f"{timestamp}_{safe_reason}.jpg")
-        with open(output_path, "wb") as f:
-            f.write(self._last_captcha_bytes)
-        return output_path
-
     def _get_captcha_and_ocr(self, max_ocr_retries=3):
         """
         获取验证码图片并进行OCR识别。
@@ -275,44 +533,78 @@ class Scraper:
             try:
                 print(f"    获取验证码图片 (OCR尝试 {ocr_attempt}/{max_ocr_retries})...")
                 captcha_url = f"{self.base_url}/yzm?d=1"
-                captcha_response = self._request("GET", captcha_url, timeout=10)
+                with _metrics.span("login_step", step="captcha_fetch"):
+                    captcha_response = self._request("GET", captcha_url, timeout=10)
                 captcha_response.raise_for_status()
                 self._last_captcha_bytes = captcha_response.content
                 self._last_captcha_note = None
+                self._last_captcha_variant = None
 
                 print("    正在进行OCR识别...")
-                candidates = self._build_ocr_candidates(captcha_response.content)
-                observed_results = []
-                for label, candidate_bytes in candidates:
-                    raw_result = self.ocr.classification(candidate_bytes)
-                    verify_code = self._normalize_ocr_text(raw_result)
-                    observed_results.append(f"{label}:{raw_result}->{verify_code}")
-                    if len(verify_code) == 4:
-                        print(f"    OCR 识别成功 ({label}): {verify_code}")
-                        return verify_code, True
-
-                print("    验证码识别失败，未得到4位字母数字结果。")
-                print(f"    OCR 候选结果: {' | '.join(observed_results)}")
-                saved_path = self._save_last_captcha_sample("ocr_failed")
-                if saved_path:
-                    self._last_captcha_note = saved_path
-                    print(f"    已保存失败验证码样本: {saved_path}")
+                with _metrics.span("login_step", step="ocr"):
+                    verify_code, label, observed_results = self._solve_captcha(captcha_response.content)
+                _metrics.increment("captcha_ocr", result="ok" if verify_code else "failed")
+                if verify_code:
+                    print(f"    OCR 识别成功 ({label}): {verify_code}")
+                    self._last_captcha_variant = label
+                    return verify_code, True
+
+                self._report_captcha_failure(observed_results)
                 if ocr_attempt < max_ocr_retries:
-                    print("    等待1秒后重试OCR...")
-                    time.sleep(1)
+                    self._wait_before_retry(ocr_attempt, "重试OCR", indent="    ")
             except requests.exceptions.RequestException as e:
                 print(f"    获取验证码时网络请求失败: {e}")
                 if ocr_attempt < max_ocr_retries:
-                    print("    等待2秒后重试获取验证码...")
-                    time.sleep(2)
+                    self._wait_before_retry(ocr_attempt, "重试获取验证码", indent="    ")
             except Exception as e:
                 print(f"    验证码处理过程中发生未预期错误: {e}")
                 if ocr_attempt < max_ocr_retries:
-                    print("    等待2秒后重试获取验证码...")
-                    time.sleep(2)
+                    self._wait_before_retry(ocr_attempt, "重试获取验证码", indent="    ")
         return None, False # OCR重试次数用完仍未成功
 
+    def is_session_valid(self):
+        """用一次轻量请求访问教务系统欢迎页，判断当前会话是否仍处于登录状态。"""
+        check_url = f"{self.base_url}/login!welcome.action"
+        try:
+            with _metrics.span("login_step", step="session_check"):
+                response = self._request("GET", check_url, timeout=10, allow_redirects=False)
+        except requests.exceptions.RequestException as e:
+            print(f"  会话有效性检查失败: {e}")
+            return False
+        if response.is_redirect or response.status_code != 200:
+            return False
+        text = response.text
+        return not any(marker in text for marker in SESSION_INVALID_MARKERS)
+
+    def _restore_cached_session(self, account):
+        if not self._session_cache:
+            return False
+        snapshot = self._session_cache.load(self.base_url, account)
+        if not snapshot:
+            return False
+        print("发现已缓存的登录会话，正在验证是否仍然有效...")
+        self.restore_session_state(snapshot)
+        if self.is_session_valid():
+            print("缓存会话有效，跳过登录流程。")
+            return True
+        print("缓存会话已失效，将重新登录。")
+        self._session_cache.invalidate(self.base_url, account)
+        self._cookie_jar().clear()
+        self._environment_checked = False
+        return False
+
     def login(self, account, password):
+        with _metrics.span("login"):
+            if self._restore_cached_session(account):
+                _metrics.increment("login_result", result="cached")
+                return True
+            success = self._login(account, password)
+        _metrics.increment("login_result", result="ok" if success else "failed")
+        if success and self._session_cache:
+            self._session_cache.save(self.base_url, account, self.export_session_state())
+        return success
+
+    def _login(self, account, password):
         print("正在尝试自动识别验证码登录...")
         self._probe_login_environment()
         if self._use_sso_login:
@@ -333,16 +625,12 @@ class Scraper:
                 if self._last_captcha_note:
                     print(f"  最近失败验证码样本已保存至: {self._last_captcha_note}")
                 if login_attempt < max_login_retries:
-                    print("  等待2秒后进行下次登录尝试...")
-                    time.sleep(2)
+                    self._wait_before_retry(login_attempt, "进行下次登录尝试")
                 continue # 重试整个登录过程（包括重新获取验证码）
 
             # 2. 准备登录数据
             try:
-                # 根据登录验证逻辑准备16字节的AES密钥 ↓↓↓ ---
-                encryption_key = (verify_code * 4)[:16]
-                password_encrypted = self.provider_config["encrypt_password_func"](password, encryption_key)
-                login_data = {'account': account, 'pwd': password_encrypted, 'verifycode': verify_code}
+                login_data = self._build_legacy_login_data(account, password, verify_code)
             except Exception as e:
                 print(f"  加密密码时出错: {e}")
                 return False # 加密错误通常是配置或代码问题，重试无意义
@@ -351,7 +639,8 @@ class Scraper:
             try:
                 print("  正在提交登录请求...")
                 login_url = f"{self.base_url}/new/login"
-                login_response = self._request("POST", login_url, data=login_data, timeout=10)
+                with _metrics.span("login_step", step="submit"):
+                    login_response = self._request("POST", login_url, data=login_data, timeout=10)
                 login_response.raise_for_status()
                 
                 try:
@@ -359,38 +648,13 @@ class Scraper:
                 except ValueError as e: # json.JSONDecodeError inherits from ValueError
                     print(f"  登录响应非JSON格式，可能存在系统问题。响应内容前100字符: {login_response.text[:100]}")
                     if login_attempt < max_login_retries:
-                        print("  等待3秒后进行下次登录尝试...")
-                        time.sleep(3)
+                        self._wait_before_retry(login_attempt, "进行下次登录尝试")
                     continue # 重试整个登录过程
 
-                code = response_json.get("code", -1)
-                message = response_json.get('message', '未知错误')
-                if code >= 0:
-                    print("登录成功！")
-                    return True
-                else:
-                    # 登录失败
-                    # 尝试提供更具体的错误信息
-                    if "验证码" in message or code == -3:
-                        print(f"  登录失败: 验证码错误。OCR 结果可能失准，或旧接口校验规则已调整。")
-                        saved_path = self._save_last_captcha_sample("captcha_rejected")
-                        if saved_path:
-                            self._last_captcha_note = saved_path
-                            print(f"  本次被拒绝的验证码样本已保存至: {saved_path}")
-                        # 验证码错误，应在下次尝试时重新获取
-                    elif "密码" in message or "用户" in message or code in [-1, -2]:
-                         print(f"  登录失败: 账号或密码错误。请检查配置。")
-                         # 账号密码错误，重试无意义，可以直接返回失败
-                         return False
-                    else:
-                        print(f"  登录失败: {message} (错误代码: {code})")
-                    
-                    if login_attempt < max_login_retries:
-                        wait_time = 2 if "验证码" in message or code == -3 else 3
-                        print(f"  等待{wait_time}秒后进行下次登录尝试...")
-                        time.sleep(wait_time)
-                    # 循环结束，进行下次登录尝试（包括重新获取验证码）
-                        
+                result = self._handle_legacy_login_result(response_json, verify_code)
+                if result is not None:
+                    return result
+
             except requests.exceptions.Timeout:
                 print("  登录请求超时。")
             except requests.exceptions.ConnectionError:
@@ -401,39 +665,37 @@ class Scraper:
                 print(f"  登录过程中发生未预期错误: {e}")
             
             if login_attempt < max_login_retries:
-                print("  等待3秒后进行下次登录尝试...")
-                time.sleep(3)
+                self._wait_before_retry(login_attempt, "进行下次登录尝试")
         
         print(f"登录连续失败 {max_login_retries} 次，登录终止。")
         return False
 
     def get_schedule_data(self, academic_year, week):
         print(f"正在获取第 {week} 周的课表...")
+        started = time.perf_counter()
         max_retries = 2
         for attempt in range(1, max_retries + 1):
             try:
                 main_page_url = f"{self.base_url}/login!welcome.action"
-                data_url = f"{self.base_url}/xsgrkbcx!getKbRq.action?xnxqdm={academic_year}&zc={week}"
-                headers = self.headers.copy()
-                headers['Referer'] = main_page_url
+                data_url = self._week_url(academic_year, week)
                 print(f"  获取课表数据 (尝试 {attempt}/{max_retries})...")
-                response = self._request("GET", data_url, headers=headers, timeout=10)
+                # 其余请求头来自会话，这里只补充 Referer，requests 会自动合并
+                response = self._request("GET", data_url, headers={'Referer': main_page_url}, timeout=10)
                 
                 if response.status_code != 200:
                     print(f"  获取课表数据失败，HTTP状态码: {response.status_code}")
                     if attempt < max_retries:
-                        print("  等待2秒后重试...")
-                        time.sleep(2)
+                        self._wait_before_retry(attempt, "重试")
                     continue # 重试
 
                 response.raise_for_status() # 检查其他HTTP错误
                 if response.text.lstrip().startswith("<!DOCTYPE") or "非法访问" in response.text:
                     print("  课表数据接口返回了非法访问页面，而不是周课表数据。")
                     if attempt < max_retries:
-                        print("  等待2秒后重试...")
-                        time.sleep(2)
+                        self._wait_before_retry(attempt, "重试")
                     continue
                 print(f"  第 {week} 周课表数据获取成功。")
+                self._record_week_fetch(week, started, attempt, len(response.content))
                 return response.text
             except requests.exceptions.Timeout:
                 print(f"  获取第 {week} 周数据时请求超时。")
@@ -445,8 +707,61 @@ class Scraper:
                 print(f"  获取第 {week} 周数据时发生未预期错误: {e}")
             
             if attempt < max_retries:
-                print("  等待3秒后重试...")
-                time.sleep(3)
+                self._wait_before_retry(attempt, "重试")
         
         print(f"获取第 {week} 周课表数据连续失败 {max_retries} 次。")
+        self._record_week_fetch(week, started, max_retries, None)
         return None
+
+    def get_multi_week_data(self, academic_year, weeks):
+        """
+        通过适配器声明的多周接口一次获取 weeks（升序）的课表，返回 {week: 单周格式的响应}；
+        失败时返回 None，由调用方逐周获取。
+        """
+        print(f"正在通过多周接口获取第 {weeks[0]}-{weeks[-1]} 周的课表...")
+        started = time.perf_counter()
+        main_page_url = f"{self.base_url}/login!welcome.action"
+        try:
+            response = self._request("GET", self._multi_week_url(academic_year, weeks),
+                                     headers={'Referer': main_page_url}, timeout=20)
+        except requests.exceptions.RequestException as e:
+            print(f"  多周课表接口请求失败: {e}")
+            _metrics.increment("fetch_multi_week_result", result="failed")
+            return None
+        return self._accept_multi_week_response(
+            weeks, started, response.status_code, response.text, len(response.content),
+        )
+
+    def get_schedule_data_for_weeks(self, academic_year, weeks, max_workers=1):
+        """
+        批量获取多个周次的课表数据。
+        适配器声明了多周接口时优先用它一次覆盖多周，只有未覆盖的周次才逐周请求；
+        逐周请求时 max_workers > 1 则使用线程池在同一个已登录会话上并发请求，
+        否则逐周串行获取。请求节奏统一由 rate_limiter 按主机控制。
+        返回按周次升序排列的 {week: response_text}，获取失败的周次值为 None。
+        """
+        weeks = sorted(set(weeks))
+        results = {}
+        for batch in self._multi_week_batches(weeks):
+            if not self.multi_week_available():
+                break
+            results.update(self.get_multi_week_data(academic_year, batch) or {})
+        remaining = [week for week in weeks if week not in results]
+        if results and remaining:
+            print(f"  多周接口未覆盖的 {len(remaining)} 周改为逐周获取。")
+
+        if max_workers <= 1 or len(remaining) <= 1:
+            for week in remaining:
+                results[week] = self.get_schedule_data(academic_year, week)
+            return {week: results[week] for week in weeks}
+
+        print(f"  并发获取 {len(remaining)} 周课表数据（最大并发数 {max_workers}）...")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {week: executor.submit(self.get_schedule_data, academic_year, week) for week in remaining}
+            for week in remaining:
+                try:
+                    results[week] = futures[week].result()
+                except Exception as e:
+                    print(f"  获取第 {week} 周数据时发生未预期错误: {e}")
+                    results[week] = None
+        return {week: results[week] for week in weeks}
@@ -0,0 +1,61 @@
+# core/session_cache.py
+import os
+import json
+import time
+import hashlib
+
+from core.utils import atomic_write
+
+
+class SessionCache:
+    """
+    在磁盘上缓存已登录的会话（Cookie、检测到的 SSO 模式、证书回退状态），
+    按 (站点, 账号) 区分。缓存文件名为哈希值，不直接暴露学号。
+    """
+
+    def __init__(self, cache_dir=".session_cache", max_age_hours=12):
+        self.cache_dir = cache_dir
+        self.max_age_seconds = float(max_age_hours) * 3600
+
+    @classmethod
+    def from_config(cls, options):
+        """根据 config.yml 的 session_cache 段构造缓存；未启用时返回 None。"""
+        options = options or {}
+        if not options.get("enabled", False):
+            return None
+        return cls(options.get("dir", ".session_cache"), options.get("max_age_hours", 12))
+
+    def _path(self, site, account):
+        key = hashlib.sha256(f"{site}|{account}".encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def load(self, site, account):
+        """读取未过期的会话快照，不存在、过期或损坏时返回 None。"""
+        path = self._path(site, account)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"[session] 读取会话缓存失败，将重新登录: {e}")
+            return None
+        if not isinstance(data, dict) or time.time() - data.get("saved_at", 0) > self.max_age_seconds:
+            return None
+        return data
+
+    def save(self, site, account, snapshot):
+        """原子地写入会话快照，并将文件权限限制为仅当前用户可读写。"""
+        path = self._path(site, account)
+        data = dict(snapshot, saved_at=time.time())
+        try:
+            atomic_write(path, json.dumps(data, ensure_ascii=False), mode=0o600)
+        except Exception as e:
+            print(f"[session] 写入会话缓存失败: {e}")
+
+    def invalidate(self, site, account):
+        path = self._path(site, account)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,138 @@
+# core/state_store.py
+import os
+import json
+import gzip
+import sqlite3
+from contextlib import closing
+
+from core.utils import atomic_write
+
+# 以这些后缀结尾的状态文件使用 SQLite 后端
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+
+class StateLoadError(Exception):
+    """状态文件存在但无法读取。此时不能当作空状态继续，否则会覆盖掉全部历史记录。"""
+
+
+class JsonStateStore:
+    """
+    JSON 状态文件后端。
+    - 写入时先写临时文件再重命名，进程中断不会留下半截文件；
+    - 读取失败时抛出 StateLoadError 并保持文件原样，而不是静默丢弃；空文件视为空状态；
+    - compact=True 时不缩进、不排序；路径以 .gz 结尾时 gzip 压缩。
+    """
+
+    def __init__(self, path, compact=False):
+        self.path = path
+        self.compact = compact
+        self.use_gzip = path.lower().endswith(".gz")
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            if self.use_gzip and raw:
+                raw = gzip.decompress(raw)
+            text = raw.decode("utf-8")
+            # 空文件视为没有历史状态（如 CI 中 git show 找不到文件时重定向留下的空文件）
+            if not text.strip():
+                return {}
+            data = json.loads(text)
+        except Exception as e:
+            raise StateLoadError(f"读取状态文件 {self.path} 失败: {e}") from e
+        if not isinstance(data, dict):
+            raise StateLoadError(f"状态文件 {self.path} 的内容不是对象")
+        return data
+
+    def get(self, key, default=None):
+        return self.load().get(key, default)
+
+    def save(self, state, previous=None):
+        if self.compact:
+            text = json.dumps(state, ensure_ascii=False, separators=(",", ":"))
+        else:
+            # 与旧版格式保持一致，便于在 git 中对比差异
+            text = json.dumps(state, ensure_ascii=False, indent=2, sort_keys=True)
+        data = text.encode("utf-8")
+        if self.use_gzip:
+            data = gzip.compress(data, mtime=0)
+        atomic_write(self.path, data)
+
+
+class SqliteStateStore:
+    """
+    SQLite 状态后端：每个 UID 一行，保存时只写入内容变化的 UID 并删除已消失的 UID，
+    在单个事务中完成，适合事件数量很多的状态。
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        return conn
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with closing(self._connect()) as conn:
+                rows = conn.execute("SELECT key, value FROM state").fetchall()
+            return {key: json.loads(value) for key, value in rows}
+        except (sqlite3.Error, ValueError) as e:
+            raise StateLoadError(f"读取状态数据库 {self.path} 失败: {e}") from e
+
+    def get(self, key, default=None):
+        if not os.path.exists(self.path):
+            return default
+        try:
+            with closing(self._connect()) as conn:
+                row = conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+            return json.loads(row[0]) if row else default
+        except (sqlite3.Error, ValueError) as e:
+            raise StateLoadError(f"读取状态数据库 {self.path} 失败: {e}") from e
+
+    def save(self, state, previous=None):
+        """previous 为本次运行开始时 load() 的结果；未提供时重新读取。"""
+        if previous is None:
+            previous = self.load()
+        changed = [
+            (key, json.dumps(value, ensure_ascii=False, separators=(",", ":"), sort_keys=True))
+            for key, value in state.items()
+            if previous.get(key) != value
+        ]
+        removed = [(key,) for key in previous if key not in state]
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", changed)
+                conn.executemany("DELETE FROM state WHERE key = ?", removed)
+
+
+def state_file_suffix(path):
+    """返回状态文件名的扩展名（如 .json / .json.gz / .db），用于为其他账号派生同类型的文件名。"""
+    name = os.path.basename(path)
+    if name.lower().endswith(".gz"):
+        return os.path.splitext(name[:-3])[1] + name[-3:]
+    return os.path.splitext(name)[1] or ".json"
+
+
+def open_state_store(state, compact=False):
+    """
+    根据路径选择状态后端：.db/.sqlite/.sqlite3 使用 SQLite，其余使用 JSON。
+    已经是后端对象时原样返回；路径为空时返回 None（不使用状态）。
+    """
+    if not state:
+        return None
+    if not isinstance(state, (str, os.PathLike)):
+        return state
+    path = os.fspath(state)
+    if path.lower().endswith(SQLITE_SUFFIXES):
+        return SqliteStateStore(path)
+    return JsonStateStore(path, compact=compact)
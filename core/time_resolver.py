@@ -0,0 +1,88 @@
+# core/time_resolver.py
+import threading
+from datetime import datetime
+
+import pytz
+
+DATE_FORMAT = '%Y-%m-%d'
+TIME_FORMAT = '%H:%M'
+
+_resolvers = {}
+_resolvers_lock = threading.Lock()
+
+
+class TimeResolver:
+    """
+    (日期, 节次编码) -> 带时区起止时间的解析表。
+    每个日期只解析一次，每个 (日期, 时刻) 只做一次 tz.localize，
+    同一学期内各周、各账号的相同组合直接查表。
+    """
+
+    def __init__(self, class_time_map, timezone):
+        self.class_time_map = dict(class_time_map)
+        self.tz = pytz.timezone(timezone)
+        self._dates = {}
+        self._times = {}
+        self._localized = {}
+
+    def _parse_date(self, date_str):
+        parsed = self._dates.get(date_str)
+        if parsed is None:
+            parsed = datetime.strptime(date_str, DATE_FORMAT).date()
+            self._dates[date_str] = parsed
+        return parsed
+
+    def _parse_time(self, time_str):
+        parsed = self._times.get(time_str)
+        if parsed is None:
+            parsed = datetime.strptime(time_str, TIME_FORMAT).time()
+            self._times[time_str] = parsed
+        return parsed
+
+    def _localize(self, date_str, time_str):
+        key = (date_str, time_str)
+        localized = self._localized.get(key)
+        if localized is None:
+            naive = datetime.combine(self._parse_date(date_str), self._parse_time(time_str))
+            localized = self.tz.localize(naive)
+            self._localized[key] = localized
+        return localized
+
+    def _start_time_str(self, period):
+        # 未知节次与旧逻辑一致地回退为 00:00
+        return self.class_time_map.get(period, ("00:00", ""))[0]
+
+    def _end_time_str(self, period):
+        return self.class_time_map.get(period, ("", "00:00"))[1]
+
+    def precompute(self, dates):
+        """为一批日期一次性生成所有节次的起止时间。无法解析的日期留到 resolve 时再报错。"""
+        for date_str in set(dates):
+            if not date_str:
+                continue
+            for period in self.class_time_map:
+                for time_str in (self._start_time_str(period), self._end_time_str(period)):
+                    try:
+                        self._localize(date_str, time_str)
+                    except ValueError:
+                        pass
+
+    def resolve(self, date_str, periods_str):
+        """
+        解析一条课程的起止时间：开始取首个节次的开始时间，结束取末个节次的结束时间。
+        日期或时刻格式错误时抛出 ValueError。
+        """
+        start = self._localize(date_str, self._start_time_str(periods_str[:2]))
+        end = self._localize(date_str, self._end_time_str(periods_str[-2:]))
+        return start, end
+
+
+def get_time_resolver(class_time_map, timezone):
+    """按 (时区, 节次时间表) 返回进程内共享的 TimeResolver。"""
+    key = (timezone, tuple(sorted(class_time_map.items())))
+    with _resolvers_lock:
+        resolver = _resolvers.get(key)
+        if resolver is None:
+            resolver = TimeResolver(class_time_map, timezone)
+            _resolvers[key] = resolver
+        return resolver
@@ -1,6 +1,8 @@
 # core/utils.py
+import os
+import tempfile
 from Crypto.Cipher import AES
-from datetime import datetime
+from datetime import date, datetime
 
 def gdut_encrypt_password(password, key):
     """广东工业大学特定的AES/ECB/PKCS7Padding加密密码。"""
@@ -39,3 +41,35 @@ def get_current_academic_semester():
         # 学年是当前年份减一。
         academic_year = current_year - 1
         return f"{academic_year}01"
+
+def atomic_write(path, data, mode=None):
+    """
+    先写入同目录下的临时文件再重命名覆盖目标文件，避免进程中断时留下半截文件。
+    data 可以是 str（按 UTF-8 写入）或 bytes；mode 为可选的文件权限，
+    未指定时沿用目标文件原有权限（新文件为 0644），而不是临时文件默认的 0600。
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        if mode is None:
+            mode = os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def compute_teaching_week(reference_week, reference_dates, today=None):
+    """
+    根据某一周课表响应中的日期映射，推算 today 所在的教学周。
+    reference_dates 为该周各天的 'YYYY-MM-DD' 字符串；结果可能小于 1（开学前）或大于总周数（期末后）。
+    """
+    week_start = min(date.fromisoformat(d) for d in reference_dates)
+    today = today or date.today()
+    return reference_week + (today - week_start).days // 7
@@ -0,0 +1,219 @@
+# core/week_range.py
+import json
+import os
+import time
+import hashlib
+import threading
+from datetime import date, timedelta
+
+from core.metrics import get_metrics
+from core.parser import inspect_week_payload
+from core.utils import atomic_write
+
+_metrics = get_metrics()
+
+
+class WeekRangeDetector:
+    """
+    识别学期实际有课的周次范围，不再请求学期末必定为空的周次（total_semester_weeks 只作为上限）。
+    - 按周次顺序分批获取：第 min_weeks 周及之后连续 empty_weeks_to_stop 周没有课程，
+      或某周没有课程且日期映射为空（超出教务系统的学期日历）时，停止获取后续周次；
+      同一批中更靠后的周次有课程时不停止，第 min_weeks 周之前总是继续获取；
+    - 识别出的最后一个有课周次按 (站点, 账号, 学期) 缓存在 cache_file 中，之后只获取到其后一周，
+      该周出现课程时继续向后探测；缓存超过 max_age_hours 后重新完整识别一次；
+    - 缓存同时记录第 1 周的周一日期，首个响应中的日期映射与之不符（学期日历变化）时缓存作废。
+    可在多个账号间共享（线程安全）。
+    """
+
+    def __init__(self, min_weeks=16, empty_weeks_to_stop=2, cache_file=".week_range_cache.json", max_age_hours=168):
+        self.min_weeks = max(1, int(min_weeks))
+        self.empty_weeks_to_stop = max(1, int(empty_weeks_to_stop))
+        self.cache_file = cache_file or None
+        self.max_age_seconds = float(max_age_hours) * 3600
+        self._lock = threading.Lock()
+        self._entries = None
+
+    @classmethod
+    def from_config(cls, options):
+        """根据 config.yml 的 week_range 段构造；未启用时返回 None。"""
+        options = options or {}
+        if not options.get("enabled", False):
+            return None
+        return cls(
+            options.get("min_weeks", 16),
+            options.get("empty_weeks_to_stop", 2),
+            options.get("cache_file", ".week_range_cache.json"),
+            options.get("max_age_hours", 168),
+        )
+
+    @staticmethod
+    def _key(site, account, xnxqdm):
+        # 与其他缓存一致，文件中不直接出现学号
+        return hashlib.sha256(f"{site}|{account}|{xnxqdm}".encode("utf-8")).hexdigest()[:32]
+
+    def _load_entries(self):
+        """在持有锁时调用：首次访问时读取缓存文件。"""
+        if self._entries is None:
+            self._entries = {}
+            if self.cache_file and os.path.exists(self.cache_file):
+                try:
+                    with open(self.cache_file, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                    if isinstance(data, dict):
+                        self._entries = data
+                except Exception as e:
+                    print(f"[week_range] 读取教学周范围缓存失败，将重新识别: {e}")
+        return self._entries
+
+    def cached_range(self, site, account, xnxqdm):
+        """返回未过期的缓存 {last_week, first_monday, saved_at}，不存在或过期时返回 None。"""
+        with self._lock:
+            entry = self._load_entries().get(self._key(site, account, xnxqdm))
+        if not isinstance(entry, dict) or time.time() - entry.get("saved_at", 0) > self.max_age_seconds:
+            return None
+        return entry
+
+    def save_range(self, site, account, xnxqdm, last_week, first_monday):
+        with self._lock:
+            entries = self._load_entries()
+            entries[self._key(site, account, xnxqdm)] = {
+                "last_week": last_week, "first_monday": first_monday, "saved_at": time.time(),
+            }
+            if not self.cache_file:
+                return
+            try:
+                atomic_write(self.cache_file, json.dumps(entries, sort_keys=True))
+            except OSError as e:
+                print(f"[week_range] 写入教学周范围缓存失败: {e}")
+
+    def scan(self, site, account, xnxqdm, weeks, known_responses=None):
+        """开始一次学期获取的周次扫描，known_responses 为无需请求的 {week: 响应}（如响应缓存）。"""
+        return WeekRangeScan(self, (site, account or "", xnxqdm), weeks, known_responses or {})
+
+
+class WeekRangeScan:
+    """
+    一次学期获取中的扫描状态，由 core.pipeline 驱动：
+
+        while batch := scan.next_batch(max_workers):
+            scan.record(scraper.get_schedule_data_for_weeks(xnxqdm, batch))
+        scan.finish()
+    """
+
+    def __init__(self, detector, cache_key, weeks, known_responses):
+        self.detector = detector
+        self.weeks = sorted(set(weeks))
+        self.skipped_weeks = []
+        self.stop_reason = None
+        self._cache_key = cache_key
+        self._known = known_responses
+        self._position = 0
+        self._empty_run = 0
+        self._last_course_week = None
+        self._first_monday = None
+        # 本批中满足停止条件的 (原因, 周次)，整批记录完毕且之后的周次都没有课程时才生效
+        self._pending_stop = None
+        self._stop_week = None
+        self._cached = detector.cached_range(*cache_key)
+        self._limit = None
+        if self._cached:
+            self._limit = max(int(self._cached["last_week"]) + 1, detector.min_weeks)
+
+    def _stop(self, reason, week):
+        self.stop_reason = reason
+        self._stop_week = week
+        # 响应缓存中已有的周次不需要请求，仍保留在结果中
+        self.skipped_weeks = [week for week in self.weeks[self._position:] if week not in self._known]
+
+    def _observe(self, week, response_text):
+        if self.stop_reason is not None:
+            return
+        course_count, dates = inspect_week_payload(response_text) if response_text is not None else (None, [])
+        if dates and self._first_monday is None:
+            first_monday = date.fromisoformat(dates[0]) - timedelta(weeks=week - 1)
+            self._first_monday = first_monday.isoformat()
+            if self._cached and self._cached.get("first_monday") != self._first_monday:
+                print("  学期日历与缓存的教学周范围不一致，重新识别。")
+                self._cached = None
+                self._limit = None
+        if course_count is None:
+            # 获取失败或无法解码时无法判断该周是否有课，保守地继续获取后续周次
+            self._empty_run = 0
+            return
+        if course_count > 0:
+            self._last_course_week = week
+            self._empty_run = 0
+            self._pending_stop = None
+            if self._limit is not None and week >= self._limit:
+                # 缓存范围之后出现了课程，继续向后探测
+                self._limit = None
+            return
+        self._empty_run += 1
+        if self._pending_stop is not None or week < self.detector.min_weeks:
+            return
+        if not dates:
+            self._pending_stop = ("no_dates", week)
+        elif self._empty_run >= self.detector.empty_weeks_to_stop:
+            self._pending_stop = ("empty_weeks", week)
+
+    def next_batch(self, size):
+        """
+        返回下一批需要请求的周次（升序），没有时返回空列表。
+        达到 min_weeks 后每批只包含判断是否停止所需的周数，避免多请求注定被跳过的周次。
+        """
+        batch = []
+        speculative = 0
+        while self.stop_reason is None and self._position < len(self.weeks) and len(batch) < max(1, size):
+            week = self.weeks[self._position]
+            if week in self._known:
+                if batch:
+                    # 先处理已发出的批次，保证按周次顺序判断
+                    break
+                # 连续的已知周次作为一批记录
+                known = {}
+                while self._position < len(self.weeks) and self.weeks[self._position] in self._known:
+                    known[self.weeks[self._position]] = self._known[self.weeks[self._position]]
+                    self._position += 1
+                self.record(known)
+                continue
+            if self._limit is not None and week > self._limit:
+                if not batch:
+                    self._stop("cached_range", week)
+                break
+            if week >= self.detector.min_weeks:
+                if speculative >= max(1, self.detector.empty_weeks_to_stop - self._empty_run):
+                    break
+                speculative += 1
+            batch.append(week)
+            self._position += 1
+        return batch
+
+    def record(self, responses):
+        """按周次顺序记录一批请求的结果 {week: 响应}，失败的周次值为 None。"""
+        for week in sorted(responses):
+            self._observe(week, responses[week])
+        if self._pending_stop is not None:
+            self._stop(*self._pending_stop)
+            self._pending_stop = None
+
+    def finish(self):
+        """结束扫描：输出跳过的周次，并在完整识别后缓存最后一个有课周次。返回跳过的周次列表。"""
+        if self.skipped_weeks:
+            reasons = {
+                "empty_weeks": f"第 {self._last_course_week or 0} 周之后连续 {self._empty_run} 周没有课程",
+                "no_dates": "已超出教务系统的学期日历",
+                "cached_range": f"缓存的最后教学周为第 {self._cached['last_week']} 周" if self._cached else "",
+            }
+            first, last = self.skipped_weeks[0], self.skipped_weeks[-1]
+            span = f"{first}" if first == last else f"{first}-{last}"
+            print(f"  {reasons[self.stop_reason]}，跳过第 {span} 周（共 {len(self.skipped_weeks)} 周）。")
+            _metrics.increment("week_range_stop", reason=self.stop_reason)
+            _metrics.increment("week_range_skipped_weeks", len(self.skipped_weeks))
+        # 依据缓存范围停止时不刷新缓存时间，使其过期后能重新完整识别一次；
+        # 未获取到第 min_weeks 周就停止的扫描不足以确定学期范围，不写入缓存
+        covered = self.stop_reason is None or (
+            self.stop_reason != "cached_range" and self._stop_week >= self.detector.min_weeks
+        )
+        if self._last_course_week is not None and covered:
+            self.detector.save_range(*self._cache_key, self._last_course_week, self._first_monday)
+        return self.skipped_weeks
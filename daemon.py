@@ -0,0 +1,300 @@
+# daemon.py
+import os
+import sys
+import time
+import signal
+import threading
+import yaml
+from dotenv import load_dotenv
+
+# 导入核心模块
+from core.scraper import Scraper
+from core.captcha import CaptchaSolver
+from core.http import build_http_adapter, HttpMetrics
+from core.metrics import get_metrics, write_metrics_report
+from core.ratelimit import RateLimiter
+from core.session_cache import SessionCache
+from core.response_cache import ResponseCache
+from core.week_range import WeekRangeDetector
+from core.state_store import open_state_store
+from core.ical_generator import create_calendar_file, is_calendar_up_to_date, write_empty_calendar, STATE_DEFAULT_FILENAME
+from core.ics_writer import EventBlockCache
+from core.ics_server import IcsServer
+from core.pipeline import (
+    load_provider, resolve_academic_semester, fetch_semester_responses, current_teaching_week,
+    parse_semester_responses, semester_fingerprint, exit_login_failed,
+)
+
+_metrics = get_metrics()
+
+
+class ScheduleDaemon:
+    """
+    常驻进程：登录会话与已获取的课表保存在内存中，按 config.yml 的 daemon 段定时刷新。
+    - 当前教学周及之后 near_weeks 周每 near_interval_minutes 分钟刷新一次；
+    - 全部周次每 full_interval_hours 小时完整刷新一次（不使用响应缓存），自动学期切换时也会完整刷新；
+    - 只有课表请求失败且会话确实失效时才重新登录；
+    - 响应有变化时才重新解析，课程事件集合有变化时才重新生成 ICS；
+    - 没有变化时与 run.py 一样把 delta_ics_file 清空为空日历，增量文件只包含最近一次刷新的变化；
+    - 启用 ics_server 时，生成的日历在写入完成后立即发布到内置的订阅服务。
+    """
+
+    def __init__(self, config, provider_config, account, password):
+        self.config = config
+        self.provider_config = provider_config
+        self.account = account
+        self.password = password
+        options = config.get("daemon") or {}
+        self.near_weeks = max(0, int(options.get("near_weeks", 2)))
+        self.near_interval = max(1.0, float(options.get("near_interval_minutes", 30)) * 60)
+        self.full_interval = max(self.near_interval, float(options.get("full_interval_hours", 24)) * 3600)
+        self.max_workers = max(1, int(config.get("fetch_concurrency", 1) or 1))
+        cache_config = config.get("response_cache") or {}
+        self.response_cache = ResponseCache.from_config(cache_config)
+        self.force_refresh = bool(cache_config.get("force_refresh")) or os.environ.get("FORCE_REFRESH") == "1"
+        self.week_range = WeekRangeDetector.from_config(config.get("week_range"))
+        self.http_metrics = HttpMetrics()
+        # 重新登录时新建 Scraper，但沿用同一个连接池、限速器与验证码识别器
+        self.http_adapter = build_http_adapter(config.get("http"), pool_size=self.max_workers, metrics=self.http_metrics)
+        self.scraper_options = {
+            "rate_limiter": RateLimiter.from_config(config.get("rate_limit"), provider_config),
+            "session_cache": SessionCache.from_config(config.get("session_cache")),
+            "captcha_solver": CaptchaSolver.from_config(config.get("captcha")),
+        }
+        self.scraper = None
+        self.academic_year_semester = None
+        self.responses = {}
+        self.events = []
+        self._fingerprint = None
+        self._event_ids = None
+        # 增量 ICS 是否已是空日历（本进程中清空后、下次生成前无需再次写入）
+        self._delta_cleared = False
+        self._stop_event = threading.Event()
+        self.ics_server = IcsServer.from_config(config.get("ics_server"))
+        # VEVENT 缓存在各次生成之间保留在内存中，配置了缓存文件时同时写入文件
+        block_cache_file = config.get("ics_block_cache_file") or None
+        self.block_cache = EventBlockCache(block_cache_file) if block_cache_file else None
+
+    def stop(self):
+        self._stop_event.set()
+
+    def login(self):
+        """新建会话并登录（优先复用会话缓存），返回是否成功。"""
+        self.scraper = Scraper(self.provider_config, http_adapter=self.http_adapter, **self.scraper_options)
+        return self.scraper.login(self.account, self.password)
+
+    def _fetch_with_session(self, fetch):
+        """
+        执行 fetch()（返回 {week: 响应}，失败周次为 None）。有周次失败且会话已失效时，
+        重新登录后再执行一次；会话仍然有效说明是网络或服务端问题，不重新登录。
+        """
+        responses = fetch()
+        if all(text is not None for text in responses.values()) or self.scraper.is_session_valid():
+            return responses
+        print("[daemon] 登录会话已失效，正在重新登录...")
+        _metrics.increment("daemon_relogin")
+        if not self.login():
+            print("[daemon] 重新登录失败，保留内存中的课表，下次刷新时重试。")
+            return responses
+        return fetch()
+
+    def _merge(self, fetched, replace=False):
+        """合并新获取的响应；失败的周次保留内存中的旧数据。replace=True 时去掉本次未出现的周次。"""
+        merged = {} if replace else dict(self.responses)
+        for week, text in fetched.items():
+            merged[week] = text if text is not None else self.responses.get(week)
+        self.responses = merged
+
+    def refresh_full(self, initial=False):
+        total_weeks = self.config["total_semester_weeks"]
+        print(f"[daemon] 完整刷新第 1-{total_weeks} 周课表...")
+        fetched = self._fetch_with_session(lambda: fetch_semester_responses(
+            self.scraper, self.academic_year_semester, range(1, total_weeks + 1), max_workers=self.max_workers,
+            response_cache=self.response_cache, account=self.account,
+            # 启动时允许使用响应缓存；之后的定时完整刷新正是为了更新较远的周次，因此强制重新获取
+            force_refresh=self.force_refresh or not initial, week_range=self.week_range,
+        )[0])
+        self._merge(fetched, replace=True)
+
+    def refresh_near(self):
+        current_week = current_teaching_week(self.responses)
+        if current_week is None:
+            print("[daemon] 无法推算当前教学周，改为完整刷新。")
+            return self.refresh_full()
+        weeks = [week for week in sorted(self.responses) if current_week <= week <= current_week + self.near_weeks]
+        if not weeks:
+            print(f"[daemon] 当前为第 {current_week} 周，不在学期周次范围内，跳过本次刷新。")
+            return
+        print(f"[daemon] 刷新第 {weeks[0]}-{weeks[-1]} 周课表（当前为第 {current_week} 周）...")
+        fetched = self._fetch_with_session(lambda: self.scraper.get_schedule_data_for_weeks(
+            self.academic_year_semester, weeks, max_workers=self.max_workers,
+        ))
+        if self.response_cache:
+            succeeded = {week: text for week, text in fetched.items() if text is not None}
+            if succeeded:
+                self.response_cache.put_many(self.scraper.base_url, self.account, self.academic_year_semester, succeeded)
+        self._merge(fetched)
+
+    def publish_calendar(self):
+        """把当前的 ICS 文件发布到内置订阅服务（未启用或文件不存在时跳过）。"""
+        output_filename = self.config["output_filename"]
+        if self.ics_server is None or not os.path.exists(output_filename):
+            return
+        self.ics_server.publish_file(
+            os.path.basename(output_filename), output_filename,
+            self.config.get("state_file") or STATE_DEFAULT_FILENAME,
+        )
+
+    def clear_delta(self):
+        """本次没有变化时清空增量 ICS（与 run.py 一致），避免下游重复处理上一次的变化。"""
+        delta_filename = self.config.get("delta_ics_file") or None
+        if delta_filename and not self._delta_cleared:
+            self._delta_cleared = write_empty_calendar(delta_filename, self.config["timezone"])
+
+    def regenerate_if_changed(self):
+        """响应有变化时重新解析，课程事件集合有变化时重新生成 ICS。返回是否写入了 ICS。"""
+        config = self.config
+        fingerprint = semester_fingerprint(
+            self.responses, self.provider_config["class_time_map"], config["timezone"],
+            recurrence=bool(config.get("ics_recurrence", False)),
+        )
+        if fingerprint == self._fingerprint:
+            print("[daemon] 课表数据没有变化。")
+            self.clear_delta()
+            return False
+
+        output_filename = config["output_filename"]
+        state_store = open_state_store(
+            config.get("state_file") or STATE_DEFAULT_FILENAME, compact=bool(config.get("state_compact", False))
+        )
+        # 启动时输入与上次生成时一致：沿用已有的 ICS，只把事件载入内存
+        up_to_date = self._event_ids is None and is_calendar_up_to_date(output_filename, state_store, fingerprint)
+        self.events, failed_weeks = parse_semester_responses(
+            self.responses, quiet=bool(config.get("quiet_parsing", False))
+        )
+        event_ids = frozenset(event.id for event in self.events)
+        if failed_weeks:
+            print(f"[daemon] 以下周次没有可用数据: {failed_weeks}")
+        if up_to_date or event_ids == self._event_ids:
+            print("[daemon] 课程事件没有变化，日历文件保持不变。")
+            self._fingerprint, self._event_ids = fingerprint, event_ids
+            self.clear_delta()
+            return False
+        if not self.events:
+            print("[daemon] 未能解析出任何课程事件，保留现有日历文件。")
+            self._fingerprint = fingerprint
+            return False
+
+        with _metrics.span("run_stage", stage="ics"):
+            create_calendar_file(
+                self.events,
+                self.provider_config["class_time_map"],
+                config["timezone"],
+                output_filename,
+                state_path=state_store,
+                input_fingerprint=fingerprint,
+                streaming=config.get("ics_writer") == "stream",
+                recurrence=bool(config.get("ics_recurrence", False)),
+                change_feed_path=config.get("change_feed_file") or None,
+                delta_filename=config.get("delta_ics_file") or None,
+                block_cache=self.block_cache,
+            )
+        # 生成失败时不记录指纹，下个周期会重试
+        self._fingerprint, self._event_ids = fingerprint, event_ids
+        self._delta_cleared = False
+        self.publish_calendar()
+        _metrics.increment("daemon_ics_written")
+        print(f"[daemon] 日历文件已更新: {os.path.abspath(output_filename)}")
+        return True
+
+    def run_cycle(self, full, initial=False):
+        """执行一次刷新；自动学期在两次刷新之间发生切换时改为完整刷新。"""
+        academic_year_semester, _ = resolve_academic_semester(self.config)
+        if academic_year_semester != self.academic_year_semester:
+            if self.academic_year_semester is not None:
+                print(f"[daemon] 学期已切换为 {academic_year_semester}。")
+            self.academic_year_semester = academic_year_semester
+            self.responses = {}
+            self._fingerprint = None
+            self._event_ids = None
+            full = True
+        kind = "full" if full else "near"
+        with _metrics.span("daemon_refresh", kind=kind):
+            if full:
+                self.refresh_full(initial=initial)
+            else:
+                self.refresh_near()
+            self.regenerate_if_changed()
+        write_metrics_report(self.config.get("metrics"), self.http_metrics)
+        return full
+
+    def run_forever(self):
+        if not self.login():
+            exit_login_failed()
+        if self.ics_server is not None:
+            self.ics_server.start()
+        self.run_cycle(full=True, initial=True)
+        # 日历未变化时不会重新生成，启动时发布已有的文件
+        self.publish_calendar()
+        next_full = time.monotonic() + self.full_interval
+        next_near = time.monotonic() + self.near_interval
+        print(f"[daemon] 进入常驻模式：每 {self.near_interval / 60:g} 分钟刷新近期周次，"
+              f"每 {self.full_interval / 3600:g} 小时完整刷新。按 Ctrl+C 退出。")
+        while not self._stop_event.wait(max(0.0, min(next_full, next_near) - time.monotonic())):
+            due_full = time.monotonic() >= next_full
+            try:
+                did_full = self.run_cycle(full=due_full)
+            except Exception as e:
+                # 单次刷新失败不退出，保留内存中的课表，下个周期重试
+                print(f"[daemon] 本次刷新失败: {e}")
+                did_full = False
+            now = time.monotonic()
+            if did_full:
+                next_full = now + self.full_interval
+            next_near = now + self.near_interval
+        if self.ics_server is not None:
+            self.ics_server.stop()
+        print("[daemon] 已退出。")
+
+
+def main():
+    # 加载.env文件中的环境变量（如果存在）
+    load_dotenv()
+
+    # 加载配置文件
+    try:
+        with open("config.yml", "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+    except FileNotFoundError:
+        print("错误：未找到 config.yml 配置文件。")
+        sys.exit(1)
+    except yaml.YAMLError as e:
+        print(f"错误：config.yml 配置文件格式有误: {e}")
+        sys.exit(1)
+
+    provider_name = config["provider"]
+    try:
+        provider_config = load_provider(provider_name)
+        print(f"已加载适配器: {provider_config['name']}")
+    except (ImportError, AttributeError) as e:
+        print(f"错误：无法加载名为 '{provider_name}' 的适配器。请检查 providers 目录和配置。详细信息: {e}")
+        sys.exit(1)
+
+    account = os.environ.get('ACCOUNT') or config.get('credentials', {}).get('account')
+    password = os.environ.get('PASSWORD') or config.get('credentials', {}).get('password')
+    if not account or not password or "YOUR_ACCOUNT_HERE" in account:
+        print("错误：未找到有效的账号或密码配置。")
+        print("请在环境变量中设置 ACCOUNT 和 PASSWORD，或在 config.yml 中填写 credentials。")
+        sys.exit(1)
+
+    daemon = ScheduleDaemon(config, provider_config, account, password)
+    # SIGTERM（如 systemd stop / docker stop）与 Ctrl+C 都在当前刷新结束后退出
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    try:
+        daemon.run_forever()
+    except KeyboardInterrupt:
+        print("\n[daemon] 收到中断信号，已退出。")
+
+
+if __name__ == '__main__':
+    main()
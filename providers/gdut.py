@@ -8,6 +8,22 @@ GDUT_PROVIDER = {
     "sso_service_url": "https://jxfw.gdut.edu.cn/new/ssoLogin",
     "allow_insecure_ssl_fallback": True,
     "encrypt_password_func": gdut_encrypt_password,
+    # 各主机默认的每秒请求数，可被 config.yml 的 rate_limit.hosts 覆盖
+    "rate_limits": {
+        "jxfw.gdut.edu.cn": 4,
+        "authserver.gdut.edu.cn": 2,
+    },
+    # 课表接口（路径相对 base_url）：
+    # - week: 单周接口，可用占位符 {xnxqdm}、{week}；
+    # - multi_week: 一次覆盖多周的接口，没有时设为 None。url 可用 {xnxqdm} 与 {weeks}（逗号分隔的周次），
+    #   不含 {weeks} 时视为整学期接口；max_weeks 为单次最多覆盖的周数（0 表示不限）；
+    #   dates_week 为响应中日期映射对应的周次（默认为请求的第一周）。
+    #   响应格式为 [课程列表, 日期映射]，每门课程的 zc 为所在周次。接口不可用时自动回退为逐周获取。
+    # 目前未确认 jxfw 提供整学期/多周课表接口，因此只逐周获取。
+    "schedule_endpoints": {
+        "week": "xsgrkbcx!getKbRq.action?xnxqdm={xnxqdm}&zc={week}",
+        "multi_week": None,
+    },
     "class_time_map": {
         "01": ("08:30", "09:15"), "02": ("09:20", "10:05"), "03": ("10:25", "11:10"),
         "04": ("11:15", "12:00"), "05": ("13:50", "14:35"), "06": ("14:40", "15:25"),
@@ -1,17 +1,63 @@
 # run.py
+import asyncio
 import os
 import sys
 import yaml
-import time
 import os.path
 from dotenv import load_dotenv
-from importlib import import_module
 
 # 导入核心模块
 from core.scraper import Scraper
-from core.parser import parse_schedule_data
-from core.ical_generator import create_calendar_file
-from core.utils import get_current_academic_semester
+from core.captcha import CaptchaSolver
+from core.http import build_http_adapter, HttpMetrics
+from core.metrics import get_metrics, write_metrics_report
+from core.ratelimit import RateLimiter
+from core.session_cache import SessionCache
+from core.response_cache import ResponseCache
+from core.week_range import WeekRangeDetector
+from core.state_store import open_state_store
+from core.ical_generator import create_calendar_file, is_calendar_up_to_date, write_empty_calendar, STATE_DEFAULT_FILENAME
+from core.pipeline import (
+    load_provider, resolve_academic_semester, fetch_semester_responses, fetch_semester_responses_async,
+    parse_semester_responses, semester_fingerprint, exit_login_failed,
+)
+
+
+def login_and_fetch(provider_config, config, account, password, scraper_options, fetch_options, http_metrics):
+    """使用同步 Scraper 登录并获取课表，返回 (登录是否成功, weekly_responses, cached_weeks)。"""
+    # 连接池大小与并发获取周课表的请求数匹配，并发请求不会因连接被丢弃而重新握手
+    http_adapter = build_http_adapter(config.get("http"), pool_size=fetch_options["max_workers"], metrics=http_metrics)
+    scraper = Scraper(provider_config, http_adapter=http_adapter, **scraper_options)
+    if not scraper.login(account, password):
+        return False, None, None
+    print(f"--- 开始获取 {len(fetch_options['weeks'])} 周的课表数据 ---")
+    with get_metrics().span("run_stage", stage="fetch"):
+        weekly_responses, cached_weeks = fetch_semester_responses(scraper, account=account, **fetch_options)
+    return True, weekly_responses, cached_weeks
+
+
+async def login_and_fetch_async(provider_config, config, account, password, scraper_options, fetch_options, http_metrics):
+    """login_and_fetch 的异步版本（config.yml 中 scraper: async，需要安装 httpx）。"""
+    from core.async_scraper import AsyncScraper, create_async_transport
+
+    transport = create_async_transport(
+        config.get("http"), pool_size=fetch_options["max_workers"], verify=provider_config.get("ssl_verify", True),
+    )
+    try:
+        async with AsyncScraper(
+            provider_config, transport=transport, metrics=http_metrics, http_options=config.get("http"), **scraper_options,
+        ) as scraper:
+            if not await scraper.login(account, password):
+                return False, None, None
+            print(f"--- 开始获取 {len(fetch_options['weeks'])} 周的课表数据 ---")
+            with get_metrics().span("run_stage", stage="fetch"):
+                weekly_responses, cached_weeks = await fetch_semester_responses_async(
+                    scraper, account=account, **fetch_options
+                )
+    finally:
+        await transport.aclose()
+    return True, weekly_responses, cached_weeks
+
 
 def main():
     # 加载.env文件中的环境变量（如果存在）
@@ -28,11 +74,20 @@ def main():
         print(f"错误：config.yml 配置文件格式有误: {e}")
         sys.exit(1)
 
+    # 无论流程在哪一步结束（包括登录失败退出），都输出本次运行的各阶段耗时与计数
+    http_metrics = HttpMetrics()
+    try:
+        export_calendar(config, http_metrics)
+    finally:
+        write_metrics_report(config.get("metrics"), http_metrics)
+
+
+def export_calendar(config, http_metrics):
+    metrics = get_metrics()
     # --- 1. 加载学校适配器 ---
     provider_name = config["provider"]
     try:
-        provider_module = import_module(f"providers.{provider_name}")
-        provider_config = getattr(provider_module, f"{provider_name.upper()}_PROVIDER")
+        provider_config = load_provider(provider_name)
         print(f"已加载适配器: {provider_config['name']}")
     except (ImportError, AttributeError) as e:
         print(f"错误：无法加载名为 '{provider_name}' 的适配器。请检查 providers 目录和配置。详细信息: {e}")
@@ -51,46 +106,70 @@ def main():
         sys.exit(1)
 
     # --- 3. 执行核心流程 ---
-    scraper = Scraper(provider_config)
-
-    if not scraper.login(account, password):
-        print("[错误] 登录失败，流程终止。")
-        print("请检查以下几点：")
-        print("1. 账号和密码是否正确。")
-        print("2. 验证码是否能被正确识别（如果一直失败，可能是教务系统变更）。")
-        print("3. 网络连接是否正常。")
-        sys.exit(1)
+    rate_limiter = RateLimiter.from_config(config.get("rate_limit"), provider_config)
+    session_cache = SessionCache.from_config(config.get("session_cache"))
+    captcha_solver = CaptchaSolver.from_config(config.get("captcha"))
+    max_workers = max(1, int(config.get("fetch_concurrency", 1) or 1))
 
     # --- 判断学期设置为手动或者自动 ---
-    academic_year_semester = config.get("academic_year_semester")
+    academic_year_semester, is_auto = resolve_academic_semester(config)
     # 如果配置为空或设置为'auto'，则根据日期自动计算当前学期
-    if not academic_year_semester or str(academic_year_semester).lower() == 'auto':
-        academic_year_semester = get_current_academic_semester()
+    if is_auto:
         print(f"检测到学期设置为自动，已计算当前学期为: {academic_year_semester}")
 
-    all_semester_events = {}
-    failed_weeks = []
     total_weeks = config["total_semester_weeks"]
-    print(f"--- 开始获取 {total_weeks} 周的课表数据 ---")
-    for week in range(1, total_weeks + 1):
-        response_text = scraper.get_schedule_data(academic_year_semester, week)
-        if response_text is not None: # 空字符串也是有效响应
-            print(f"  解析第 {week} 周数据...")
-            weekly_events = parse_schedule_data(response_text)
-            if not weekly_events:
-                 print(f"  警告：第 {week} 周数据解析后未生成任何事件。")
-            for event in weekly_events:
-                # 使用课程的唯一ID去重
-                all_semester_events[event['id']] = event
-        else:
-            print(f"  第 {week} 周数据获取失败。")
-            failed_weeks.append(week)
-        # 避免请求过于频繁
-        if week < total_weeks: # 最后一周后不需要sleep
-            time.sleep(0.5)
+    cache_config = config.get("response_cache") or {}
+    scraper_options = {
+        "rate_limiter": rate_limiter, "session_cache": session_cache, "captcha_solver": captcha_solver,
+    }
+    fetch_options = {
+        "academic_year_semester": academic_year_semester,
+        "weeks": range(1, total_weeks + 1),
+        "max_workers": max_workers,
+        "response_cache": ResponseCache.from_config(cache_config),
+        "force_refresh": bool(cache_config.get("force_refresh")) or os.environ.get("FORCE_REFRESH") == "1",
+        "week_range": WeekRangeDetector.from_config(config.get("week_range")),
+    }
+    scraper_mode = str(config.get("scraper") or "sync").lower()
+    if scraper_mode == "async":
+        print("使用异步抓取模式（httpx）。")
+        logged_in, weekly_responses, cached_weeks = asyncio.run(login_and_fetch_async(
+            provider_config, config, account, password, scraper_options, fetch_options, http_metrics,
+        ))
+    else:
+        logged_in, weekly_responses, cached_weeks = login_and_fetch(
+            provider_config, config, account, password, scraper_options, fetch_options, http_metrics,
+        )
+    if not logged_in:
+        exit_login_failed()
+    if cached_weeks:
+        print(f"以下周次使用了缓存数据（未重新请求）: {cached_weeks}")
+    http_metrics.print_summary()
+
+    # 输入与上次生成时完全一致时，跳过解析与日历生成，保持输出文件不变
+    output_filename = config["output_filename"]
+    state_store = open_state_store(
+        config.get("state_file") or STATE_DEFAULT_FILENAME, compact=bool(config.get("state_compact", False))
+    )
+    fingerprint = semester_fingerprint(
+        weekly_responses, provider_config["class_time_map"], config["timezone"],
+        recurrence=bool(config.get("ics_recurrence", False)),
+    )
+    delta_filename = config.get("delta_ics_file") or None
+    if is_calendar_up_to_date(output_filename, state_store, fingerprint):
+        print("--- 课表数据与上次生成时完全一致，跳过解析与日历生成 ---")
+        if delta_filename:
+            # 本次没有任何变化，清空增量文件，避免下游重复处理上一次的变化
+            write_empty_calendar(delta_filename, config["timezone"])
+        print(f"日历文件保持不变: {os.path.abspath(output_filename)}")
+        return
+
+    with metrics.span("run_stage", stage="parse"):
+        final_event_list, failed_weeks = parse_semester_responses(
+            weekly_responses, quiet=bool(config.get("quiet_parsing", False))
+        )
 
     # --- 4. 生成日历文件 ---
-    final_event_list = list(all_semester_events.values())
     print(f"--- 数据获取与解析完成 ---")
     print(f"成功获取并解析了 {len(final_event_list)} 个不重复的课程事件。")
     if failed_weeks:
@@ -99,14 +178,21 @@ def main():
             print("警告：超过一半的周次数据获取失败，生成的日历文件可能不完整。")
 
     if final_event_list:
-        output_filename = config["output_filename"]
         try:
-            create_calendar_file(
-                final_event_list,
-                provider_config["class_time_map"],
-                config["timezone"],
-                output_filename
-            )
+            with metrics.span("run_stage", stage="ics"):
+                create_calendar_file(
+                    final_event_list,
+                    provider_config["class_time_map"],
+                    config["timezone"],
+                    output_filename,
+                    state_path=state_store,
+                    input_fingerprint=fingerprint,
+                    streaming=config.get("ics_writer") == "stream",
+                    recurrence=bool(config.get("ics_recurrence", False)),
+                    change_feed_path=config.get("change_feed_file") or None,
+                    delta_filename=delta_filename,
+                    block_cache=config.get("ics_block_cache_file") or None,
+                )
             # 提供文件的绝对路径，方便用户查找
             file_path = os.path.abspath(output_filename)
             print(f"日历文件已保存至: {file_path}")
@@ -0,0 +1,56 @@
+# serve_ics.py
+import os
+import sys
+import signal
+import threading
+import yaml
+
+from core.ical_generator import STATE_DEFAULT_FILENAME
+from core.ics_server import IcsServer
+from core.state_store import state_file_suffix
+
+
+def main():
+    # 加载配置文件
+    try:
+        with open("config.yml", "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+    except FileNotFoundError:
+        print("错误：未找到 config.yml 配置文件。")
+        sys.exit(1)
+    except yaml.YAMLError as e:
+        print(f"错误：config.yml 配置文件格式有误: {e}")
+        sys.exit(1)
+
+    # 默认发布批量导出的输出目录，也可以在命令行指定
+    directory = sys.argv[1] if len(sys.argv) > 1 else (config.get("batch") or {}).get("output_dir", "batch_output")
+    if not os.path.isdir(directory):
+        print(f"错误：目录 {os.path.abspath(directory)} 不存在。")
+        sys.exit(1)
+
+    # 显式运行本脚本即表示需要订阅服务，不检查 ics_server.enabled
+    options = dict(config.get("ics_server") or {}, enabled=True)
+    try:
+        server = IcsServer.from_config(options)
+    except OSError as e:
+        print(f"错误：无法监听 {options.get('host', '127.0.0.1')}:{options.get('port', 8080)}: {e}")
+        sys.exit(1)
+    server.start()
+    server.watch_directory(
+        directory,
+        state_suffix=state_file_suffix(config.get("state_file") or STATE_DEFAULT_FILENAME),
+        interval=float(options.get("scan_interval_seconds", 10)),
+    )
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    try:
+        stopped.wait()
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+    print("[ics_server] 已退出。")
+
+
+if __name__ == '__main__':
+    main()
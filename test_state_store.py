@@ -0,0 +1,36 @@
+import pytest
+
+from core.state_store import JsonStateStore, StateLoadError
+
+
+@pytest.mark.parametrize("content", [b"", b"  \n", b"\r\n"])
+def test_empty_state_file_loads_as_empty_state(tmp_path, content):
+    path = tmp_path / "ical_state.json"
+    path.write_bytes(content)
+
+    assert JsonStateStore(str(path)).load() == {}
+
+
+def test_empty_gzip_state_file_loads_as_empty_state(tmp_path):
+    path = tmp_path / "ical_state.json.gz"
+    path.write_bytes(b"")
+
+    assert JsonStateStore(str(path)).load() == {}
+
+
+@pytest.mark.parametrize("content", [b'{"uid@gdut": {"sequence": 1', b"[1, 2]", b"\xff\xfe"])
+def test_corrupt_state_file_raises_and_is_left_unchanged(tmp_path, content):
+    path = tmp_path / "ical_state.json"
+    path.write_bytes(content)
+
+    with pytest.raises(StateLoadError):
+        JsonStateStore(str(path)).load()
+    assert path.read_bytes() == content
+
+
+def test_state_round_trip(tmp_path):
+    store = JsonStateStore(str(tmp_path / "ical_state.json"))
+    state = {"uid@gdut": {"sequence": 2, "summary": "高等数学"}}
+    store.save(state)
+
+    assert store.load() == state
@@ -0,0 +1,77 @@
+import json
+from datetime import date, timedelta
+
+from core.week_range import WeekRangeDetector
+
+FIRST_MONDAY = date(2025, 9, 1)
+
+
+def _payload(week, courses, with_dates=True):
+    monday = FIRST_MONDAY + timedelta(weeks=week - 1)
+    dates = [{"xqmc": str(i + 1), "rq": (monday + timedelta(days=i)).isoformat()} for i in range(7)] if with_dates else []
+    return json.dumps([[{"kcmc": f"课程{i}", "zc": str(week)} for i in range(courses)], dates])
+
+
+def _drive(scan, responses, batch_size=4):
+    """按 core.pipeline 的方式驱动扫描，返回实际请求过的周次。"""
+    fetched = []
+    while batch := scan.next_batch(batch_size):
+        fetched.extend(batch)
+        scan.record({week: responses[week] for week in batch})
+    scan.finish()
+    return fetched
+
+
+def test_empty_payload_before_min_weeks_does_not_stop_scan():
+    # 第 3 周返回 [[],[]]（无课程也无日期映射），第 4 周起仍有课程
+    responses = {week: _payload(week, 3 if week <= 18 else 0) for week in range(1, 21)}
+    responses[3] = "[[],[]]"
+    detector = WeekRangeDetector(min_weeks=16, empty_weeks_to_stop=2, cache_file=None)
+    scan = detector.scan("https://jxfw.example", "31000001", "202501", range(1, 21))
+
+    fetched = _drive(scan, responses)
+
+    assert fetched == list(range(1, 21))
+    assert scan.skipped_weeks == []
+    assert detector.cached_range("https://jxfw.example", "31000001", "202501")["last_week"] == 18
+
+
+def test_later_course_week_in_same_batch_cancels_stop():
+    # 第 17 周超出日历，但同一批中的第 18 周有课程，不能因此跳过后续周次
+    responses = {week: _payload(week, 2) for week in range(1, 21)}
+    responses[17] = "[[],[]]"
+    detector = WeekRangeDetector(min_weeks=16, empty_weeks_to_stop=3, cache_file=None)
+    scan = detector.scan("https://jxfw.example", "31000001", "202501", range(1, 21))
+
+    assert scan.next_batch(20) == list(range(1, 19))
+    scan.record({week: responses[week] for week in range(1, 19)})
+
+    assert scan.stop_reason is None
+    assert _drive(scan, responses) == [19, 20]
+    assert scan.skipped_weeks == []
+
+
+def test_trailing_empty_weeks_are_skipped_and_cached():
+    responses = {week: _payload(week, 2 if week <= 16 else 0) for week in range(1, 21)}
+    detector = WeekRangeDetector(min_weeks=16, empty_weeks_to_stop=2, cache_file=None)
+    scan = detector.scan("https://jxfw.example", "31000001", "202501", range(1, 21))
+
+    fetched = _drive(scan, responses)
+
+    assert fetched == list(range(1, 19))
+    assert scan.stop_reason == "empty_weeks"
+    assert scan.skipped_weeks == [19, 20]
+    assert detector.cached_range("https://jxfw.example", "31000001", "202501")["last_week"] == 16
+
+
+def test_empty_payload_after_min_weeks_stops_scan():
+    responses = {week: _payload(week, 2) for week in range(1, 17)}
+    responses.update({week: "[[],[]]" for week in range(17, 21)})
+    detector = WeekRangeDetector(min_weeks=16, empty_weeks_to_stop=2, cache_file=None)
+    scan = detector.scan("https://jxfw.example", "31000001", "202501", range(1, 21))
+
+    fetched = _drive(scan, responses)
+
+    assert fetched == list(range(1, 19))
+    assert scan.stop_reason == "no_dates"
+    assert scan.skipped_weeks == [19, 20]